@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -32,14 +33,71 @@ ALLOWED_HOSTS = [
     'localhost'
 ]
 
-# Azure AI Configuration
-AZURE_AI_ENDPOINT = "https://hr-bot-hackathon-group4-resource.services.ai.azure.com/api/projects/hr-bot-hackathon-group4"
-AZURE_AI_AGENT_ID = "asst_La9CRXiwP6eeKtSrficBdoFv"
-AZURE_AI_THREAD_ID = "thread_FufuJu2292OEZPmj7ipUv7wG"
+# Azure AI Configuration. A plain http endpoint is the local stand-in server
+# (python manage.py run_agents_stub), used without Azure credentials
+AZURE_AI_ENDPOINT = os.environ.get(
+    'AZURE_AI_ENDPOINT',
+    "https://hr-bot-hackathon-group4-resource.services.ai.azure.com/api/projects/hr-bot-hackathon-group4"
+)
+AZURE_AI_AGENT_ID = os.environ.get('AZURE_AI_AGENT_ID', "asst_La9CRXiwP6eeKtSrficBdoFv")
+AZURE_AI_THREAD_ID = os.environ.get('AZURE_AI_THREAD_ID', "thread_FufuJu2292OEZPmj7ipUv7wG")
+# Seconds between two status checks of an agent run
+AZURE_AI_POLLING_INTERVAL = float(os.environ.get('AZURE_AI_POLLING_INTERVAL', '1'))
+
+# Warm each WSGI worker up at boot (token, agent, org chart); /readyz answers 503 until done
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', 'False') == 'True'
+
+# Set to False to answer with the local fallback assistant only (offline dev, benchmarks)
+AZURE_AI_ENABLED = os.environ.get('AZURE_AI_ENABLED', 'True') == 'True'
+
+# Purge deleted chats in a background thread right after deletion; when False,
+# run the purge_deleted_chats command periodically instead
+CHAT_PURGE_IN_BACKGROUND = os.environ.get('CHAT_PURGE_IN_BACKGROUND', 'True') == 'True'
+
+# /metrics: readable by HR admins, or by a scraper sending "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Directory shared by the worker processes to add up their metrics, unset for a single process
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
+# Spans of the AI pipeline (users/tracing.py), off unless TRACING_ENABLED=True: JSON lines in
+# TRACING_LOG_FILE (standard output if empty), and OTLP/JSON in TRACING_OTLP_FILE if set
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'False') == 'True'
+TRACING_LOG_FILE = os.environ.get('TRACING_LOG_FILE', '')
+TRACING_OTLP_FILE = os.environ.get('TRACING_OTLP_FILE', '')
+
+# N+1 and slow query detection (users/querycheck.py): logged per request and checked against the
+# views' @query_budget; a budget overrun raises instead of being logged when QUERY_BUDGET_RAISE
+# (set by the test runner)
+QUERY_INSPECTOR_ENABLED = os.environ.get('QUERY_INSPECTOR_ENABLED', str(DEBUG)) == 'True'
+QUERY_BUDGET_RAISE = os.environ.get('QUERY_BUDGET_RAISE', 'False') == 'True'
+# Executions of one statement shape per request above which it is reported as N+1
+QUERY_MAX_REPEATS = int(os.environ.get('QUERY_MAX_REPEATS', '3'))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+
+# On-demand request profiling (users/profiling.py), off unless PROFILING_ENABLED=True: staff send
+# "X-Profile: deterministic|sample" or ?profile=, and PROFILING_SAMPLE_PERCENT of all requests are
+# profiled at random. Profiles are kept in PROFILING_DIR (a temporary directory if empty) and listed
+# at /admin/profiles/
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_MODE = os.environ.get('PROFILING_MODE', 'sample')
+PROFILING_SAMPLE_PERCENT = float(os.environ.get('PROFILING_SAMPLE_PERCENT', '0'))
+PROFILING_SAMPLE_INTERVAL = float(os.environ.get('PROFILING_SAMPLE_INTERVAL', '0.001'))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '')
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', '200'))
+
+# Token usage of the agent runs (users/usage.py), written by a background thread unless False
+USAGE_WRITE_IN_BACKGROUND = os.environ.get('USAGE_WRITE_IN_BACKGROUND', 'True') == 'True'
+# Model -> (price per million prompt tokens, per million completion tokens), in USD
+AI_TOKEN_PRICES = {
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4.1': (2.00, 8.00),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'default': (2.50, 10.00),
+}
 
 # Azure Authentication
-import os
-
 # Set Azure credentials from environment variables or defaults
 AZURE_CLIENT_ID = os.environ.get('AZURE_CLIENT_ID', '22b5f247-51cc-4b71-8c08-9a7deac47c5a')
 AZURE_TENANT_ID = os.environ.get('AZURE_TENANT_ID', '413600cf-bd4e-4c7c-8a61-69e73cddf731')
@@ -74,11 +132,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'users.middleware.MetricsMiddleware',
+    'users.querycheck.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     # 'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -107,13 +168,59 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# DB_ENGINE=sqlite (default) or postgresql. Persistent connections are
+# health-checked before reuse; PostgreSQL uses psycopg's connection pool
+# instead (psycopg[binary,pool] in requirements.txt).
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+# Applied to every new SQLite connection: WAL lets readers run alongside the
+# writer, busy_timeout makes writers wait for the lock instead of failing
+# with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,  # ms
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
 }
 
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'hrbot'),
+            'USER': os.environ.get('DB_USER', 'hrbot'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Connections are reused through the pool, not CONN_MAX_AGE
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+                },
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+                # Take the write lock when the transaction starts, so it waits on
+                # busy_timeout instead of failing when upgrading a read transaction
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            },
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -161,3 +268,25 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Fails the tests calling a view over its @query_budget (users/querycheck.py)
+TEST_RUNNER = 'users.runner.QueryBudgetTestRunner'
+
+# Logging: span records are written as bare JSON lines
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json_lines': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'traces': {
+            'class': 'logging.FileHandler' if TRACING_LOG_FILE else 'logging.StreamHandler',
+            'formatter': 'json_lines',
+            **({'filename': TRACING_LOG_FILE} if TRACING_LOG_FILE else {'stream': 'ext://sys.stdout'}),
+        },
+    },
+    'loggers': {
+        'users.tracing': {'handlers': ['traces'], 'level': 'INFO', 'propagate': False},
+    },
+}
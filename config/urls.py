@@ -16,8 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from users.admin import profile_detail_view, profile_list_view
 
 urlpatterns = [
+    path('admin/profiles/', admin.site.admin_view(profile_list_view), name='admin_profiles'),
+    path('admin/profiles/<str:profile_id>/', admin.site.admin_view(profile_detail_view), name='admin_profile'),
     path('admin/', admin.site.urls),
     path('', include('users.urls')),
 ]
@@ -1,6 +1,15 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Chat, Message
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from .models import AIUsage, CustomUser, Chat, Message, MessageArchive
+from .profiling import list_profiles, load_profile
+from .purge import schedule_purge
+from .search import admin_message_ids_sql, fts_available
+from .usage import aggregate_usage, prompt_section_tokens
 
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
@@ -40,22 +49,116 @@ class MessageInline(admin.TabularInline):
 
 
 class ChatAdmin(admin.ModelAdmin):
-    list_display = ['title', 'user', 'created_at', 'updated_at']
-    list_filter = ['created_at', 'updated_at']
+    list_display = ['title', 'user', 'created_at', 'updated_at', 'deleted_at']
+    list_filter = ['created_at', 'updated_at', 'deleted_at']
     search_fields = ['title', 'user__username']
     inlines = [MessageInline]
 
+    # Deleting only hides the chats, as the API does: their messages are
+    # removed in batches by the background purge, not cascaded here
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Chat.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        if queryset.filter(deleted_at=None).update(deleted_at=timezone.now()):
+            transaction.on_commit(schedule_purge)
+
+    def get_deleted_objects(self, objs, request):
+        # The confirmation page would otherwise collect every message of the chats
+        chats = [str(obj) for obj in objs]
+        return chats, {Chat._meta.verbose_name_plural: len(chats)}, set(), []
+
 
 class MessageAdmin(admin.ModelAdmin):
     list_display = ['chat', 'sender', 'content_preview', 'created_at']
     list_filter = ['sender', 'created_at']
     search_fields = ['content', 'chat__title']
+
+    def get_search_results(self, request, queryset, search_term):
+        # The FTS5 index replaces LIKE '%…%' over every message
+        if not search_term or not fts_available(connection):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(id__in=RawSQL(*admin_message_ids_sql(search_term))), False
     
     def content_preview(self, obj):
         return obj.content[:50] + ('...' if len(obj.content) > 50 else '')
     content_preview.short_description = 'Content'
 
 
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ['chat', 'message_count', 'first_created_at', 'last_created_at', 'archived_at']
+    list_filter = ['archived_at']
+    # The compressed batch is not editable, only its metadata is shown
+    exclude = ['data']
+    readonly_fields = ['chat', 'message_count', 'first_created_at', 'last_created_at', 'archived_at']
+
+
+class AIUsageAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'user', 'chat', 'model', 'intent', 'prompt_tokens', 'completion_tokens', 'duration_ms']
+    list_filter = ['created_at', 'model', 'intent', 'run_status', 'user__departement']
+    search_fields = ['user__username', 'user__employee_id']
+    date_hierarchy = 'created_at'
+    list_select_related = ['user', 'chat']
+    # Usage rows are written by the application only
+    readonly_fields = [field.name for field in AIUsage._meta.fields]
+
+    # Top groups shown above the list, for the rows matching the current filters
+    SUMMARY_GROUPS = [('Department', 'department'), ('Intent', 'intent'), ('User', 'user')]
+    SUMMARY_SIZE = 10
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        context = getattr(response, 'context_data', None)
+        # Redirects and errors have no changelist
+        if context and 'cl' in context:
+            queryset = context['cl'].queryset
+            response.context_data['usage_summary'] = [
+                (title, aggregate_usage(queryset, by)[:self.SUMMARY_SIZE]) for title, by in self.SUMMARY_GROUPS
+            ]
+            response.context_data['usage_sections'] = list(prompt_section_tokens(queryset).items())
+        return response
+
+    def has_add_permission(self, request):
+        return False
+
+
+# Stored request profiles (users/profiling.py), routed in config/urls.py
+PROFILE_SORTS = {'cumulative': 'cumulative_s', 'self': 'self_s', 'calls': 'calls'}
+PROFILE_TOP_FUNCTIONS = 50
+
+
+def profile_list_view(request):
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profiles': list_profiles(),
+    }
+    return TemplateResponse(request, 'admin/users/profiles/list.html', context)
+
+
+def profile_detail_view(request, profile_id):
+    profile = load_profile(profile_id)
+    if profile is None:
+        raise Http404("Profile not found, it may have been rotated out")
+    sort = request.GET.get('sort') if request.GET.get('sort') in PROFILE_SORTS else 'cumulative'
+    key = PROFILE_SORTS[sort]
+    functions = sorted(profile.pop('functions'), key=lambda row: -(row[key] or 0))[:PROFILE_TOP_FUNCTIONS]
+    for row in functions:
+        row['self_ms'] = row['self_s'] * 1000
+        row['cumulative_ms'] = row['cumulative_s'] * 1000
+    context = {
+        **admin.site.each_context(request),
+        'title': f"Profile {profile_id}",
+        'profile': profile,
+        'functions': functions,
+        'sort': sort,
+        'sorts': list(PROFILE_SORTS),
+    }
+    return TemplateResponse(request, 'admin/users/profiles/detail.html', context)
+
+
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Chat, ChatAdmin)
 admin.site.register(Message, MessageAdmin)
+admin.site.register(MessageArchive, MessageArchiveAdmin)
+admin.site.register(AIUsage, AIUsageAdmin)
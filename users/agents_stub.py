@@ -0,0 +1,405 @@
+"""
+Local stand-in for the Azure AI Agents REST API, for offline end-to-end
+tests and benchmarks of get_ai_response (management command run_agents_stub).
+
+It implements the subset the azure-ai-agents SDK uses here: agents
+(assistants), threads, messages, and runs with their status transitions
+(queued -> in_progress -> [requires_action ->] completed / failed /
+cancelled), tool outputs submission and SSE streaming. State is kept in
+memory. Any agent or thread ID is accepted, so the IDs of the settings
+work unchanged.
+
+Point AZURE_AI_ENDPOINT at it (plain http, e.g.
+http://127.0.0.1:8765/api/projects/local): get_ai_response then
+authenticates with LocalCredential instead of Managed Identity.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Messages kept per thread: every request of the app shares one thread
+THREAD_MAX_MESSAGES = 1000
+# Model reported by the runs, priced by AI_TOKEN_PRICES
+STUB_MODEL = 'gpt-4o'
+# Marker of the user question in the prompts built by create_enhanced_message
+QUESTION_MARKER = "Question de l'utilisateur:"
+
+CANNED_ANSWERS = [
+    "Bonjour ! Il vous reste 12 jours de congés payés cette année.",
+    "Voici les membres de l'équipe :\n\nCamille\nMartin\nChargé de Recrutement - camille.martin@company.com\n\n"
+    "Julien\nDurand\nData Marketing Analyst - julien.durand@company.com",
+    "Votre prochaine évaluation annuelle est prévue le 15/03/2026. "
+    "Pour toute question sur votre rémunération, contactez le service RH.",
+]
+
+
+class LocalCredential:
+    """TokenCredential returning a fixed token, accepted by the stand-in server"""
+
+    def get_token(self, *scopes, **kwargs):
+        from azure.core.credentials import AccessToken
+        return AccessToken('agents-stub', int(time.time()) + 3600)
+
+
+def local_authentication_policy():
+    """
+    Authentication policy of the SDK clients for the stand-in server:
+    BearerTokenCredentialPolicy refuses to send tokens over plain http
+    """
+    from azure.core.pipeline.policies import HeadersPolicy
+    return HeadersPolicy({'Authorization': 'Bearer agents-stub'})
+
+
+def new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+class StubBehavior:
+    """How the stand-in answers: latency, failures, tool calls and answer text"""
+
+    def __init__(self, latency=0.5, jitter=0.0, request_latency=0.0, failure_rate=0.0, http_error_rate=0.0,
+                 requires_action_rate=0.0, answers='echo', chunk_size=20, chunk_delay=0.02, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.request_latency = request_latency
+        self.failure_rate = failure_rate
+        self.http_error_rate = http_error_rate
+        self.requires_action_rate = requires_action_rate
+        # 'echo', 'canned', or a list of answers used in turn
+        self.answers = answers
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.answer_index = 0
+
+    def draw(self, probability):
+        with self.lock:
+            return self.rng.random() < probability
+
+    def run_duration(self):
+        with self.lock:
+            return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def answer(self, prompt):
+        if self.answers == 'echo':
+            question = prompt.split(QUESTION_MARKER, 1)[-1].strip().split('\n', 1)[0][:500]
+            return f"Vous avez demandé : {question}"
+        answers = CANNED_ANSWERS if self.answers == 'canned' else self.answers
+        with self.lock:
+            answer = answers[self.answer_index % len(answers)]
+            self.answer_index += 1
+        return answer
+
+
+class StubState:
+    """Agents, threads, messages and runs of the stand-in, in memory"""
+
+    def __init__(self, behavior):
+        self.behavior = behavior
+        self.lock = threading.Lock()
+        self.agents = {}
+        self.threads = {}
+        self.messages = {}
+        self.runs = {}
+
+    def agent(self, agent_id, **fields):
+        with self.lock:
+            if agent_id not in self.agents:
+                self.agents[agent_id] = {
+                    'id': agent_id, 'object': 'assistant', 'created_at': int(time.time()),
+                    'name': fields.get('name') or 'Assistant RH (local)', 'description': None,
+                    'model': fields.get('model') or STUB_MODEL, 'instructions': fields.get('instructions') or '',
+                    'tools': fields.get('tools') or [], 'tool_resources': None, 'temperature': 1.0,
+                    'top_p': 1.0, 'response_format': 'auto', 'metadata': fields.get('metadata') or {},
+                }
+            return self.agents[agent_id]
+
+    def thread(self, thread_id, metadata=None):
+        with self.lock:
+            if thread_id not in self.threads:
+                self.threads[thread_id] = {
+                    'id': thread_id, 'object': 'thread', 'created_at': int(time.time()),
+                    'tool_resources': None, 'metadata': metadata or {},
+                }
+                self.messages[thread_id] = []
+            return self.threads[thread_id]
+
+    def add_message(self, thread_id, role, text, agent_id=None, run_id=None):
+        self.thread(thread_id)
+        message = {
+            'id': new_id('msg'), 'object': 'thread.message', 'created_at': int(time.time()),
+            'thread_id': thread_id, 'status': 'completed', 'incomplete_details': None,
+            'completed_at': int(time.time()), 'incomplete_at': None, 'role': role,
+            'content': [{'type': 'text', 'text': {'value': text, 'annotations': []}}],
+            'assistant_id': agent_id, 'run_id': run_id, 'attachments': [], 'metadata': {},
+        }
+        with self.lock:
+            messages = self.messages[thread_id]
+            messages.append(message)
+            del messages[:-THREAD_MAX_MESSAGES]
+        return message
+
+    def list_messages(self, thread_id, order='desc', limit=20, after=None, run_id=None):
+        self.thread(thread_id)
+        with self.lock:
+            messages = [m for m in self.messages[thread_id] if run_id is None or m['run_id'] == run_id]
+        if order == 'desc':
+            messages.reverse()
+        if after:
+            ids = [m['id'] for m in messages]
+            messages = messages[ids.index(after) + 1:] if after in ids else []
+        page = messages[:limit]
+        return {
+            'object': 'list', 'data': page, 'first_id': page[0]['id'] if page else None,
+            'last_id': page[-1]['id'] if page else None, 'has_more': len(messages) > limit,
+        }
+
+    def create_run(self, thread_id, agent_id):
+        behavior = self.behavior
+        self.thread(thread_id)
+        with self.lock:
+            prompts = [m for m in self.messages[thread_id] if m['role'] == 'user']
+        prompt = prompts[-1]['content'][0]['text']['value'] if prompts else ''
+        now = time.time()
+        duration = behavior.run_duration()
+        run = {
+            'id': new_id('run'), 'object': 'thread.run', 'thread_id': thread_id, 'assistant_id': agent_id,
+            'status': 'queued', 'required_action': None, 'last_error': None, 'model': STUB_MODEL,
+            'instructions': '', 'tools': [], 'created_at': int(now), 'expires_at': int(now) + 600,
+            'started_at': None, 'completed_at': None, 'cancelled_at': None, 'failed_at': None,
+            'incomplete_details': None, 'usage': None, 'temperature': 1.0, 'top_p': 1.0,
+            'max_prompt_tokens': None, 'max_completion_tokens': None,
+            'truncation_strategy': {'type': 'auto', 'last_messages': None}, 'tool_choice': 'auto',
+            'response_format': 'auto', 'metadata': {}, 'tool_resources': None, 'parallel_tool_calls': True,
+        }
+        self.runs[run['id']] = {
+            'run': run,
+            'prompt': prompt,
+            'ready_at': now + duration,
+            # Tool calls are requested halfway through the run
+            'action_at': now + duration / 2 if behavior.draw(behavior.requires_action_rate) else None,
+            'fails': behavior.draw(behavior.failure_rate),
+        }
+        return run
+
+    def advance(self, run_id):
+        """Status of a run at the current time; completing it adds the agent's reply"""
+        with self.lock:
+            entry = self.runs[run_id]
+        run = entry['run']
+        now = time.time()
+        if run['status'] in ('completed', 'failed', 'cancelled', 'expired', 'requires_action'):
+            return run
+        if run['started_at'] is None:
+            run['started_at'] = int(now)
+        run['status'] = 'in_progress'
+        if entry['action_at'] is not None and now >= entry['action_at']:
+            entry['action_at'] = None
+            run['status'] = 'requires_action'
+            run['required_action'] = {
+                'type': 'submit_tool_outputs',
+                'submit_tool_outputs': {'tool_calls': [{
+                    'id': new_id('call'), 'type': 'function',
+                    'function': {'name': 'get_employee_directory', 'arguments': '{"departement": "RH"}'},
+                }]},
+            }
+        elif now >= entry['ready_at']:
+            self.finish(entry)
+        return run
+
+    def finish(self, entry):
+        run = entry['run']
+        now = int(time.time())
+        prompt_tokens = len(entry['prompt']) // 4
+        if entry['fails']:
+            run.update(status='failed', failed_at=now,
+                       last_error={'code': 'server_error', 'message': "Échec simulé par le serveur local"})
+            run['usage'] = {'prompt_tokens': prompt_tokens, 'completion_tokens': 0, 'total_tokens': prompt_tokens}
+            return None
+        answer = self.behavior.answer(entry['prompt'])
+        message = self.add_message(run['thread_id'], 'assistant', answer, run['assistant_id'], run['id'])
+        completion_tokens = len(answer) // 4
+        run.update(status='completed', completed_at=now, usage={
+            'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        })
+        return message
+
+    def submit_tool_outputs(self, run_id):
+        with self.lock:
+            entry = self.runs[run_id]
+        run = entry['run']
+        if run['status'] == 'requires_action':
+            run['status'] = 'in_progress'
+            run['required_action'] = None
+            entry['ready_at'] = max(entry['ready_at'], time.time())
+        return run
+
+    def cancel(self, run_id):
+        with self.lock:
+            run = self.runs[run_id]['run']
+        if run['status'] not in ('completed', 'failed', 'cancelled'):
+            run.update(status='cancelled', cancelled_at=int(time.time()), required_action=None)
+        return run
+
+
+# (method, path pattern after the project prefix) -> handler method name
+ROUTES = [
+    ('POST', r'/assistants', 'create_agent'),
+    ('GET', r'/assistants/(?P<agent_id>[^/]+)', 'get_agent'),
+    ('POST', r'/threads', 'create_thread'),
+    ('GET', r'/threads/(?P<thread_id>[^/]+)', 'get_thread'),
+    ('POST', r'/threads/(?P<thread_id>[^/]+)/messages', 'create_message'),
+    ('GET', r'/threads/(?P<thread_id>[^/]+)/messages', 'list_messages'),
+    ('POST', r'/threads/(?P<thread_id>[^/]+)/runs', 'create_run'),
+    ('GET', r'/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)', 'get_run'),
+    ('POST', r'/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)/submit_tool_outputs', 'submit_tool_outputs'),
+    ('POST', r'/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)/cancel', 'cancel_run'),
+]
+COMPILED_ROUTES = [(method, re.compile(rf'^.*?{pattern}$'), name) for method, pattern, name in ROUTES]
+
+
+class AgentsStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Set by make_server()
+    state = None
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, method):
+        behavior = self.state.behavior
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+        if behavior.request_latency:
+            time.sleep(behavior.request_latency)
+        if behavior.http_error_rate and behavior.draw(behavior.http_error_rate):
+            return self.send_json(500, {'error': {'code': 'InternalServerError', 'message': "Erreur simulée"}})
+        for route_method, pattern, name in COMPILED_ROUTES:
+            match = pattern.match(url.path)
+            if match and route_method == method:
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    return getattr(self, name)(body, query, **match.groupdict())
+                except KeyError:
+                    return self.send_json(404, {'error': {'code': 'NotFound', 'message': url.path}})
+        self.send_json(404, {'error': {'code': 'NotFound', 'message': f"{method} {url.path}"}})
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def create_agent(self, body, query):
+        self.send_json(200, self.state.agent(new_id('asst'), **body))
+
+    def get_agent(self, body, query, agent_id):
+        self.send_json(200, self.state.agent(agent_id))
+
+    def create_thread(self, body, query):
+        thread = self.state.thread(new_id('thread'), body.get('metadata'))
+        for message in body.get('messages') or []:
+            self.state.add_message(thread['id'], message.get('role', 'user'), str(message.get('content', '')))
+        self.send_json(200, thread)
+
+    def get_thread(self, body, query, thread_id):
+        self.send_json(200, self.state.thread(thread_id))
+
+    def create_message(self, body, query, thread_id):
+        content = body.get('content', '')
+        if isinstance(content, list):
+            content = ''.join(block.get('text', '') for block in content if isinstance(block, dict))
+        self.send_json(200, self.state.add_message(thread_id, body.get('role', 'user'), content))
+
+    def list_messages(self, body, query, thread_id):
+        self.send_json(200, self.state.list_messages(
+            thread_id, order=query.get('order', 'desc'), limit=int(query.get('limit', 20)),
+            after=query.get('after'), run_id=query.get('run_id'),
+        ))
+
+    def create_run(self, body, query, thread_id):
+        run = self.state.create_run(thread_id, body.get('assistant_id'))
+        if body.get('stream'):
+            return self.stream_run(run)
+        self.send_json(200, run)
+
+    def get_run(self, body, query, thread_id, run_id):
+        self.send_json(200, self.state.advance(run_id))
+
+    def submit_tool_outputs(self, body, query, thread_id, run_id):
+        run = self.state.submit_tool_outputs(run_id)
+        if body.get('stream'):
+            return self.stream_run(run)
+        self.send_json(200, run)
+
+    def cancel_run(self, body, query, thread_id, run_id):
+        self.send_json(200, self.state.cancel(run_id))
+
+    def send_event(self, event, data):
+        payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+        chunk = f"event: {event}\ndata: {payload}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(chunk):x}\r\n".encode('ascii') + chunk + b"\r\n")
+        self.wfile.flush()
+
+    def stream_run(self, run):
+        """Server-sent events of a run: the reply arrives in chunks of chunk_size characters"""
+        behavior = self.state.behavior
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.send_event('thread.run.created', run)
+        entry = self.state.runs[run['id']]
+        run = self.state.advance(run['id'])
+        self.send_event('thread.run.in_progress', run)
+        # Time to the first token
+        time.sleep(max(0.0, entry['ready_at'] - time.time()))
+        while run['status'] not in ('completed', 'failed', 'cancelled', 'requires_action'):
+            time.sleep(0.01)
+            run = self.state.advance(run['id'])
+        if run['status'] == 'requires_action':
+            self.send_event('thread.run.requires_action', run)
+        elif run['status'] == 'completed':
+            message = self.state.list_messages(run['thread_id'], limit=1, run_id=run['id'])['data'][0]
+            text = message['content'][0]['text']['value']
+            self.send_event('thread.message.created', dict(message, status='in_progress', content=[]))
+            for start in range(0, len(text), behavior.chunk_size):
+                self.send_event('thread.message.delta', {
+                    'id': message['id'], 'object': 'thread.message.delta',
+                    'delta': {'content': [{'index': 0, 'type': 'text',
+                                           'text': {'value': text[start:start + behavior.chunk_size]}}]},
+                })
+                time.sleep(behavior.chunk_delay)
+            self.send_event('thread.message.completed', message)
+            self.send_event('thread.run.completed', run)
+        else:
+            self.send_event(f"thread.run.{run['status']}", run)
+        self.send_event('done', '[DONE]')
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def make_server(host, port, behavior):
+    """ThreadingHTTPServer serving the stand-in API with ``behavior``"""
+    handler = type('Handler', (AgentsStubHandler,), {'state': StubState(behavior)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,141 @@
+"""
+Cold storage of the messages of idle chats.
+
+archive_chats moves the messages of chats idle for a while out of the
+Message table into MessageArchive rows, each holding a batch of messages as
+zlib-compressed JSON. Every batch is written and its messages deleted in
+one short transaction, so the write lock is only held for one batch.
+
+Archived messages are always older than the chat's remaining messages: the
+newest one stays in Message (it feeds the preview of the chat list) and
+anything sent later lands there too. history_page() relies on this to read
+a chat's history across both tables with the same cursors as before.
+"""
+import json
+import zlib
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Chat, Message, MessageArchive
+from .pagination import keyset_page
+
+# Messages per compressed batch, written in one transaction
+ARCHIVE_BATCH_SIZE = 500
+# Newest messages of an archived chat kept in Message
+KEEP_HOT = 1
+COMPRESSION_LEVEL = 9
+
+
+def compress_messages(rows):
+    """Compress (id, sender, content, created_at) rows into an archive batch"""
+    payload = [[pk, sender, content, created_at.isoformat()] for pk, sender, content, created_at in rows]
+    return zlib.compress(json.dumps(payload, ensure_ascii=False).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decompress_messages(data):
+    """Rows of an archive batch as dicts shaped like Message.values('id', 'sender', 'content', 'created_at')"""
+    return [
+        {'id': pk, 'sender': sender, 'content': content, 'created_at': datetime.fromisoformat(created_at)}
+        for pk, sender, content, created_at in json.loads(zlib.decompress(bytes(data)))
+    ]
+
+
+def idle_chats(cutoff):
+    """Ids of chats not updated since ``cutoff`` that still have messages to archive"""
+    return Chat.objects.filter(updated_at__lt=cutoff, deleted_at=None).annotate(
+        hot=Count('messages')
+    ).filter(hot__gt=KEEP_HOT).order_by('id').values_list('id', flat=True)
+
+
+def archive_chat(chat_id, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move all messages of a chat but the newest KEEP_HOT ones to the archive.
+    Returns (messages archived, raw bytes, compressed bytes).
+    """
+    rows = list(
+        Message.objects.filter(chat_id=chat_id).order_by('created_at', 'id')
+        .values_list('id', 'sender', 'content', 'created_at')
+    )[:-KEEP_HOT]
+    archived = raw_size = compressed_size = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        data = compress_messages(batch)
+        with transaction.atomic():
+            MessageArchive.objects.create(
+                chat_id=chat_id,
+                first_created_at=batch[0][3],
+                last_created_at=batch[-1][3],
+                message_count=len(batch),
+                data=data,
+            )
+            Message.objects.filter(id__in=[row[0] for row in batch]).delete()
+            Chat.objects.filter(pk=chat_id).update(archived_until=batch[-1][3])
+        archived += len(batch)
+        raw_size += sum(len(row[2].encode('utf-8')) for row in batch)
+        compressed_size += len(data)
+    return archived, raw_size, compressed_size
+
+
+def archived_page(chat_id, cursor, limit, descending):
+    """keyset_page() over the archived messages of a chat, decompressing only the batches it reads"""
+    archives = MessageArchive.objects.filter(chat_id=chat_id)
+    if descending:
+        ordering = ('-first_created_at', '-id')
+        if cursor:
+            archives = archives.filter(first_created_at__lte=cursor[0])
+    else:
+        ordering = ('first_created_at', 'id')
+        if cursor:
+            archives = archives.filter(last_created_at__gte=cursor[0])
+
+    rows = []
+    for data in archives.order_by(*ordering).values_list('data', flat=True).iterator(chunk_size=4):
+        batch = decompress_messages(data)
+        if descending:
+            batch.reverse()
+        if cursor:
+            if descending:
+                batch = [row for row in batch if (row['created_at'], row['id']) < cursor]
+            else:
+                batch = [row for row in batch if (row['created_at'], row['id']) > cursor]
+        rows.extend(batch)
+        if len(rows) > limit:
+            break
+    return rows[:limit], len(rows) > limit
+
+
+def history_page(chat, messages, cursor, limit, descending):
+    """
+    keyset_page() over a chat's history, ``messages`` being its queryset of
+    Message values: the archive continues the Message table towards the past.
+    """
+    if chat.archived_until is None:
+        return keyset_page(messages, 'created_at', cursor, limit, descending)
+
+    if descending:
+        rows, has_more = keyset_page(messages, 'created_at', cursor, limit, descending)
+        if has_more:
+            return rows, has_more
+        older, has_more = archived_page(chat.pk, cursor, limit - len(rows), descending)
+        return rows + older, has_more
+
+    if cursor and cursor[0] > chat.archived_until:
+        return keyset_page(messages, 'created_at', cursor, limit, descending)
+    rows, has_more = archived_page(chat.pk, cursor, limit, descending)
+    if has_more:
+        return rows, has_more
+    newer, has_more = keyset_page(messages, 'created_at', cursor, limit - len(rows), descending)
+    return rows + newer, has_more
+
+
+def archived_message_rows(columns, chunk_size=100):
+    """Archived messages as tuples of ``columns`` (fields of Message, chat_id included), chat by chat"""
+    archives = MessageArchive.objects.filter(chat__deleted_at=None).order_by(
+        'chat_id', 'first_created_at', 'id'
+    ).values_list('chat_id', 'data')
+    for chat_id, data in archives.iterator(chunk_size=chunk_size):
+        for row in decompress_messages(data):
+            row['chat_id'] = chat_id
+            yield tuple(row[column] for column in columns)
@@ -0,0 +1,91 @@
+"""
+Azure AI Agents client of the chatbot, with the SDK imported on first use.
+
+Importing azure.ai.projects and azure.identity takes a few hundred
+milliseconds, which every worker start and management command used to pay
+through users.views. They are now imported by the first call that needs
+them. The project client (with its credential and token cache) and the
+resolved agent are then kept per process, so only the first message of a
+worker acquires a token.
+"""
+import importlib.util
+import threading
+from types import SimpleNamespace
+
+from django.conf import settings
+
+_sdk = None
+_client = None
+_client_endpoint = None
+_agent = None
+_lock = threading.Lock()
+
+
+def azure_installed():
+    """True if the Azure AI SDK can be imported, checked without importing it"""
+    return all(
+        importlib.util.find_spec(name) is not None
+        for name in ('azure.ai.projects', 'azure.identity', 'azure.ai.agents')
+    )
+
+
+def sdk():
+    """The Azure AI SDK classes used by the chatbot, imported on first call"""
+    global _sdk
+    if _sdk is None:
+        from azure.ai.agents.models import MessageRole
+        from azure.ai.projects import AIProjectClient
+        from azure.identity import DefaultAzureCredential, ManagedIdentityCredential
+        _sdk = SimpleNamespace(
+            AIProjectClient=AIProjectClient,
+            DefaultAzureCredential=DefaultAzureCredential,
+            ManagedIdentityCredential=ManagedIdentityCredential,
+            MessageRole=MessageRole,
+        )
+    return _sdk
+
+
+def create_project_client():
+    """AIProjectClient for AZURE_AI_ENDPOINT"""
+    azure = sdk()
+    if not settings.AZURE_AI_ENDPOINT.startswith('https://'):
+        # Local stand-in server (users/agents_stub.py), no Azure credentials
+        from .agents_stub import LocalCredential, local_authentication_policy
+        return azure.AIProjectClient(
+            credential=LocalCredential(),
+            endpoint=settings.AZURE_AI_ENDPOINT,
+            authentication_policy=local_authentication_policy()
+        )
+    try:
+        # Try Managed Identity first (for Azure App Service)
+        credential = azure.ManagedIdentityCredential()
+    except Exception:
+        # Fallback to DefaultAzureCredential for local development
+        credential = azure.DefaultAzureCredential()
+    return azure.AIProjectClient(
+        credential=credential,
+        endpoint=settings.AZURE_AI_ENDPOINT
+    )
+
+
+def get_project_client():
+    """The project client of this process, created on first use (clients are thread-safe)"""
+    global _client, _client_endpoint, _agent
+    if _client is None or _client_endpoint != settings.AZURE_AI_ENDPOINT:
+        with _lock:
+            if _client is None or _client_endpoint != settings.AZURE_AI_ENDPOINT:
+                _client, _client_endpoint, _agent = create_project_client(), settings.AZURE_AI_ENDPOINT, None
+    return _client
+
+
+def get_agent(project):
+    """
+    The AZURE_AI_AGENT_ID agent, fetched once per process: only its ID is
+    used, and the first call also acquires the access token
+    """
+    global _agent
+    agent = _agent
+    if agent is None or agent.id != settings.AZURE_AI_AGENT_ID:
+        agent = _agent = project.agents.get_agent(settings.AZURE_AI_AGENT_ID)
+    return agent
+
@@ -0,0 +1,99 @@
+"""
+Helpers shared by the benchmark management commands (bench_*).
+
+Benchmarks never touch the configured database: they run against a
+throwaway copy created from the migrations, like the test runner does.
+"""
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client
+
+
+@contextmanager
+def isolated_database(alias=DEFAULT_DB_ALIAS, verbosity=0):
+    """
+    Create a fresh database for the duration of the block and drop it after.
+    SQLite databases are created as real files (not in memory) so that
+    several threads can share them and locking behaves as in production.
+    """
+    connection = connections[alias]
+    tmpdir = None
+    if connection.vendor == 'sqlite':
+        tmpdir = tempfile.mkdtemp(prefix='hrbot-bench-')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection.settings_dict['NAME']
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(values):
+    """Count, mean and tail percentiles of a list of durations in seconds, as milliseconds"""
+    if not values:
+        return {'count': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) * 1000,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': max(values) * 1000,
+    }
+
+
+def run_concurrently(worker, concurrency, *args):
+    """
+    Run worker(index, *args) in ``concurrency`` threads started together and
+    return the wall-clock time. Each thread closes its own database
+    connection when done.
+    """
+    barrier = threading.Barrier(concurrency)
+
+    def target(index):
+        try:
+            barrier.wait()
+            worker(index, *args)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def api_client(user=None):
+    """Test client logged in as ``user``, sending a Host header ALLOWED_HOSTS accepts"""
+    client = Client(HTTP_HOST='localhost')
+    if user is not None:
+        client.force_login(user)
+    return client
+
+
+def is_lock_error(error):
+    """True for SQLite 'database is locked' / 'database table is locked' errors"""
+    return 'locked' in str(error)
@@ -0,0 +1,89 @@
+"""
+Row-by-row bulk writes for imports, maintenance and data generation commands.
+
+QuerySet.bulk_update() writes one ``UPDATE … SET col = CASE WHEN id = …``
+statement per batch, whose construction is quadratic-ish in Python and
+dominates large imports. When every row gets its own values, a prepared
+``UPDATE … WHERE id = %s`` run with executemany() is much cheaper.
+Likewise insert_rows() skips the model instances bulk_create() builds.
+"""
+from itertools import islice
+
+from django.db import connections, router, transaction
+
+
+def update_rows(model, fields, rows, batch_size=1000):
+    """
+    Write ``fields`` of existing rows of ``model``. ``rows`` yields tuples of
+    (pk, value of each field); each batch of ``batch_size`` rows is written
+    in its own transaction. Returns the number of rows written.
+    """
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    meta = model._meta
+    model_fields = [meta.get_field(name) for name in fields]
+    sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+        qn(meta.db_table),
+        ', '.join(f'{qn(field.column)} = %s' for field in model_fields),
+        qn(meta.pk.column),
+    )
+
+    written = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return written
+        params = [
+            [field.get_db_prep_save(value, connection) for field, value in zip(model_fields, values)] + [pk]
+            for pk, *values in batch
+        ]
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+        written += len(batch)
+
+
+# Values the database drivers take as they are, insert_rows() only prepares the others (dates…)
+NATIVE_TYPES = frozenset({str, int, float, bool, type(None)})
+
+
+def insert_rows(model, fields, rows, batch_size=1000):
+    """
+    Insert new rows of ``model`` without building model instances. ``rows``
+    yields tuples of values for ``fields``; the other columns get their
+    field default, evaluated once. Each batch of ``batch_size`` rows is
+    written in its own transaction. Returns the number of rows inserted.
+    """
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    meta = model._meta
+    model_fields = [meta.get_field(name) for name in fields]
+    other_fields = [field for field in meta.concrete_fields if not field.primary_key and field not in model_fields]
+    # auto_now(_add) fields have no default, pre_save() gives them the current time
+    blank = model()
+    default_values = [
+        field.get_db_prep_save(field.pre_save(blank, add=True), connection) for field in other_fields
+    ]
+    columns = [field.column for field in model_fields + other_fields]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(meta.db_table), ', '.join(qn(column) for column in columns), ', '.join(['%s'] * len(columns))
+    )
+
+    inserted = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return inserted
+        params = [
+            [
+                value if type(value) in NATIVE_TYPES else field.get_db_prep_save(value, connection)
+                for field, value in zip(model_fields, values)
+            ] + default_values
+            for values in batch
+        ]
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+        inserted += len(batch)
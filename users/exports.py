@@ -0,0 +1,112 @@
+"""
+Streaming exports of the employee directory and of the chat history.
+
+Rows are read with QuerySet.iterator() (a server-side cursor on
+PostgreSQL, chunked fetches on SQLite) and encoded as they go, so memory
+does not depend on the size of the export. Used by the export_hr_data
+command and by the admin download endpoint.
+"""
+import csv
+import json
+import zlib
+
+from .archive import archived_message_rows
+from .hr_import import HR_CSV_COLUMNS, hr_csv_row
+from .models import CustomUser, Chat, Message
+
+FORMATS = ('csv', 'jsonl')
+# Rows fetched per round trip and rows encoded per yielded chunk
+CHUNK_SIZE = 2000
+
+DIRECTORY_FIELDS = [
+    'employee_id', 'first_name', 'last_name', 'email', 'departement', 'is_manager', 'poste',
+    'responsable_id', 'date_embauche', 'conges_droit_annuel', 'conges_utilises', 'conges_planifies',
+    'conges_restants', 'conges_maladie_droit', 'conges_maladie_utilises', 'conges_maladie_restants',
+    'salaire', 'eligible_prime', 'date_prochaine_evaluation', 'regime_sante',
+]
+CHAT_COLUMNS = ['id', 'employee_id', 'username', 'title', 'message_count', 'created_at', 'updated_at']
+MESSAGE_COLUMNS = ['id', 'chat_id', 'sender', 'content', 'created_at']
+
+
+class Echo:
+    """File-like object whose write() returns the line, for csv.writer in a generator"""
+
+    def write(self, value):
+        return value
+
+
+def directory_rows():
+    """Active employees in the HR extract layout read by import_hr_data"""
+    employees = CustomUser.objects.filter(is_active=True, employee_id__isnull=False).order_by('employee_id')
+    for employee in employees.values(*DIRECTORY_FIELDS).iterator(chunk_size=CHUNK_SIZE):
+        yield hr_csv_row(employee)
+
+
+def chat_rows():
+    chats = Chat.objects.filter(deleted_at=None).order_by('id').values_list(
+        'id', 'user__employee_id', 'user__username', 'title', 'message_count', 'created_at', 'updated_at'
+    )
+    yield from chats.iterator(chunk_size=CHUNK_SIZE)
+
+
+def message_rows():
+    # (chat, created_at, id) follows the message_chat_created_idx index
+    messages = Message.objects.filter(chat__deleted_at=None).order_by(
+        'chat_id', 'created_at', 'id'
+    ).values_list(*MESSAGE_COLUMNS)
+    yield from messages.iterator(chunk_size=CHUNK_SIZE)
+    # Messages moved out of the table by archive_chats follow, chat by chat
+    yield from archived_message_rows(MESSAGE_COLUMNS)
+
+
+# kind -> (columns, row generator, CSV delimiter)
+EXPORTS = {
+    'directory': (HR_CSV_COLUMNS, directory_rows, ';'),
+    'chats': (CHAT_COLUMNS, chat_rows, ','),
+    'messages': (MESSAGE_COLUMNS, message_rows, ','),
+}
+
+
+def json_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def export_lines(kind, fmt):
+    """Yield the export as text chunks of up to CHUNK_SIZE rows"""
+    columns, rows, delimiter = EXPORTS[kind]
+    if fmt == 'csv':
+        writer = csv.writer(Echo(), delimiter=delimiter)
+        encode = writer.writerow
+        yield encode(columns)
+    else:
+        def encode(row):
+            return json.dumps(dict(zip(columns, map(json_value, row))), ensure_ascii=False) + '\n'
+
+    chunk = []
+    for row in rows():
+        chunk.append(encode(row))
+        if len(chunk) >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def export_stream(kind, fmt, compress=False):
+    """Yield the export as UTF-8 bytes, gzip-compressed on the fly if ``compress``"""
+    if not compress:
+        for text in export_lines(kind, fmt):
+            yield text.encode('utf-8')
+        return
+
+    # wbits=31: gzip container, readable by gunzip and Python's gzip module
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for text in export_lines(kind, fmt):
+        data = compressor.compress(text.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_filename(kind, fmt, compress=False):
+    return f"{kind}.{fmt}{'.gz' if compress else ''}"
@@ -0,0 +1,328 @@
+"""
+Streaming reader for HR extracts, the CSV files consumed by import_hr_data.
+
+The file is read in three stages so that memory stays bounded whatever its
+size:
+1. sniff(): encoding and CSV dialect detected once from the first bytes
+2. parse_chunks(): rows are cut into chunks converted to CustomUser field
+   values by a process pool, with a bounded number of chunks in flight
+3. the caller writes each converted chunk to the database as it arrives
+
+This module must not import the models: the pool workers only need the
+conversion functions and do not set Django up.
+"""
+import codecs
+import csv
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache, partial
+from itertools import islice
+
+# Header of the HR extract
+HR_CSV_COLUMNS = [
+    'id', 'nom', 'email', 'departement', 'Manager', 'poste', 'responsable', 'date_embauche',
+    'conges.droit_annuel', 'conges.utilises', 'conges.planifies', 'conges.restants',
+    'conges_maladie.droit', 'conges_maladie.utilises', 'conges_maladie.restants',
+    'remuneration.salaire', 'remuneration.eligible_prime', 'remuneration.date_prochaine_evaluation',
+    'avantages.regime_sante',
+]
+DATE_FORMAT = '%d/%m/%Y'
+TRUE_VALUES = {'OUI', 'VRAI', 'TRUE', '1', 'YES'}
+
+# CustomUser field -> (column, default when the column is missing)
+FLOAT_COLUMNS = {
+    'conges_droit_annuel': ('conges.droit_annuel', '25'),
+    'conges_utilises': ('conges.utilises', '0'),
+    'conges_planifies': ('conges.planifies', '0'),
+    'conges_restants': ('conges.restants', '25'),
+    'conges_maladie_droit': ('conges_maladie.droit', '10'),
+    'conges_maladie_utilises': ('conges_maladie.utilises', '0'),
+    'conges_maladie_restants': ('conges_maladie.restants', '10'),
+    'salaire': ('remuneration.salaire', '0'),
+}
+DATE_COLUMNS = {
+    'date_embauche': 'date_embauche',
+    'date_prochaine_evaluation': 'remuneration.date_prochaine_evaluation',
+}
+
+# Tried in order on the sniffed sample, latin-1 accepts any byte sequence
+ENCODINGS = ['utf-8', 'cp1252', 'latin-1']
+SNIFF_SIZE = 64 * 1024
+
+# Issues reported per kind, the others are only counted
+MAX_ISSUE_EXAMPLES = 10
+
+
+def sniff(path, sample_size=SNIFF_SIZE):
+    """
+    Detect the encoding and CSV dialect of an extract from its first bytes.
+    Returns (encoding, dialect).
+    """
+    with open(path, 'rb') as f:
+        sample = f.read(sample_size)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+        text = sample[len(codecs.BOM_UTF8):].decode('utf-8', errors='ignore')
+    else:
+        for encoding in ENCODINGS:
+            # final=False: a multi-byte character cut by the end of the sample is not an error
+            decoder = codecs.getincrementaldecoder(encoding)()
+            try:
+                text = decoder.decode(sample, final=False)
+                break
+            except UnicodeDecodeError:
+                continue
+
+    try:
+        dialect = csv.Sniffer().sniff(text[:text.rfind('\n') + 1] or text, delimiters=';,\t|')
+    except csv.Error:
+        header = text.split('\n', 1)[0]
+        dialect = type('HRExtract', (csv.excel,), {'delimiter': ';' if ';' in header else ','})
+    return encoding, dialect
+
+
+def hr_csv_row(employee):
+    """
+    Row of the HR extract for a dict of CustomUser values (keys as the field
+    names, the manager as ``responsable_id``). Inverse of convert_chunk().
+    """
+    def date(value):
+        return value.strftime(DATE_FORMAT) if value else ''
+
+    return [
+        employee['employee_id'],
+        f"{employee['first_name']} {employee['last_name']}".strip(),
+        employee['email'] or '',
+        employee['departement'] or '',
+        'Oui' if employee['is_manager'] else 'Non',
+        employee['poste'] or '',
+        employee['responsable_id'] or '',
+        date(employee['date_embauche']),
+        employee['conges_droit_annuel'],
+        employee['conges_utilises'],
+        employee['conges_planifies'],
+        employee['conges_restants'],
+        employee['conges_maladie_droit'],
+        employee['conges_maladie_utilises'],
+        employee['conges_maladie_restants'],
+        '' if employee['salaire'] is None else employee['salaire'],
+        'VRAI' if employee['eligible_prime'] else 'FAUX',
+        date(employee['date_prochaine_evaluation']),
+        employee['regime_sante'],
+    ]
+
+
+class ExtractDecodeError(ValueError):
+    """Bytes of the extract that are not valid in the encoding detected by sniff()"""
+
+
+def decode_lines(f, encoding):
+    """Lines of the binary file ``f`` decoded strictly, one at a time"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for line in f:
+        yield decoder.decode(line)
+    # A multi-byte character cut by the end of the file
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def read_chunks(path, encoding, dialect, chunk_size):
+    """
+    Yield (header, first row number, rows) for consecutive chunks of ``chunk_size`` rows.
+    The file is decoded line by line, so that bytes invalid in ``encoding``
+    raise ExtractDecodeError with the number of the row holding them, after
+    the rows before it.
+    """
+    with open(path, 'rb') as f:
+        reader = csv.reader(decode_lines(f, encoding), dialect)
+        row_num = 1
+        rows = []
+        try:
+            header = [column.strip() for column in next(reader, [])]
+            row_num = 2
+            while True:
+                rows = []
+                for row in islice(reader, chunk_size):
+                    rows.append(row)
+                if not rows:
+                    return
+                yield header, row_num, rows
+                row_num += len(rows)
+        except UnicodeDecodeError as e:
+            error = ExtractDecodeError(
+                f"ligne {row_num + len(rows)}: octets invalides pour l'encodage {encoding} "
+                f"détecté au début du fichier ({e.reason})"
+            )
+    # The rows read before the error are still imported
+    if rows:
+        yield header, row_num, rows
+    raise error
+
+
+@lru_cache(maxsize=8192)
+def parse_date(value):
+    """DD/MM/YYYY to a date, None if empty; raises ValueError if malformed"""
+    value = value.strip()
+    if not value:
+        return None
+    return datetime.strptime(value, DATE_FORMAT).date()
+
+
+def parse_float(value):
+    value = value.strip()
+    if not value:
+        return 0.0
+    return float(value.replace(',', '.'))
+
+
+def parse_boolean(value):
+    return value.strip().upper() in TRUE_VALUES
+
+
+def convert_floats(values):
+    """
+    Convert a whole column at once. The common case (plain decimal numbers)
+    goes through a single map(float); only a column containing a blank, a
+    comma or a typo is converted value by value. Returns (floats, bad values).
+    """
+    try:
+        return list(map(float, values)), []
+    except ValueError:
+        pass
+    floats = []
+    bad = []
+    for value in values:
+        try:
+            floats.append(parse_float(value))
+        except ValueError:
+            floats.append(0.0)
+            bad.append(value)
+    return floats, bad
+
+
+def row_digest(manager_id, fields):
+    """Digest of the converted values of a row, insensitive to formatting changes in the file"""
+    content = repr((manager_id, sorted(fields.items())))
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def convert_chunk(header, first_row_num, rows, regimes):
+    """
+    Convert raw CSV rows to (employee_id, manager employee_id, fields, digest) records.
+    Returns (records, issues) where issues maps a kind of problem to
+    (count, examples) and rows without an employee ID are dropped.
+    """
+    issues = {}
+
+    def report(kind, example):
+        count, examples = issues.get(kind, (0, []))
+        if len(examples) < MAX_ISSUE_EXAMPLES:
+            examples.append(example)
+        issues[kind] = (count + 1, examples)
+
+    width = len(header)
+    index = {column: i for i, column in enumerate(header)}
+    kept = []
+    for offset, row in enumerate(rows):
+        if len(row) < width:
+            row = row + [''] * (width - len(row))
+        if 'id' not in index or not row[index['id']].strip():
+            report("ID employé manquant, ligne ignorée", f"ligne {first_row_num + offset}")
+            continue
+        kept.append(row)
+
+    def column(name, default=''):
+        position = index.get(name)
+        if position is None:
+            return [default] * len(kept)
+        return [row[position] for row in kept]
+
+    def get(row, name, default=''):
+        position = index.get(name)
+        return row[position] if position is not None else default
+
+    floats = {}
+    for field, (name, default) in FLOAT_COLUMNS.items():
+        floats[field], bad = convert_floats(column(name, default))
+        for value in bad:
+            report("Erreur de format numérique", value)
+
+    dates = {}
+    for field, name in DATE_COLUMNS.items():
+        values = []
+        for value in column(name):
+            try:
+                values.append(parse_date(value))
+            except ValueError:
+                values.append(None)
+                report("Erreur de format de date", value)
+        dates[field] = values
+
+    records = []
+    for i, row in enumerate(kept):
+        employee_id = get(row, 'id').strip()
+        nom_complet = get(row, 'nom').strip()
+        if ' ' in nom_complet:
+            first_name, last_name = nom_complet.split(' ', 1)
+        else:
+            first_name, last_name = nom_complet, ''
+        regime = get(row, 'avantages.regime_sante', 'Standard').strip()
+        fields = {
+            'email': get(row, 'email').strip() or f"{employee_id.lower()}@company.com",
+            'first_name': first_name,
+            'last_name': last_name,
+            'departement': get(row, 'departement').strip(),
+            'is_manager': parse_boolean(get(row, 'Manager')),
+            'poste': get(row, 'poste').strip(),
+            'date_embauche': dates['date_embauche'][i],
+            'eligible_prime': parse_boolean(get(row, 'remuneration.eligible_prime', 'VRAI')),
+            'date_prochaine_evaluation': dates['date_prochaine_evaluation'][i],
+            'regime_sante': regime if regime in regimes else 'Standard',
+        }
+        for field in FLOAT_COLUMNS:
+            fields[field] = floats[field][i]
+        manager_id = get(row, 'responsable').strip() or None
+        records.append((employee_id, manager_id, fields, row_digest(manager_id, fields)))
+
+    return records, issues
+
+
+def parse_chunks(path, encoding, dialect, regimes, chunk_size=1000, workers=None):
+    """
+    Yield (records, issues, rows read) for each chunk of the file, in file
+    order. With more than one worker, chunks are converted by a process
+    pool and at most two chunks per worker are in flight, which bounds
+    memory whatever the size of the file. ExtractDecodeError is raised once
+    the chunks before the undecodable row have been yielded.
+    """
+    chunks = read_chunks(path, encoding, dialect, chunk_size)
+    convert = partial(convert_chunk, regimes=frozenset(regimes))
+    workers = os.cpu_count() if workers is None else workers
+
+    if workers <= 1:
+        for header, first_row_num, rows in chunks:
+            yield (*convert(header, first_row_num, rows), len(rows))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        decode_error = None
+        try:
+            for header, first_row_num, rows in chunks:
+                in_flight.append((pool.submit(convert, header, first_row_num, rows), len(rows)))
+                if len(in_flight) >= workers * 2:
+                    future, count = in_flight.popleft()
+                    yield (*future.result(), count)
+        except ExtractDecodeError as e:
+            # The chunks read before the error are still handed over
+            decode_error = e
+        while in_flight:
+            future, count = in_flight.popleft()
+            yield (*future.result(), count)
+        if decode_error:
+            raise decode_error
@@ -0,0 +1,117 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test import RequestFactory
+from django.utils import timezone
+from users.archive import ARCHIVE_BATCH_SIZE, archive_chat, idle_chats
+from users.benchmarking import summarize
+from users.models import Chat, Message
+import json
+import random
+import time
+
+class Command(BaseCommand):
+    help = (
+        "Archive les messages des conversations inactives dans un stockage compressé "
+        "et mesure la taille de la table des messages et la latence de get_messages"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=180, help="Inactivité minimale d'une conversation, en jours")
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help="Messages par lot compressé")
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.01,
+            help="Pause entre deux conversations, en secondes, pour laisser passer les autres écritures"
+        )
+        parser.add_argument('--sample', type=int, default=50, help="Conversations utilisées pour mesurer get_messages")
+        parser.add_argument('--dry-run', action='store_true', help="Compte les conversations à archiver sans rien écrire")
+
+    def hot_size(self):
+        """(rows, bytes) of the Message table and its indexes, bytes None without SQLite's dbstat"""
+        rows = Message.objects.count()
+        if connection.vendor != 'sqlite':
+            return rows, None
+        try:
+            with connection.cursor() as cursor:
+                # The table and all of its indexes
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                    "(SELECT name FROM sqlite_master WHERE tbl_name = %s)",
+                    [Message._meta.db_table],
+                )
+                return rows, cursor.fetchone()[0]
+        except OperationalError:
+            return rows, None
+
+    def measure(self, chats):
+        """p50/p95 of get_messages (newest page, then the page before it) over ``chats``"""
+        from users.views import get_messages
+
+        factory = RequestFactory()
+        durations = []
+        for chat in chats:
+            cursor = None
+            for _ in range(2):
+                request = factory.get(f'/api/chats/{chat.id}/messages/', {'before': cursor} if cursor else {})
+                request.user = chat.user
+                start = time.perf_counter()
+                response = get_messages(request, chat.id)
+                durations.append(time.perf_counter() - start)
+                page = json.loads(response.content)
+                if not page['has_more']:
+                    break
+                cursor = page['messages'][0]['cursor']
+        return summarize(durations)
+
+    def report(self, label, samples):
+        rows, size_bytes = self.hot_size()
+        size_text = f", {size_bytes / 1024 / 1024:.1f} Mo" if size_bytes is not None else ""
+        self.stdout.write(f"{label}: table des messages {rows} lignes{size_text}")
+        for name, chats in samples.items():
+            stats = self.measure(chats)
+            if stats['count']:
+                self.stdout.write(
+                    f"  get_messages, conversations {name}: p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms"
+                )
+
+    def samples(self, archived_ids, size):
+        """Chats to time get_messages on: some of those archived and the most recently active ones"""
+        return {
+            'archivées': list(Chat.objects.filter(id__in=archived_ids).select_related('user')),
+            'actives': list(Chat.objects.exclude(id__in=archived_ids).select_related('user')[:size]),
+        }
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        chat_ids = list(idle_chats(cutoff))
+        self.stdout.write(f"{len(chat_ids)} conversations inactives depuis {options['days']} jours à archiver")
+        if not chat_ids or options['dry_run']:
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING("Simulation: aucun changement écrit"))
+            return
+
+        sample_ids = random.sample(chat_ids, min(options['sample'], len(chat_ids)))
+        self.report("Avant", self.samples(sample_ids, options['sample']))
+
+        start = time.perf_counter()
+        archived = raw_size = compressed_size = 0
+        for n, chat_id in enumerate(chat_ids, 1):
+            count, raw, compressed = archive_chat(chat_id, options['batch_size'])
+            archived += count
+            raw_size += raw
+            compressed_size += compressed
+            if n % 100 == 0:
+                self.stdout.write(f"  {n}/{len(chat_ids)} conversations, {archived} messages archivés...")
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.report("Après", self.samples(sample_ids, options['sample']))
+        ratio = raw_size / compressed_size if compressed_size else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {archived} messages archivés en {time.perf_counter() - start:.1f} s "
+            f"({raw_size / 1024:.0f} Ko de texte → {compressed_size / 1024:.0f} Ko compressés, x{ratio:.1f})"
+        ))
+        if connection.vendor == 'sqlite':
+            self.stdout.write("Les pages libérées sont réutilisées; VACUUM réduit le fichier si nécessaire")
@@ -0,0 +1,240 @@
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from users.benchmarking import api_client, isolated_database
+from users.models import CustomUser, Chat, Message
+from users.synthetic import create_employees
+import json
+import re
+
+# Statements without a meaningful query plan
+SKIPPED_PREFIXES = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK', 'COMMIT', 'INSERT')
+
+# Fallback assistant questions, one per intent of get_fallback_response
+FALLBACK_INTENTS = [
+    ('complet', "Donne-moi toutes mes infos"),
+    ('profil', "Qui suis-je ?"),
+    ('recherche', "Quel est l'email de Martin"),
+    ('département', "Qui est dans le département IT ?"),
+    ('poste', "Quels employés ont un poste de manager ?"),
+    ('statistiques', "Statistiques par département"),
+    ('pdg', "Comment joindre le CEO ?"),
+    ('rh', "Contacts RH"),
+    ('manager', "Mon manager"),
+    ('congés', "Mes congés"),
+    ('maladie', "Arrêt maladie"),
+    ('salaire', "Mon salaire"),
+    ('horaires', "Mes horaires"),
+    ('formation', "Une formation"),
+    ('générique', "Bonjour"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Exécute les vues de l'API et les intentions du mode de secours sur un jeu de données "
+        "synthétique, analyse chaque requête SQL avec EXPLAIN QUERY PLAN et signale les scans "
+        "complets, index manquants et requêtes dupliquées"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=1000, help="Taille de l'organisation synthétique")
+        parser.add_argument('--messages', type=int, default=300, help="Messages dans le chat audité")
+        parser.add_argument('--max-queries', type=int, default=20, help="Requêtes maximum par scénario")
+        parser.add_argument(
+            '--max-missing-indexes',
+            type=int,
+            default=0,
+            help="Scans complets filtrés qu'un index éviterait, tolérés"
+        )
+        parser.add_argument(
+            '--max-full-scans',
+            type=int,
+            default=None,
+            help="Scans complets filtrés tolérés, y compris ceux qu'aucun index ne peut éviter (LIKE '%%…')"
+        )
+        parser.add_argument('--max-duplicates', type=int, default=0, help="Requêtes dupliquées tolérées par scénario")
+        parser.add_argument('--json', action='store_true', help="Affiche le rapport au format JSON")
+
+    def seed(self, options):
+        create_employees(options['employees'], seed=1)
+        # A second-level manager (department head) and one of the leaf employees
+        manager = CustomUser.objects.get(employee_id='E2')
+        employee = CustomUser.objects.get(employee_id=f"E{options['employees']}")
+        for user in (manager, employee):
+            for n in range(5):
+                chat = Chat.objects.create(user=user, title=f"Chat {n}")
+                Message.objects.bulk_create(
+                    Message(chat=chat, sender='user' if i % 2 == 0 else 'ai', content=f"Message {i}")
+                    for i in range(options['messages'])
+                )
+                chat.message_count = options['messages']
+                chat.save(update_fields=['message_count'])
+        return manager, employee
+
+    def scenarios(self, manager, employee):
+        from users.views import create_enhanced_message, get_fallback_response
+
+        client = api_client(manager)
+        chat = Chat.objects.filter(user=manager).first()
+        page = client.get(f'/api/chats/{chat.id}/messages/').json()
+        oldest = page['messages'][0]['cursor']
+        newest = page['messages'][-1]['cursor']
+        chats_page = client.get('/api/chats/', {'limit': 2}).json()
+
+        yield 'chat_view', lambda: client.get('/chat/')
+        yield 'get_chats', lambda: client.get('/api/chats/')
+        yield 'get_chats (page suivante)', lambda: client.get('/api/chats/', {'cursor': chats_page['next_cursor']})
+        yield 'create_chat', lambda: client.post('/api/chats/create/')
+        yield 'get_messages', lambda: client.get(f'/api/chats/{chat.id}/messages/')
+        yield 'get_messages (before)', lambda: client.get(f'/api/chats/{chat.id}/messages/', {'before': oldest})
+        yield 'get_messages (since)', lambda: client.get(f'/api/chats/{chat.id}/messages/', {'since': newest})
+        yield 'send_message', lambda: client.post(
+            f'/api/chats/{chat.id}/send/', json.dumps({'message': 'Mes congés'}), content_type='application/json'
+        )
+        # Steady state: the org chart is loaded (one full read of the employees) on first use only
+        client.get('/api/org/')
+        yield 'get_org_subtree', lambda: client.get('/api/org/', {'depth': 2})
+        doomed = Chat.objects.filter(user=manager).last()
+        yield 'delete_chat', lambda: client.delete(f'/api/chats/{doomed.id}/delete/')
+        yield 'delete_chats (all)', lambda: client.post(
+            '/api/chats/delete/', json.dumps({'all': True}), content_type='application/json'
+        )
+
+        # Each scenario gets a freshly loaded user, outside of the captured queries: relations
+        # cached on the instance by a previous scenario would hide its queries
+        for label, user in (('manager', manager), ('employé', employee)):
+            fresh = CustomUser.objects.get(pk=user.pk)
+            yield f'create_enhanced_message ({label})', lambda user=fresh: create_enhanced_message("Mon équipe", user)
+            for intent, question in FALLBACK_INTENTS:
+                fresh = CustomUser.objects.get(pk=user.pk)
+                yield (
+                    f'fallback {intent} ({label})',
+                    lambda user=fresh, question=question: get_fallback_response(question, user),
+                )
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def leading_wildcard(self, sql, plan_line):
+        """True if the WHERE clause filters the scanned table with LIKE '%…', which no index serves"""
+        match = re.match(r'SCAN (\w+)', plan_line)
+        if not match or ' WHERE ' not in sql:
+            return False
+        return bool(re.search(rf'"{match.group(1)}"\."\w+" LIKE \'%', sql.split(' WHERE ', 1)[1]))
+
+    def suggest_index(self, sql, plan_line):
+        """Columns of the scanned table that the WHERE clause filters on"""
+        match = re.match(r'SCAN (\w+)', plan_line)
+        if not match or ' WHERE ' not in sql or self.leading_wildcard(sql, plan_line):
+            return None
+        table = match.group(1)
+        where = sql.split(' WHERE ', 1)[1]
+        columns = []
+        for column in re.findall(rf'"{table}"\."(\w+)"\s*(?:=|IN\b|IS\b|<|>)', where):
+            if column not in columns:
+                columns.append(column)
+        if not columns:
+            return None
+        return f"{table}({', '.join(columns)})"
+
+    def analyze(self, label, queries):
+        sqls = [q['sql'] for q in queries if not q['sql'].lstrip().upper().startswith(SKIPPED_PREFIXES)]
+        duplicates = {sql: n for sql, n in Counter(sqls).items() if n > 1}
+        result = {
+            'scenario': label,
+            'queries': len(queries),
+            'duplicates': sum(n - 1 for n in duplicates.values()),
+            'full_scans': [],
+            'unfiltered_scans': 0,
+            'temp_sorts': 0,
+            'duplicate_statements': [{'sql': sql, 'count': n} for sql, n in duplicates.items()],
+        }
+        for sql in dict.fromkeys(sqls):
+            for line in self.explain(sql):
+                if line.startswith('USE TEMP B-TREE'):
+                    result['temp_sorts'] += 1
+                if not line.startswith('SCAN ') or 'CONSTANT ROW' in line:
+                    continue
+                # Listing a whole table (directory, statistics) is an expected scan
+                if ' WHERE ' not in sql:
+                    result['unfiltered_scans'] += 1
+                    continue
+                # SCAN … USING INDEX: every entry of the index is read, for its order or its columns
+                index = re.search(r'USING (?:COVERING )?INDEX (\w+)', line)
+                result['full_scans'].append({
+                    'plan': line,
+                    'sql': sql,
+                    'index': index.group(1) if index else None,
+                    'leading_wildcard': self.leading_wildcard(sql, line),
+                    'missing_index': self.suggest_index(sql, line),
+                })
+        return result
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("audit_queries s'appuie sur EXPLAIN QUERY PLAN de SQLite")
+
+        results = []
+        with isolated_database(), override_settings(
+            AZURE_AI_ENABLED=False, CHAT_PURGE_IN_BACKGROUND=False, TRACING_ENABLED=False
+        ):
+            manager, employee = self.seed(options)
+            for label, run in self.scenarios(manager, employee):
+                with CaptureQueriesContext(connection) as captured:
+                    run()
+                results.append(self.analyze(label, captured.captured_queries))
+
+        failures = []
+        for result in results:
+            if result['queries'] > options['max_queries']:
+                failures.append(f"{result['scenario']}: {result['queries']} requêtes (max {options['max_queries']})")
+            if result['duplicates'] > options['max_duplicates']:
+                failures.append(f"{result['scenario']}: {result['duplicates']} requêtes dupliquées")
+        scans = [scan for result in results for scan in result['full_scans']]
+        missing = [scan for scan in scans if scan['missing_index']]
+        if len(missing) > options['max_missing_indexes']:
+            failures.append(f"{len(missing)} scans complets évitables par un index (max {options['max_missing_indexes']})")
+        if options['max_full_scans'] is not None and len(scans) > options['max_full_scans']:
+            failures.append(f"{len(scans)} scans complets filtrés (max {options['max_full_scans']})")
+
+        if options['json']:
+            self.stdout.write(json.dumps({'results': results, 'failures': failures}, indent=2, ensure_ascii=False))
+        else:
+            self.print_report(results)
+
+        if failures:
+            for failure in failures:
+                self.stderr.write(self.style.ERROR(f"✗ {failure}"))
+            raise CommandError(f"Audit échoué: {len(failures)} seuil(s) dépassé(s)")
+        self.stdout.write(self.style.SUCCESS("✓ Audit réussi"))
+
+    def print_report(self, results):
+        self.stdout.write(f"{'Scénario':<42} {'Requêtes':>8} {'Doublons':>8} {'Scans':>6} {'Tris':>5}")
+        for result in results:
+            self.stdout.write(
+                f"{result['scenario']:<42} {result['queries']:>8} {result['duplicates']:>8} "
+                f"{len(result['full_scans']):>6} {result['temp_sorts']:>5}"
+            )
+
+        for result in results:
+            for scan in result['full_scans']:
+                self.stdout.write(self.style.WARNING(f"\n[{result['scenario']}] {scan['plan']}"))
+                self.stdout.write(f"  {scan['sql'][:300]}")
+                reason = "LIKE avec joker initial" if scan['leading_wildcard'] else "filtre non indexable"
+                if scan['missing_index']:
+                    self.stdout.write(f"  → index manquant: {scan['missing_index']}")
+                elif scan['index']:
+                    self.stdout.write(
+                        f"  → parcours complet de l'index {scan['index']}, utilisé pour l'ordre ou les colonnes "
+                        f"et non pour filtrer ({reason})"
+                    )
+                else:
+                    self.stdout.write(f"  → aucun index utilisable ({reason})")
+            for duplicate in result['duplicate_statements']:
+                self.stdout.write(self.style.WARNING(f"\n[{result['scenario']}] exécutée {duplicate['count']} fois"))
+                self.stdout.write(f"  {duplicate['sql'][:300]}")
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from users.search import FTS_TABLE, fts_available
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit l'index de recherche plein texte des messages (SQLite FTS5), "
+        "par lots pour ne pas bloquer les écritures"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20000, help="Messages indexés par transaction")
+
+    def handle(self, *args, **options):
+        if not fts_available(connection):
+            raise CommandError(
+                "Index plein texte absent: base non SQLite ou migration 0011 non appliquée"
+            )
+        batch_size = options['batch_size']
+        start = time.perf_counter()
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+
+        indexed = 0
+        last_id = 0
+        while True:
+            # Keyset pagination on the message id, each batch in its own short transaction
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT count(*), max(id) FROM "
+                    "(SELECT id FROM users_message WHERE id > %s ORDER BY id LIMIT %s)",
+                    [last_id, batch_size],
+                )
+                count, batch_last_id = cursor.fetchone()
+                if not count:
+                    break
+                cursor.execute(
+                    f"INSERT INTO {FTS_TABLE}(rowid, content, chat_user) "
+                    "SELECT id, content, chat_user FROM users_message_search WHERE id > %s AND id <= %s",
+                    [last_id, batch_last_id],
+                )
+                last_id = batch_last_id
+            indexed += count
+            self.stdout.write(f"  {indexed} messages indexés...")
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {indexed} messages indexés en {time.perf_counter() - start:.1f} s"
+        ))
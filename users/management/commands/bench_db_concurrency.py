@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection, connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from users.benchmarking import api_client, isolated_database, run_concurrently, summarize, is_lock_error
+from users.models import CustomUser, Chat, Message
+import json
+import random
+import threading
+import time
+
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'BEGIN')
+
+
+class Command(BaseCommand):
+    help = (
+        "Charge l'API de chat avec un mélange de lectures et d'écritures concurrentes et compare "
+        "le temps d'attente des verrous SQLite sans et avec le profil de base de données de production"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=16, help="Nombre de clients concurrents")
+        parser.add_argument('--requests', type=int, default=50, help="Requêtes envoyées par client")
+        parser.add_argument('--write-ratio', type=float, default=0.2, help="Part des requêtes send_message")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def baseline_profile(self):
+        """SQLite as configured before the production profile: no pragmas, no connection reuse"""
+        return {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': {}}
+
+    def tuned_profile(self):
+        db = settings.DATABASES['default']
+        return {
+            'CONN_MAX_AGE': db.get('CONN_MAX_AGE', 0),
+            'CONN_HEALTH_CHECKS': db.get('CONN_HEALTH_CHECKS', False),
+            'OPTIONS': dict(db.get('OPTIONS', {})),
+        }
+
+    def seed_data(self, clients, rng):
+        users = []
+        for i in range(clients):
+            user = CustomUser.objects.create_user(username=f"bench{i}", password='bench', first_name=f"Bench{i}")
+            chat = Chat.objects.create(user=user, title=f"Chat {i}")
+            Message.objects.bulk_create(
+                Message(chat=chat, sender='user' if n % 2 == 0 else 'ai', content=f"Message {n} " * rng.randint(1, 20))
+                for n in range(100)
+            )
+            users.append((user, chat.id))
+        return users
+
+    def run_profile(self, name, profile, options):
+        db = connections['default'].settings_dict
+        db.update({key: value for key, value in profile.items() if key != 'OPTIONS'})
+        db['OPTIONS'] = profile['OPTIONS']
+
+        rng = random.Random(options['seed'])
+        lock = threading.Lock()
+        latencies = {'get_chats': [], 'get_messages': [], 'send_message': []}
+        lock_waits = []
+        lock_errors = [0]
+        server_errors = [0]
+        new_connections = [0]
+
+        def on_connection_created(sender, **kwargs):
+            with lock:
+                new_connections[0] += 1
+
+        with isolated_database():
+            users = self.seed_data(options['clients'], rng)
+            connection_created.connect(on_connection_created)
+
+            def timed_writes(execute, sql, params, many, context):
+                if not sql.lstrip().upper().startswith(WRITE_PREFIXES):
+                    return execute(sql, params, many, context)
+                start = time.perf_counter()
+                try:
+                    return execute(sql, params, many, context)
+                except OperationalError as e:
+                    if is_lock_error(e):
+                        with lock:
+                            lock_errors[0] += 1
+                    raise
+                finally:
+                    with lock:
+                        lock_waits.append(time.perf_counter() - start)
+
+            def worker(index):
+                user, chat_id = users[index]
+                client = api_client(user)
+                worker_rng = random.Random(options['seed'] + index)
+                with connection.execute_wrapper(timed_writes):
+                    for n in range(options['requests']):
+                        roll = worker_rng.random()
+                        start = time.perf_counter()
+                        if roll < options['write_ratio']:
+                            endpoint = 'send_message'
+                            response = client.post(
+                                f'/api/chats/{chat_id}/send/',
+                                json.dumps({'message': 'Combien de congés me reste-t-il ?'}),
+                                content_type='application/json',
+                            )
+                        elif roll < options['write_ratio'] + (1 - options['write_ratio']) / 3:
+                            endpoint = 'get_chats'
+                            response = client.get('/api/chats/')
+                        else:
+                            endpoint = 'get_messages'
+                            response = client.get(f'/api/chats/{chat_id}/messages/')
+                        # The test client skips the end-of-request connection handling of
+                        # the WSGI handler, apply it so CONN_MAX_AGE behaves as in production
+                        close_old_connections()
+                        elapsed = time.perf_counter() - start
+                        with lock:
+                            latencies[endpoint].append(elapsed)
+                            if response.status_code >= 500:
+                                server_errors[0] += 1
+
+            with override_settings(AZURE_AI_ENABLED=False):
+                wall = run_concurrently(worker, options['clients'])
+            connection_created.disconnect(on_connection_created)
+
+        total = sum(len(values) for values in latencies.values())
+        waits = summarize(lock_waits)
+        self.stdout.write(self.style.SUCCESS(f"\n=== {name} ==="))
+        self.stdout.write(f"Requêtes: {total} en {wall:.2f}s ({total / wall:.1f} req/s)")
+        for endpoint, values in latencies.items():
+            stats = summarize(values)
+            self.stdout.write(
+                f"  {endpoint:<13} n={stats['count']:<5} p50 {stats['p50_ms']:.1f} ms  "
+                f"p95 {stats['p95_ms']:.1f} ms  p99 {stats['p99_ms']:.1f} ms"
+            )
+        self.stdout.write(
+            f"Attente verrou (écritures): total {sum(lock_waits):.2f}s, "
+            f"p95 {waits['p95_ms']:.1f} ms, max {waits['max_ms']:.1f} ms"
+        )
+        self.stdout.write(f"Nouvelles connexions: {new_connections[0]}")
+        style = self.style.ERROR if lock_errors[0] or server_errors[0] else self.style.SUCCESS
+        self.stdout.write(style(f"Erreurs 'database is locked': {lock_errors[0]}, réponses 5xx: {server_errors[0]}"))
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            self.stdout.write(self.style.WARNING("Ce benchmark compare des profils SQLite, base actuelle ignorée"))
+            return
+
+        db = connections['default'].settings_dict
+        original = {key: db.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'OPTIONS')}
+        # Both profiles are built before the settings dict gets modified by the first run
+        profiles = [
+            ('sans profil (avant)', self.baseline_profile()),
+            ('profil production (après)', self.tuned_profile()),
+        ]
+        try:
+            for name, profile in profiles:
+                self.run_profile(name, profile, options)
+        finally:
+            db.update(original)
@@ -0,0 +1,66 @@
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from users.benchmarking import isolated_database
+from users.models import CustomUser
+from users.synthetic import write_hr_csv
+import os
+import resource
+import tempfile
+import time
+
+
+class Command(BaseCommand):
+    help = "Mesure import_hr_data sur un extrait RH synthétique (import initial puis réimport)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help="Nombre de lignes du CSV généré")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Lignes écrites par transaction")
+        parser.add_argument('--workers', type=int, default=None, help="Processus de conversion (défaut: automatique)")
+
+    def run_import(self, label, path, options):
+        output = StringIO()
+        executed = [0]
+
+        # Counting statements without keeping them, CaptureQueriesContext would hold every batch in memory
+        def count_statements(execute, sql, params, many, context):
+            executed[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_statements):
+            start = time.perf_counter()
+            call_command(
+                'import_hr_data', file=path, batch_size=options['batch_size'], workers=options['workers'], stdout=output
+            )
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{label:<12} {elapsed:>8.2f} s {options['rows'] / elapsed:>10.0f} lignes/s "
+            f"{executed[0]:>8} requêtes "
+            f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:>8.0f} Mo max"
+        )
+
+    def handle(self, *args, **options):
+        tmpdir = tempfile.mkdtemp(prefix='hrbot-import-')
+        path = os.path.join(tmpdir, 'hr_extract.csv')
+        try:
+            start = time.perf_counter()
+            write_hr_csv(path, options['rows'], seed=1)
+            self.stdout.write(
+                f"CSV généré: {options['rows']} lignes, {os.path.getsize(path) / 1e6:.1f} Mo "
+                f"en {time.perf_counter() - start:.1f} s"
+            )
+
+            with isolated_database():
+                self.run_import('initial', path, options)
+                self.run_import('réimport', path, options)
+                imported = CustomUser.objects.exclude(org_path='').count()
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+            os.rmdir(tmpdir)
+
+        if imported != options['rows']:
+            self.stderr.write(self.style.ERROR(f"✗ {imported} employés rattachés à la hiérarchie sur {options['rows']}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✓ {imported} employés importés et rattachés à la hiérarchie"))
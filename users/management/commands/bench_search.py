@@ -0,0 +1,103 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from users.benchmarking import isolated_database, summarize
+from users.models import CustomUser, Chat, Message
+from users.search import fts_available, matching_message_ids_sql, search_messages
+import random
+import time
+
+VOCABULARY = (
+    "congés maladie salaire prime évaluation mutuelle télétravail formation badge parking "
+    "planning horaires contrat avenant démission rupture préavis mission frais note remboursement "
+    "entretien objectifs manager équipe recrutement période essai attestation employeur fiche paie "
+    "virement retard absence justificatif médecin arrêt travail accident trajet repos compensateur"
+).split()
+# Rare words, each in about one message in a thousand
+RARE_WORDS = ['sabbatique', 'expatriation', 'intéressement', 'astreinte', 'détachement']
+
+
+class Command(BaseCommand):
+    help = "Compare la recherche plein texte (FTS5) aux recherches icontains sur un gros historique"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000000, help="Messages générés")
+        parser.add_argument('--users', type=int, default=500, help="Utilisateurs (5 conversations chacun)")
+        parser.add_argument('--queries', type=int, default=50, help="Recherches mesurées par méthode")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def populate(self, options, rng):
+        users = CustomUser.objects.bulk_create(
+            CustomUser(username=f"search-{i}", password='!') for i in range(options['users'])
+        )
+        chats = Chat.objects.bulk_create(
+            Chat(user=user, title=f"Conversation {n}") for user in users for n in range(5)
+        )
+        chat_ids = [chat.id for chat in chats]
+        now = timezone.now()
+        batch = 20000
+        sql = f"INSERT INTO {Message._meta.db_table} (chat_id, sender, content, created_at) VALUES (%s, %s, %s, %s)"
+        for offset in range(0, options['messages'], batch):
+            rows = []
+            for _ in range(min(batch, options['messages'] - offset)):
+                words = rng.choices(VOCABULARY, k=rng.randint(8, 40))
+                if rng.random() < 0.001:
+                    words.insert(rng.randrange(len(words)), rng.choice(RARE_WORDS))
+                rows.append((rng.choice(chat_ids), rng.choice(('user', 'ai')), ' '.join(words), now))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+        return users
+
+    def measure(self, queries, search):
+        durations = []
+        for user, query in queries:
+            start = time.perf_counter()
+            search(user, query)
+            durations.append(time.perf_counter() - start)
+        return summarize(durations)
+
+    def report(self, label, stats):
+        self.stdout.write(
+            f"{label:<34} p50 {stats['p50_ms']:8.1f} ms   p95 {stats['p95_ms']:8.1f} ms   max {stats['max_ms']:8.1f} ms"
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with isolated_database():
+            if not fts_available(connection):
+                self.stdout.write(self.style.ERROR("Index FTS5 indisponible sur cette base"))
+                return
+
+            start = time.perf_counter()
+            users = self.populate(options, rng)
+            self.stdout.write(
+                f"{options['messages']} messages indexés en {time.perf_counter() - start:.1f} s "
+                f"({options['users']} utilisateurs)"
+            )
+
+            # Frequent words match early in a LIKE scan, rare words and prefixes force a full scan
+            workloads = {
+                'mots fréquents': VOCABULARY,
+                'mots rares / préfixes': RARE_WORDS + [word[:5] for word in RARE_WORDS],
+            }
+
+            def icontains(user, query):
+                return list(
+                    Message.objects.filter(chat__user=user, content__icontains=query)
+                    .order_by('-created_at').values('id', 'chat_id', 'content')[:20]
+                )
+
+            def admin_icontains(user, query):
+                return Message.objects.filter(content__icontains=query).count()
+
+            def admin_fts(user, query):
+                return Message.objects.filter(id__in=RawSQL(*matching_message_ids_sql(query))).count()
+
+            for workload, terms in workloads.items():
+                queries = [(rng.choice(users), rng.choice(terms)) for _ in range(options['queries'])]
+                self.stdout.write(self.style.SUCCESS(f"\n=== {workload} ==="))
+                self.report("utilisateur, FTS5 classé", self.measure(queries, search_messages))
+                self.report("utilisateur, icontains", self.measure(queries, icontains))
+                self.report("admin (comptage), FTS5", self.measure(queries, admin_fts))
+                self.report("admin (comptage), icontains", self.measure(queries, admin_icontains))
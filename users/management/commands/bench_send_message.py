@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from users.benchmarking import isolated_database, run_concurrently, summarize, is_lock_error
+from users.models import CustomUser, Chat, Message
+import threading
+import time
+
+
+class Command(BaseCommand):
+    help = "Mesure la contention d'écriture de send_message avec plusieurs expéditeurs concurrents"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--senders', type=int, default=8, help="Nombre d'expéditeurs concurrents")
+        parser.add_argument('--messages', type=int, default=20, help="Messages envoyés par expéditeur")
+        parser.add_argument(
+            '--ai-latency',
+            type=float,
+            default=0.05,
+            help="Durée simulée de la réponse de l'IA, en secondes"
+        )
+        parser.add_argument(
+            '--mode',
+            choices=['legacy', 'current', 'both'],
+            default='both',
+            help="legacy: ancienne séquence d'écritures, current: add_user_message/add_ai_reply"
+        )
+
+    def legacy_exchange(self, chat, text, ai_latency):
+        """Statement sequence of send_message before the persistence rework"""
+        Message.objects.create(chat=chat, sender='user', content=text)
+        if chat.messages.count() == 1:
+            chat.title = self.generate_chat_title(text)
+            chat.save()
+        time.sleep(ai_latency)
+        Message.objects.create(chat=chat, sender='ai', content=f"Réponse à: {text}")
+        chat.save()
+
+    def current_exchange(self, chat, text, ai_latency):
+        is_first_message = chat.message_count == 0
+        chat.add_user_message(text)
+        time.sleep(ai_latency)
+        title = self.generate_chat_title(text) if is_first_message else None
+        chat.add_ai_reply(f"Réponse à: {text}", title=title)
+
+    def run_mode(self, mode, options):
+        senders = options['senders']
+        exchange = self.legacy_exchange if mode == 'legacy' else self.current_exchange
+        chats = [
+            Chat.objects.create(user=CustomUser.objects.create(username=f"bench-{mode}-{i}"))
+            for i in range(senders)
+        ]
+
+        lock = threading.Lock()
+        write_times = []
+        statements = []
+        lock_errors = [0]
+
+        def sender(index):
+            chat = Chat.objects.get(pk=chats[index].pk)
+            executed = [0]
+
+            def count_statements(execute, sql, params, many, context):
+                executed[0] += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_statements):
+                for n in range(options['messages']):
+                    executed[0] = 0
+                    start = time.perf_counter()
+                    try:
+                        exchange(chat, f"Combien de jours de congés me reste-t-il ? #{n}", options['ai_latency'])
+                    except OperationalError as e:
+                        if not is_lock_error(e):
+                            raise
+                        with lock:
+                            lock_errors[0] += 1
+                        continue
+                    elapsed = time.perf_counter() - start - options['ai_latency']
+                    with lock:
+                        write_times.append(elapsed)
+                        statements.append(executed[0])
+
+        wall = run_concurrently(sender, senders)
+        stats = summarize(write_times)
+        total = senders * options['messages']
+
+        self.stdout.write(self.style.SUCCESS(f"\n=== {mode} ==="))
+        self.stdout.write(f"Échanges réussis: {stats['count']}/{total} en {wall:.2f}s ({stats['count'] / wall:.1f}/s)")
+        self.stdout.write(f"Requêtes SQL par échange: {sum(statements) / max(len(statements), 1):.1f}")
+        self.stdout.write(
+            f"Temps d'écriture par échange: moyenne {stats['mean_ms']:.1f} ms, "
+            f"p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, max {stats['max_ms']:.1f} ms"
+        )
+        if lock_errors[0]:
+            self.stdout.write(self.style.ERROR(f"Erreurs 'database is locked': {lock_errors[0]}"))
+        else:
+            self.stdout.write("Erreurs 'database is locked': 0")
+
+    def handle(self, *args, **options):
+        from users.views import generate_chat_title
+        self.generate_chat_title = generate_chat_title
+
+        modes = ['legacy', 'current'] if options['mode'] == 'both' else [options['mode']]
+        self.stdout.write(
+            f"{options['senders']} expéditeurs x {options['messages']} messages, "
+            f"latence IA simulée {options['ai_latency'] * 1000:.0f} ms"
+        )
+        with isolated_database():
+            for mode in modes:
+                self.run_mode(mode, options)
@@ -0,0 +1,109 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from users.bulk import update_rows
+from users.models import CustomUser
+from users.orgchart import invalidate_org_chart
+import sys
+import time
+
+# Simplifications listed before confirmation and by --dry-run, the others are only counted
+PREVIEW_MAX_LINES = 50
+
+
+def has_composed_name(first_name, last_name):
+    """
+    Check if a name is composed (multiple first names or last names)
+    """
+    first_name = first_name or ""
+    last_name = last_name or ""
+
+    # Check for multiple first names or last names (spaces)
+    if len(first_name.split()) > 1 or len(last_name.split()) > 1:
+        return True
+
+    # Check for hyphenated names
+    return '-' in first_name or '-' in last_name
+
+
+def simplify_name(name):
+    """
+    Simplify a composed name to just the first part
+    """
+    if not name:
+        return name
+
+    # Split by spaces and hyphens
+    parts = name.replace('-', ' ').split()
+
+    # Return just the first part
+    return parts[0] if parts else name
+
+
+class Command(BaseCommand):
+    help = (
+        "Simplifie les noms composés des employés (premier prénom, premier nom) "
+        "pour faciliter le formatage des réponses de l'IA"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--yes', action='store_true', help="Applique les changements sans confirmation")
+        parser.add_argument('--dry-run', action='store_true', help="Affiche les changements sans rien écrire")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Employés écrits par transaction")
+
+    def simplifications(self, batch_size):
+        """Yield (pk, employee, old first, old last, new first, new last) for every composed name"""
+        # Names without a space or a hyphen cannot be composed, the database skips them
+        candidates = CustomUser.objects.filter(
+            Q(first_name__contains=' ') | Q(first_name__contains='-')
+            | Q(last_name__contains=' ') | Q(last_name__contains='-')
+        ).values_list('pk', 'employee_id', 'first_name', 'last_name').order_by('pk')
+        for pk, employee_id, first_name, last_name in candidates.iterator(chunk_size=batch_size):
+            if has_composed_name(first_name, last_name):
+                yield (
+                    pk, employee_id or pk, first_name, last_name,
+                    simplify_name(first_name), simplify_name(last_name),
+                )
+
+    def preview(self, batch_size):
+        count = 0
+        for _, employee, old_first, old_last, new_first, new_last in self.simplifications(batch_size):
+            count += 1
+            if count <= PREVIEW_MAX_LINES:
+                self.stdout.write(f"  - {old_first} {old_last} → {new_first} {new_last} ({employee})")
+        if count > PREVIEW_MAX_LINES:
+            self.stdout.write(f"  … {count - PREVIEW_MAX_LINES} autres")
+        return count
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        start = time.perf_counter()
+
+        if options['dry_run'] or not options['yes']:
+            count = self.preview(batch_size)
+            if not count:
+                self.stdout.write(self.style.SUCCESS("✓ Aucun nom composé, rien à faire"))
+                return
+            self.stdout.write(f"\n{count} employés ont un nom composé")
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING("Simulation: aucun changement écrit"))
+                return
+            if not sys.stdin.isatty():
+                raise CommandError("Confirmation impossible sans terminal, relancez avec --yes")
+            if input("Simplifier ces noms ? Tapez 'YES' pour confirmer : ") != 'YES':
+                self.stdout.write(self.style.WARNING("Opération annulée"))
+                return
+            start = time.perf_counter()
+
+        # Read in chunks, write the name columns only, one transaction per batch
+        updated = update_rows(
+            CustomUser,
+            ['first_name', 'last_name'],
+            ((pk, new_first, new_last) for pk, _, _, _, new_first, new_last in self.simplifications(batch_size)),
+            batch_size=batch_size,
+        )
+        if updated:
+            invalidate_org_chart()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {updated} noms simplifiés en {time.perf_counter() - start:.1f} s"
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from users.exports import EXPORTS, FORMATS, export_filename, export_stream
+import sys
+import time
+
+
+class Command(BaseCommand):
+    help = "Exporte l'annuaire (format compatible avec import_hr_data), les chats ou les messages en CSV ou JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS), help="Données à exporter")
+        parser.add_argument('--format', choices=FORMATS, default='csv', help="Format de sortie")
+        parser.add_argument('--gzip', action='store_true', help="Compresse la sortie au format gzip")
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=None,
+            help="Fichier de sortie ('-' pour la sortie standard, défaut: <type>.<format>[.gz])"
+        )
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        output = options['output'] or export_filename(kind, options['format'], options['gzip'])
+
+        start = time.perf_counter()
+        written = 0
+        target = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            for data in export_stream(kind, options['format'], options['gzip']):
+                target.write(data)
+                written += len(data)
+        finally:
+            if output == '-':
+                target.flush()
+            else:
+                target.close()
+
+        if output != '-':
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Export {kind} écrit dans {output} ({written / 1e6:.1f} Mo en {time.perf_counter() - start:.1f} s)"
+            ))
@@ -0,0 +1,77 @@
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from users.models import CustomUser
+from users.orgchart import invalidate_org_chart
+from users.synthetic import create_chats, create_employees, employee_id, write_hr_csv
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = "Génère une organisation RH synthétique et reproductible, en base ou au format CSV d'import_hr_data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=1000, help="Nombre d'employés")
+        parser.add_argument('--seed', type=int, default=0, help="Graine: une même graine donne la même organisation")
+        parser.add_argument('--span', type=int, default=6, help="Nombre moyen de subordonnés directs par manager")
+        parser.add_argument(
+            '--csv',
+            help="Écrire un extrait RH (format import_hr_data) dans ce fichier au lieu de la base"
+        )
+        parser.add_argument(
+            '--password',
+            help="Mot de passe de tous les employés générés (par défaut: connexion impossible)"
+        )
+        parser.add_argument(
+            '--chats-per-user',
+            type=float,
+            default=0,
+            help="Nombre moyen de conversations générées par employé (base uniquement)"
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help="Lignes écrites par transaction")
+
+    def handle(self, *args, **options):
+        count = options['employees']
+        if count < 1 or options['span'] < 1:
+            raise CommandError("--employees et --span doivent être positifs")
+        start = time.perf_counter()
+
+        if options['csv']:
+            if options['chats_per_user'] or options['password']:
+                raise CommandError("--chats-per-user et --password ne s'appliquent qu'à la génération en base")
+            write_hr_csv(options['csv'], count, seed=options['seed'], span=options['span'])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ {count} employés écrits dans {options['csv']} "
+                f"({os.path.getsize(options['csv']) / 1e6:.1f} Mo) en {elapsed:.1f} s"
+            ))
+            return
+
+        if CustomUser.objects.filter(employee_id=employee_id(0)).exists():
+            raise CommandError(
+                f"L'employé {employee_id(0)} existe déjà: générez dans une base vide (SQLITE_PATH) "
+                f"ou passez par --csv et import_hr_data"
+            )
+        password = make_password(options['password']) if options['password'] else '!'
+        last_pk = CustomUser.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        created = create_employees(
+            count, seed=options['seed'], span=options['span'], password=password, batch_size=options['batch_size']
+        )
+        invalidate_org_chart()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {created} employés créés en {elapsed:.1f} s ({created / elapsed:.0f}/s)"
+        ))
+
+        if options['chats_per_user']:
+            start = time.perf_counter()
+            user_ids = CustomUser.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)
+            chats, messages = create_chats(
+                user_ids.iterator(chunk_size=options['batch_size']),
+                options['chats_per_user'],
+                seed=options['seed'],
+                batch_size=options['batch_size'],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ {chats} conversations et {messages} messages créés en {time.perf_counter() - start:.1f} s"
+            ))
@@ -1,9 +1,29 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.hashers import make_password
-from users.models import CustomUser
-import csv
+from django.db import DataError, IntegrityError, reset_queries, transaction
+from users.bulk import update_rows
+from users.hr_import import ExtractDecodeError, parse_chunks, sniff
+from users.models import CustomUser, rebuild_org_paths
+from users.orgchart import invalidate_org_chart
+from collections import defaultdict
 import os
-from datetime import datetime
+import time
+
+# Columns written from the CSV, on creation and on every re-import
+IMPORTED_FIELDS = [
+    'email', 'first_name', 'last_name', 'departement', 'is_manager', 'poste', 'date_embauche',
+    'conges_droit_annuel', 'conges_utilises', 'conges_planifies', 'conges_restants',
+    'conges_maladie_droit', 'conges_maladie_utilises', 'conges_maladie_restants',
+    'salaire', 'eligible_prime', 'date_prochaine_evaluation', 'regime_sante',
+]
+
+# Below this size the file is parsed in-process, starting a pool would cost more than it saves
+PARALLEL_MIN_FILE_SIZE = 4 * 1024 * 1024
+# Progress line every N written batches
+PROGRESS_EVERY = 10
+# Changes listed by --dry-run, the others are only counted
+DRY_RUN_MAX_LINES = 200
+
 
 class Command(BaseCommand):
     help = 'Importe les données RH depuis le fichier CSV'
@@ -21,182 +41,331 @@ class Command(BaseCommand):
             default='test',
             help='Mot de passe par défaut pour tous les utilisateurs'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Nombre de lignes écrites par transaction'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Processus de conversion des lignes (défaut: un par cœur pour les gros fichiers, 1 sinon)'
+        )
+        parser.add_argument(
+            '--deactivate-missing',
+            action='store_true',
+            help='Désactive les employés absents du fichier (et réactive ceux qui y réapparaissent)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Affiche les changements qu'apporterait l'import sans rien écrire"
+        )
 
-    def parse_date(self, date_string):
-        """Parse une date au format DD/MM/YYYY"""
-        if not date_string or date_string.strip() == '':
-            return None
+    def write_batch(self, to_create, updates):
+        """
+        Écrit un lot dans une seule transaction: ``to_create`` sont des
+        CustomUser à insérer, ``updates`` des (employé, pk, {champ: valeur}).
+        Si le lot est refusé (contrainte d'unicité...), il est rejoué ligne par
+        ligne pour isoler les lignes fautives.
+        Retourne les employee_id qui n'ont pas pu être écrits.
+        """
+        # One executemany per set of changed columns
+        groups = defaultdict(list)
+        for _, pk, values in updates:
+            groups[tuple(values)].append((pk, *values.values()))
         try:
-            return datetime.strptime(date_string.strip(), '%d/%m/%Y').date()
-        except ValueError:
-            self.stdout.write(
-                self.style.WARNING(f"Erreur de format de date: {date_string}")
-            )
-            return None
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(to_create)
+                for fields, rows in groups.items():
+                    update_rows(CustomUser, fields, rows, batch_size=len(rows))
+            return set()
+        except (IntegrityError, DataError):
+            # IDs handed out by the rolled back insert are void
+            for user in to_create:
+                user.pk = None
 
-    def parse_float(self, value):
-        """Parse un float avec gestion des erreurs"""
-        if not value or value.strip() == '':
-            return 0.0
-        try:
-            return float(value.replace(',', '.'))
-        except ValueError:
-            self.stdout.write(
-                self.style.WARNING(f"Erreur de format numérique: {value}")
-            )
-            return 0.0
+        failed = set()
+        for user in to_create:
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+            except (IntegrityError, DataError) as e:
+                failed.add(user.employee_id)
+                self.stdout.write(self.style.ERROR(f"✗ Erreur (ID: {user.employee_id}): {str(e)}"))
+        for employee_id, pk, values in updates:
+            try:
+                with transaction.atomic():
+                    CustomUser.objects.filter(pk=pk).update(**values)
+            except (IntegrityError, DataError) as e:
+                failed.add(employee_id)
+                self.stdout.write(self.style.ERROR(f"✗ Erreur (ID: {employee_id}): {str(e)}"))
+        return failed
+
+    def report_change(self, line):
+        """Ligne du rapport --dry-run, tronqué au-delà de DRY_RUN_MAX_LINES"""
+        if not self.dry_run:
+            return
+        self.change_count += 1
+        if len(self.changes) < DRY_RUN_MAX_LINES:
+            self.changes.append(line)
+
+    def import_chunk(self, records, password_hash, deferred):
+        """
+        Crée les nouveaux employés d'un lot et met à jour les colonnes modifiées
+        des autres, puis les rattache à leur responsable. Les lignes identiques
+        au dernier import (même empreinte) ne sont pas écrites. Les responsables
+        qui n'existent pas encore (plus loin dans le fichier) sont mis de côté
+        dans ``deferred``.
+        Retourne (créés, mis à jour, inchangés, erreurs).
+        """
+        # The last row wins when an employee appears twice in the chunk
+        rows = {employee_id: (manager_id, fields, digest) for employee_id, manager_id, fields, digest in records}
+        if self.deactivate_missing:
+            self.seen.update(rows)
+        lookup = set(rows) | {manager_id for manager_id, _, _ in rows.values() if manager_id}
+        known = {
+            employee_id: (pk, responsable_id, source_hash, is_active)
+            for employee_id, pk, responsable_id, source_hash, is_active in CustomUser.objects.filter(
+                employee_id__in=lookup
+            ).values_list('employee_id', 'pk', 'responsable_id', 'hr_source_hash', 'is_active')
+        }
+        # Nothing is written during a dry run: employees it would create count as existing
+        for employee_id in lookup & self.planned:
+            known.setdefault(employee_id, (None, None, '', True))
+
+        to_create = []
+        changed = {}
+        unchanged = 0
+        for employee_id, (manager_id, fields, digest) in rows.items():
+            if employee_id not in known:
+                # Linked on insert when the manager is already in the database
+                manager_pk = known[manager_id][0] if manager_id in known else None
+                to_create.append(CustomUser(
+                    employee_id=employee_id, username=employee_id, password=password_hash,
+                    responsable_id=manager_id if manager_pk else None, hr_source_hash=digest, **fields
+                ))
+                continue
+            pk, _, source_hash, is_active = known[employee_id]
+            reactivate = self.deactivate_missing and not is_active
+            if source_hash == digest and not reactivate:
+                unchanged += 1
+                continue
+            changed[pk] = (employee_id, fields, digest, reactivate)
 
-    def parse_boolean(self, value):
-        """Parse un booléen depuis le CSV"""
-        if not value:
-            return False
-        value = value.strip().upper()
-        return value in ['OUI', 'VRAI', 'TRUE', '1', 'YES']
+        # Only the columns whose value differs are written
+        updates = []
+        current_values = {}
+        if changed:
+            queryset = CustomUser.objects.filter(pk__in=[pk for pk in changed if pk]).values('pk', *IMPORTED_FIELDS)
+            for values in queryset:
+                current_values[values.pop('pk')] = values
+        for pk, (employee_id, fields, digest, reactivate) in changed.items():
+            current = current_values.get(pk, {})
+            values = {name: value for name, value in fields.items() if current.get(name) != value}
+            if reactivate:
+                values['is_active'] = True
+            if self.dry_run and values:
+                diff = ', '.join(f"{name}: {current.get(name, False)!r} → {value!r}" for name, value in values.items())
+                self.report_change(f"~ {employee_id}: {diff}")
+            values['hr_source_hash'] = digest
+            updates.append((employee_id, pk, values))
+
+        if self.dry_run:
+            failed = set()
+            for user in to_create:
+                self.planned.add(user.employee_id)
+                self.report_change(f"+ {user.employee_id}: {user.first_name} {user.last_name}")
+        else:
+            failed = self.write_batch(to_create, updates)
+            for user in to_create:
+                if user.employee_id not in failed:
+                    known[user.employee_id] = (user.pk, user.responsable_id, '', True)
+
+        # Liens hiérarchiques des lignes créées ou modifiées
+        links = []
+        for employee_id, (manager_id, _, _) in rows.items():
+            if employee_id in failed or employee_id not in known:
+                continue
+            pk, current, source_hash, _ = known[employee_id]
+            if pk in changed or employee_id in self.planned or not source_hash:
+                if manager_id and manager_id not in known:
+                    deferred[employee_id] = (pk, current, manager_id)
+                elif current != manager_id:
+                    links.append((pk, manager_id))
+                    if employee_id not in self.planned:
+                        self.report_change(f"~ {employee_id}: responsable: {current!r} → {manager_id!r}")
+        if not self.dry_run:
+            update_rows(CustomUser, ['responsable'], links)
+        self.links += len(links)
+
+        failed_creates = sum(1 for user in to_create if user.employee_id in failed)
+        return (
+            len(to_create) - failed_creates,
+            len(updates) - (len(failed) - failed_creates),
+            unchanged,
+            len(failed),
+        )
+
+    def link_deferred(self, deferred, batch_size):
+        """Rattache les employés dont le responsable apparaissait après eux dans le fichier"""
+        links = []
+        unknown = []
+        items = list(deferred.items())
+        for start in range(0, len(items), batch_size):
+            chunk = items[start:start + batch_size]
+            managers = {manager_id for _, (_, _, manager_id) in chunk}
+            existing = set(CustomUser.objects.filter(employee_id__in=managers).values_list('employee_id', flat=True))
+            existing |= managers & self.planned
+            for employee_id, (pk, current, manager_id) in chunk:
+                if manager_id not in existing:
+                    unknown.append((employee_id, pk, manager_id))
+                    manager_id = None
+                if current != manager_id:
+                    links.append((pk, manager_id))
+                    if employee_id not in self.planned:
+                        self.report_change(f"~ {employee_id}: responsable: {current!r} → {manager_id!r}")
+        if not self.dry_run:
+            update_rows(CustomUser, ['responsable'], links, batch_size)
+            # Forget the digest so that the link is retried once the manager is in the extract
+            update_rows(CustomUser, ['hr_source_hash'], ((pk, '') for _, pk, _ in unknown), batch_size)
+        self.links += len(links)
+        return [f"{manager_id} ({employee_id})" for employee_id, _, manager_id in unknown]
+
+    def deactivate_missing_employees(self, batch_size):
+        """Désactive les employés actifs absents du fichier (hors superutilisateurs)"""
+        missing = []
+        active = CustomUser.objects.filter(
+            is_active=True, is_superuser=False, employee_id__isnull=False
+        ).values_list('pk', 'employee_id')
+        for pk, employee_id in active.iterator(chunk_size=batch_size):
+            if employee_id not in self.seen:
+                missing.append((pk, employee_id))
+        for _, employee_id in missing:
+            self.report_change(f"- {employee_id}: désactivé")
+        if not self.dry_run:
+            update_rows(CustomUser, ['is_active'], ((pk, False) for pk, _ in missing), batch_size)
+        return len(missing)
 
     def handle(self, *args, **options):
         csv_file_path = options['file']
         default_password = options['password']
+        batch_size = options['batch_size']
         
         if not os.path.exists(csv_file_path):
             self.stdout.write(
                 self.style.ERROR(f"Erreur: Le fichier {csv_file_path} n'existe pas")
             )
             return
+
+        workers = options['workers']
+        if workers is None:
+            workers = os.cpu_count() if os.path.getsize(csv_file_path) >= PARALLEL_MIN_FILE_SIZE else 1
         
+        self.dry_run = options['dry_run']
+        self.deactivate_missing = options['deactivate_missing']
+        # Employee IDs found in the file, to deactivate the others
+        self.seen = set()
+        # Employees a dry run would create
+        self.planned = set()
+        self.changes = []
+        self.change_count = 0
+        self.links = 0
         created_count = 0
         updated_count = 0
+        unchanged_count = 0
         error_count = 0
+        rows_read = 0
+        issues = {}
+        # Employees whose manager had not been imported yet when their chunk was written
+        deferred = {}
+        # PBKDF2 is slow on purpose: every new user gets the same hash of the default password
+        password_hash = make_password(default_password)
+        regimes = [code for code, _ in CustomUser.REGIME_SANTE_CHOICES]
         
         self.stdout.write("Début de l'importation des données CSV...")
+        encoding, dialect = sniff(csv_file_path)
+        self.stdout.write(
+            f"Fichier ouvert avec l'encodage: {encoding} (séparateur '{dialect.delimiter}', {workers} processus)"
+        )
         
-        # Try different encodings
-        encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-        csvfile = None
-        used_encoding = None
-        
-        for encoding in encodings:
-            try:
-                csvfile = open(csv_file_path, 'r', encoding=encoding)
-                csvfile.read(100)  # Test read
-                csvfile.seek(0)  # Reset position
-                used_encoding = encoding
-                break
-            except UnicodeDecodeError:
-                if csvfile:
-                    csvfile.close()
-                continue
+        start = time.perf_counter()
+        chunks = parse_chunks(csv_file_path, encoding, dialect, regimes, chunk_size=batch_size, workers=workers)
+        # Rows past an undecodable one are not imported, those before it are kept
+        decode_error = None
+        try:
+            for chunk_num, (records, chunk_issues, count) in enumerate(chunks, start=1):
+                rows_read += count
+                for kind, (n, examples) in chunk_issues.items():
+                    total, kept = issues.get(kind, (0, []))
+                    issues[kind] = (total + n, (kept + examples)[:10])
+
+                created, updated, unchanged, errors = self.import_chunk(records, password_hash, deferred)
+                # With DEBUG on, Django keeps the last 9000 statements (whole batches) in memory
+                reset_queries()
+                created_count += created
+                updated_count += updated
+                unchanged_count += unchanged
+                error_count += errors
+                if chunk_num % PROGRESS_EVERY:
+                    continue
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"  {rows_read} lignes traitées ({created_count} créées, {updated_count} mises à jour, "
+                    f"{unchanged_count} inchangées) "
+                    f"- {rows_read / elapsed:.0f} lignes/s"
+                )
+        except ExtractDecodeError as e:
+            decode_error = e
+
+        unknown = self.link_deferred(deferred, batch_size)
+        if unknown:
+            self.stdout.write(
+                self.style.WARNING(f"Responsables inconnus, liens ignorés: {', '.join(unknown[:20])}"
+                                   + (f" (+{len(unknown) - 20})" if len(unknown) > 20 else ''))
+            )
         
-        if csvfile is None:
+        if decode_error and self.deactivate_missing:
+            self.stdout.write(self.style.WARNING("Fichier incomplet: aucun employé n'est désactivé"))
+        deactivated_count = (
+            self.deactivate_missing_employees(batch_size) if self.deactivate_missing and not decode_error else 0
+        )
+
+        unresolved = []
+        if not self.dry_run and (created_count or self.links):
+            _, unresolved = rebuild_org_paths(batch_size=batch_size)
+        if not self.dry_run and (created_count or updated_count or self.links or deactivated_count):
+            invalidate_org_chart()
+        elapsed = time.perf_counter() - start
+        if unresolved:
             self.stdout.write(
-                self.style.ERROR("Impossible de lire le fichier CSV avec les encodages testés")
+                self.style.WARNING(f"Hiérarchie circulaire ou incomplète pour: {', '.join(unresolved)}")
             )
-            return
-            
-        self.stdout.write(f"Fichier ouvert avec l'encodage: {used_encoding}")
+        for kind, (count, examples) in issues.items():
+            self.stdout.write(self.style.WARNING(f"{kind}: {count} (ex: {', '.join(examples)})"))
         
-        try:
-            # Détection automatique du délimiteur
-            sample = csvfile.read(1024)
-            csvfile.seek(0)
-            delimiter = ';' if ';' in sample else ','
-            
-            reader = csv.DictReader(csvfile, delimiter=delimiter)
-            
-            for row_num, row in enumerate(reader, start=2):
-                try:
-                    # Extraction et nettoyage des données
-                    employee_id = row.get('id', '').strip()
-                    if not employee_id:
-                        self.stdout.write(
-                            self.style.WARNING(f"Ligne {row_num}: ID employé manquant, ignorée")
-                        )
-                        continue
-                    
-                    # Parsing du nom complet
-                    nom_complet = row.get('nom', '').strip()
-                    if ' ' in nom_complet:
-                        parts = nom_complet.split(' ', 1)
-                        first_name = parts[0]
-                        last_name = parts[1]
-                    else:
-                        first_name = nom_complet
-                        last_name = ''
-                    
-                    email = row.get('email', '').strip()
-                    if not email:
-                        email = f"{employee_id.lower()}@company.com"
-                    
-                    # Vérification si l'utilisateur existe déjà
-                    user, created = CustomUser.objects.get_or_create(
-                        employee_id=employee_id,
-                        defaults={
-                            'username': employee_id,
-                            'email': email,
-                            'first_name': first_name,
-                            'last_name': last_name,
-                            'password': make_password(default_password),
-                        }
-                    )
-                    
-                    # Mise à jour des champs
-                    user.email = email
-                    user.first_name = first_name
-                    user.last_name = last_name
-                    user.departement = row.get('departement', '').strip()
-                    user.is_manager = self.parse_boolean(row.get('Manager', ''))
-                    user.poste = row.get('poste', '').strip()
-                    user.responsable = row.get('responsable', '').strip()
-                    user.date_embauche = self.parse_date(row.get('date_embauche', ''))
-                    
-                    # Congés
-                    user.conges_droit_annuel = self.parse_float(row.get('conges.droit_annuel', '25'))
-                    user.conges_utilises = self.parse_float(row.get('conges.utilises', '0'))
-                    user.conges_planifies = self.parse_float(row.get('conges.planifies', '0'))
-                    user.conges_restants = self.parse_float(row.get('conges.restants', '25'))
-                    
-                    # Congés maladie
-                    user.conges_maladie_droit = self.parse_float(row.get('conges_maladie.droit', '10'))
-                    user.conges_maladie_utilises = self.parse_float(row.get('conges_maladie.utilises', '0'))
-                    user.conges_maladie_restants = self.parse_float(row.get('conges_maladie.restants', '10'))
-                    
-                    # Rémunération
-                    user.salaire = self.parse_float(row.get('remuneration.salaire', '0'))
-                    user.eligible_prime = self.parse_boolean(row.get('remuneration.eligible_prime', 'VRAI'))
-                    user.date_prochaine_evaluation = self.parse_date(row.get('remuneration.date_prochaine_evaluation', ''))
-                    
-                    # Avantages
-                    regime = row.get('avantages.regime_sante', 'Standard').strip()
-                    if regime in dict(CustomUser.REGIME_SANTE_CHOICES):
-                        user.regime_sante = regime
-                    else:
-                        user.regime_sante = 'Standard'
-                    
-                    user.save()
-                    
-                    if created:
-                        created_count += 1
-                        self.stdout.write(
-                            self.style.SUCCESS(f"✓ Utilisateur créé: {employee_id} - {first_name} {last_name}")
-                        )
-                    else:
-                        updated_count += 1
-                        self.stdout.write(
-                            self.style.SUCCESS(f"⟳ Utilisateur mis à jour: {employee_id} - {first_name} {last_name}")
-                        )
-                        
-                except Exception as e:
-                    error_count += 1
-                    self.stdout.write(
-                        self.style.ERROR(f"✗ Erreur ligne {row_num} (ID: {employee_id}): {str(e)}")
-                    )
-                    continue
-        finally:
-            if csvfile:
-                csvfile.close()
+        if self.dry_run:
+            self.stdout.write("\n=== CHANGEMENTS (simulation, rien n'a été écrit) ===")
+            for line in self.changes:
+                self.stdout.write(line)
+            if self.change_count > len(self.changes):
+                self.stdout.write(f"… {self.change_count - len(self.changes)} autres changements")
         
         self.stdout.write(self.style.SUCCESS(f"\n=== RÉSUMÉ DE L'IMPORTATION ==="))
         self.stdout.write(self.style.SUCCESS(f"Utilisateurs créés: {created_count}"))
         self.stdout.write(self.style.SUCCESS(f"Utilisateurs mis à jour: {updated_count}"))
+        self.stdout.write(self.style.SUCCESS(f"Utilisateurs inchangés: {unchanged_count}"))
+        self.stdout.write(self.style.SUCCESS(f"Liens hiérarchiques modifiés: {self.links}"))
+        if self.deactivate_missing:
+            self.stdout.write(self.style.SUCCESS(f"Utilisateurs désactivés: {deactivated_count}"))
         if error_count > 0:
             self.stdout.write(self.style.ERROR(f"Erreurs: {error_count}"))
-        self.stdout.write(self.style.SUCCESS(f"Total traité: {created_count + updated_count + error_count}")) 
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f"Total traité: {created_count + updated_count + unchanged_count + error_count}"))
+        self.stdout.write(self.style.SUCCESS(f"Débit: {rows_read / elapsed:.0f} lignes/s ({rows_read} lignes en {elapsed:.1f} s)"))
+        if decode_error:
+            self.stdout.write(self.style.ERROR(
+                f"Importation interrompue, {decode_error}. Les lignes précédentes ont été importées: "
+                f"corrigez le fichier ou réenregistrez-le en UTF-8, puis relancez l'importation."
+            ))
@@ -0,0 +1,332 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from users.agents_stub import StubBehavior, make_server
+from users.benchmarking import summarize
+from users.synthetic import QUESTIONS, employee_id
+import json
+import random
+import re
+import threading
+import time
+
+import requests
+
+ENDPOINTS = ('login', 'create_chat', 'get_chats', 'get_messages', 'send_message')
+# Share of the requests of a virtual user per action, after its first chat is created
+DEFAULT_MIX = 'send=0.3,messages=0.35,chats=0.25,create=0.1'
+MIX_ACTIONS = {
+    'send': 'send_message',
+    'messages': 'get_messages',
+    'chats': 'get_chats',
+    'create': 'create_chat',
+}
+FOLLOW_UPS = [
+    "Merci, et pour l'année prochaine ?",
+    "Peux-tu préciser ?",
+    "Et pour mon équipe ?",
+    "D'accord, merci beaucoup !",
+]
+LOCK_ERRORS_METRIC = re.compile(r'^hrbot_db_lock_errors_total\{[^}]*\} (\d+)$', re.MULTILINE)
+# Throughput gain below which a concurrency step is considered saturated
+SATURATION_GAIN = 0.10
+
+
+def parse_mix(value):
+    """'send=0.3,chats=0.2' -> cumulative [(threshold, endpoint)] normalized to 1"""
+    weights = []
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in MIX_ACTIONS:
+            raise CommandError(f"Action inconnue dans --mix: {name} (attendu: {', '.join(MIX_ACTIONS)})")
+        try:
+            weights.append((MIX_ACTIONS[name.strip()], float(weight)))
+        except ValueError:
+            raise CommandError(f"Poids invalide dans --mix: {part}")
+    total = sum(weight for _, weight in weights)
+    if total <= 0:
+        raise CommandError("--mix: la somme des poids doit être positive")
+    cumulative, thresholds = 0.0, []
+    for endpoint, weight in weights:
+        cumulative += weight / total
+        thresholds.append((cumulative, endpoint))
+    return thresholds
+
+
+class VirtualUser:
+    """One logged-in employee with its own HTTP session and current chat"""
+
+    def __init__(self, base_url, username, password, timeout, rng):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.rng = rng
+        self.session = requests.Session()
+        self.chat_id = None
+        self.sent = 0
+
+    def request(self, method, path, **kwargs):
+        return self.session.request(
+            method, self.base_url + path, timeout=self.timeout, allow_redirects=False, **kwargs
+        )
+
+    def login(self):
+        response = self.request('POST', '/login/', data={'username': self.username, 'password': self.password})
+        # A successful login redirects to the chat page with a session cookie
+        if response.status_code == 302 and 'sessionid' in self.session.cookies:
+            return response.status_code, True
+        return response.status_code, False
+
+    def next_message(self):
+        if self.sent and self.rng.random() < 0.3:
+            return self.rng.choice(FOLLOW_UPS)
+        return self.rng.choice(QUESTIONS)[0]
+
+    def perform(self, endpoint):
+        """Run one action, return its HTTP status code"""
+        if endpoint == 'create_chat':
+            response = self.request('POST', '/api/chats/create/')
+            if response.status_code == 200:
+                self.chat_id = response.json()['id']
+                self.sent = 0
+            return response.status_code
+        if endpoint == 'get_chats':
+            return self.request('GET', '/api/chats/').status_code
+        if endpoint == 'get_messages':
+            return self.request('GET', f'/api/chats/{self.chat_id}/messages/').status_code
+        response = self.request(
+            'POST', f'/api/chats/{self.chat_id}/send/', data=json.dumps({'message': self.next_message()}),
+            headers={'Content-Type': 'application/json'},
+        )
+        self.sent += 1
+        return response.status_code
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de charge de l'API de chat par HTTP, à concurrence croissante, contre un serveur lancé à part "
+        "(runserver ou serveur de production) avec des employés synthétiques (generate_org --password)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Adresse du serveur testé")
+        parser.add_argument('--users', type=int, default=100, help="Nombre d'employés synthétiques connectés")
+        parser.add_argument('--first-user', type=int, default=2, help="Premier employé utilisé (E2 par défaut)")
+        parser.add_argument('--password', required=True, help="Mot de passe donné à generate_org --password")
+        parser.add_argument(
+            '--concurrency',
+            default='1,2,4,8,16,32',
+            help="Paliers de clients simultanés, séparés par des virgules"
+        )
+        parser.add_argument('--duration', type=float, default=30, help="Durée de chaque palier, en secondes")
+        parser.add_argument('--mix', default=DEFAULT_MIX, help="Répartition des actions (send, messages, chats, create)")
+        parser.add_argument(
+            '--think-time',
+            type=float,
+            default=0.0,
+            help="Pause moyenne entre deux actions d'un client, en secondes (tirage exponentiel)"
+        )
+        parser.add_argument('--timeout', type=float, default=60, help="Délai maximal d'une requête, en secondes")
+        parser.add_argument(
+            '--metrics-token',
+            default=settings.METRICS_TOKEN,
+            help="METRICS_TOKEN du serveur, pour relever les erreurs 'database is locked' sur /metrics"
+        )
+        parser.add_argument(
+            '--stub-port',
+            type=int,
+            help="Lancer aussi le serveur Agents local sur ce port (voir run_agents_stub)"
+        )
+        parser.add_argument('--stub-latency', type=float, default=1.0, help="Durée d'un run du serveur Agents local")
+        parser.add_argument('--stub-jitter', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Écrire les résultats de chaque palier dans ce fichier JSON")
+
+    def lock_errors(self, options):
+        """Total of 'database is locked' errors reported by the server, None without access to /metrics"""
+        if not options['metrics_token']:
+            return None
+        try:
+            response = requests.get(
+                options['url'] + '/metrics', timeout=options['timeout'],
+                headers={'Authorization': f"Bearer {options['metrics_token']}"},
+            )
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        return sum(int(count) for count in LOCK_ERRORS_METRIC.findall(response.text))
+
+    def login_all(self, options):
+        users, latencies, failures = [], [], 0
+        for i in range(options['users']):
+            user = VirtualUser(
+                options['url'], employee_id(options['first_user'] - 1 + i), options['password'],
+                options['timeout'], random.Random(options['seed'] + i),
+            )
+            start = time.perf_counter()
+            try:
+                status, ok = user.login()
+            except requests.RequestException as e:
+                raise CommandError(f"Serveur injoignable sur {options['url']}: {e}")
+            latencies.append(time.perf_counter() - start)
+            if ok:
+                users.append(user)
+            else:
+                failures += 1
+        if not users:
+            raise CommandError(
+                f"Aucune connexion réussie: générez les employés avec generate_org --password {options['password']}"
+            )
+        if failures:
+            self.stdout.write(self.style.WARNING(f"{failures} connexions refusées, {len(users)} clients utilisés"))
+        stats = summarize(latencies)
+        self.stdout.write(
+            f"Connexion de {len(users)} employés: p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms"
+        )
+        return users
+
+    def run_step(self, users, concurrency, mix, options):
+        lock = threading.Lock()
+        latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        statuses = {endpoint: {} for endpoint in ENDPOINTS}
+        lock_before = self.lock_errors(options)
+        deadline = time.perf_counter() + options['duration']
+
+        def worker(index):
+            # Clients of a step never share a session: concurrency is capped by --users
+            user = users[index]
+            rng = user.rng
+            while time.perf_counter() < deadline:
+                if user.chat_id is None:
+                    endpoint = 'create_chat'
+                else:
+                    roll = rng.random()
+                    endpoint = next((name for threshold, name in mix if roll < threshold), mix[-1][1])
+                start = time.perf_counter()
+                try:
+                    status = user.perform(endpoint)
+                except requests.Timeout:
+                    status = 'timeout'
+                except (requests.RequestException, ValueError):
+                    status = 'error'
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies[endpoint].append(elapsed)
+                    statuses[endpoint][status] = statuses[endpoint].get(status, 0) + 1
+                if options['think_time']:
+                    time.sleep(rng.expovariate(1 / options['think_time']))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        lock_after = self.lock_errors(options)
+
+        total = sum(len(values) for values in latencies.values())
+        errors = sum(
+            count for codes in statuses.values() for status, count in codes.items()
+            if not isinstance(status, int) or status >= 400
+        )
+        return {
+            'concurrency': concurrency,
+            'duration_s': wall,
+            'requests': total,
+            'throughput_rps': total / wall,
+            'error_rate': errors / total if total else 0.0,
+            'lock_errors': None if lock_before is None or lock_after is None else lock_after - lock_before,
+            'endpoints': {
+                endpoint: dict(summarize(values), statuses={str(k): v for k, v in statuses[endpoint].items()})
+                for endpoint, values in latencies.items() if values
+            },
+        }
+
+    def report_step(self, result):
+        lock_errors = 'n/a' if result['lock_errors'] is None else result['lock_errors']
+        style = self.style.ERROR if result['error_rate'] or result['lock_errors'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"\n=== {result['concurrency']} clients: {result['requests']} requêtes en {result['duration_s']:.1f}s "
+            f"({result['throughput_rps']:.1f} req/s), erreurs {result['error_rate']:.1%}, "
+            f"'database is locked': {lock_errors} ==="
+        ))
+        for endpoint, stats in result['endpoints'].items():
+            failed = {status: count for status, count in stats['statuses'].items() if status not in ('200', '302')}
+            self.stdout.write(
+                f"  {endpoint:<13} n={stats['count']:<6} p50 {stats['p50_ms']:7.1f} ms  "
+                f"p95 {stats['p95_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms"
+                + (f"  échecs {failed}" if failed else '')
+            )
+
+    def saturation(self, results):
+        """First step whose throughput no longer grows with concurrency, or that starts failing"""
+        for previous, current in zip(results, results[1:]):
+            if current['error_rate'] > 0.01 or current['lock_errors']:
+                return previous
+            if current['throughput_rps'] < previous['throughput_rps'] * (1 + SATURATION_GAIN):
+                return previous
+        return None
+
+    def handle(self, *args, **options):
+        try:
+            steps = sorted({int(value) for value in options['concurrency'].split(',')})
+        except ValueError:
+            raise CommandError("--concurrency attend des entiers séparés par des virgules")
+        if not steps or steps[0] < 1 or options['users'] < 1:
+            raise CommandError("--concurrency et --users doivent être positifs")
+        mix = parse_mix(options['mix'])
+        options['url'] = options['url'].rstrip('/')
+
+        stub = None
+        if options['stub_port']:
+            stub = make_server('127.0.0.1', options['stub_port'], StubBehavior(
+                latency=options['stub_latency'], jitter=options['stub_jitter'], seed=options['seed'],
+            ))
+            threading.Thread(target=stub.serve_forever, daemon=True).start()
+            self.stdout.write(
+                f"Serveur Agents local: lancez le serveur testé avec "
+                f"AZURE_AI_ENDPOINT=http://127.0.0.1:{options['stub_port']}/api/projects/local"
+            )
+        if self.lock_errors(options) is None:
+            self.stdout.write(self.style.WARNING(
+                "/metrics inaccessible: passez --metrics-token (METRICS_TOKEN du serveur) "
+                "pour compter les erreurs 'database is locked'"
+            ))
+
+        try:
+            users = self.login_all(options)
+            if steps[-1] > len(users):
+                self.stdout.write(self.style.WARNING(f"Paliers limités à {len(users)} clients (--users)"))
+                steps = [step for step in steps if step <= len(users)] or [len(users)]
+            results = []
+            for concurrency in steps:
+                result = self.run_step(users, concurrency, mix, options)
+                self.report_step(result)
+                results.append(result)
+        finally:
+            if stub:
+                stub.shutdown()
+                stub.server_close()
+
+        self.stdout.write("\nPalier  req/s   erreurs  verrous  p95 send_message")
+        for result in results:
+            send = result['endpoints'].get('send_message', {})
+            lock_errors = '-' if result['lock_errors'] is None else result['lock_errors']
+            self.stdout.write(
+                f"{result['concurrency']:>6}  {result['throughput_rps']:6.1f}  {result['error_rate']:6.1%}  "
+                f"{lock_errors:>7}  {send.get('p95_ms', 0):.0f} ms"
+            )
+        saturated = self.saturation(results)
+        if saturated:
+            self.stdout.write(self.style.WARNING(
+                f"Saturation vers {saturated['concurrency']} clients ({saturated['throughput_rps']:.1f} req/s)"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS("Pas de saturation atteinte: augmentez --concurrency"))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'url': options['url'], 'mix': options['mix'], 'steps': results}, f, indent=2)
+            self.stdout.write(f"Résultats écrits dans {options['output']}")
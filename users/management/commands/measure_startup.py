@@ -0,0 +1,140 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+# Run in a fresh interpreter: the stages of a worker boot, then optionally of its warm-up
+BOOT_SCRIPT = '''
+import json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+stages = {'django.setup': time.perf_counter() - start}
+start = time.perf_counter()
+from config.wsgi import application
+stages['wsgi'] = time.perf_counter() - start
+start = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+stages['urls+views'] = time.perf_counter() - start
+if '--warm-up' in sys.argv:
+    from users import warmup
+    start = time.perf_counter()
+    from users.azure_ai import azure_installed, sdk
+    if azure_installed():
+        sdk()
+    stages['azure sdk import'] = time.perf_counter() - start
+    for name, function, _ in warmup.STAGES:
+        if name == 'urls':
+            continue
+        start = time.perf_counter()
+        try:
+            function()
+        except Exception as e:
+            print(f"{name}: {type(e).__name__}: {e}", file=sys.stderr)
+        stages[f'warm-up {name}'] = time.perf_counter() - start
+print(json.dumps(stages))
+'''
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le temps de démarrage d'un worker (Django, WSGI, vues) et de son préchauffage, "
+        "dans des processus neufs, et liste les imports les plus lents"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Nombre de démarrages mesurés")
+        parser.add_argument(
+            '--warm-up',
+            action='store_true',
+            help="Mesurer aussi le préchauffage (import du SDK Azure, base, organigramme, jeton et agent Azure)"
+        )
+        parser.add_argument('--imports', type=int, default=15, help="Nombre d'imports les plus lents listés (0: aucun)")
+        parser.add_argument('--json', action='store_true', help="Affiche le rapport au format JSON")
+
+    def run_script(self, extra_args=(), python_args=()):
+        # The warm-up is measured stage by stage, not started by config/wsgi.py
+        env = dict(os.environ, WARMUP_ON_START='False')
+        args = [sys.executable, *python_args, '-c', BOOT_SCRIPT, *extra_args]
+        start = time.perf_counter()
+        result = subprocess.run(args, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if result.returncode:
+            raise CommandError(f"Le démarrage a échoué:\n{result.stderr[-2000:]}")
+        return wall, result
+
+    def slowest_imports(self, options):
+        """Imports directly made by the boot script, by cumulative time"""
+        _, result = self.run_script(python_args=('-X', 'importtime'))
+        imports = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            # Nested imports are indented, their time is included in their parent's
+            if match and len(match.group(3)) == 1:
+                imports.append((int(match.group(2)) / 1000, match.group(4)))
+        return sorted(imports, reverse=True)[:options['imports']]
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("--runs doit être positif")
+        extra_args = ('--warm-up',) if options['warm_up'] else ()
+
+        runs = []
+        for _ in range(options['runs']):
+            wall, result = self.run_script(extra_args)
+            stages = json.loads(result.stdout.strip().splitlines()[-1])
+            stages['process total'] = wall
+            runs.append(stages)
+        warnings = result.stderr.strip()
+
+        manage_runs = []
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, 'manage.py', 'check'], cwd=settings.BASE_DIR, capture_output=True,
+                env=dict(os.environ, WARMUP_ON_START='False'),
+            )
+            manage_runs.append(time.perf_counter() - start)
+
+        report = {
+            stage: {
+                'median_ms': statistics.median(run[stage] for run in runs) * 1000,
+                'min_ms': min(run[stage] for run in runs) * 1000,
+                'max_ms': max(run[stage] for run in runs) * 1000,
+            }
+            for stage in runs[0]
+        }
+        report['manage.py check'] = {
+            'median_ms': statistics.median(manage_runs) * 1000,
+            'min_ms': min(manage_runs) * 1000,
+            'max_ms': max(manage_runs) * 1000,
+        }
+        imports = self.slowest_imports(options) if options['imports'] else []
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'runs': options['runs'],
+                'stages': report,
+                'slowest_imports': [{'module': name, 'cumulative_ms': ms} for ms, name in imports],
+            }, indent=2))
+            return
+
+        self.stdout.write(f"{'Étape':<28} {'médiane':>10} {'min':>10} {'max':>10}   ({options['runs']} démarrages)")
+        for stage, stats in report.items():
+            self.stdout.write(
+                f"{stage:<28} {stats['median_ms']:>7.0f} ms {stats['min_ms']:>7.0f} ms {stats['max_ms']:>7.0f} ms"
+            )
+        if warnings:
+            self.stdout.write(self.style.WARNING(warnings))
+        if imports:
+            self.stdout.write("\nImports les plus lents (démarrage du worker et chargement des vues):")
+            for ms, name in imports:
+                self.stdout.write(f"  {ms:>7.1f} ms  {name}")
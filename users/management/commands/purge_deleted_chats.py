@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from users.purge import PURGE_BATCH_SIZE, purge_deleted_chats
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime définitivement les conversations effacées par les utilisateurs, "
+        "par petits lots pour ne pas bloquer les écritures"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help="Messages supprimés par requête")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        chats, messages = purge_deleted_chats(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {chats} conversations et {messages} messages supprimés en {time.perf_counter() - start:.1f} s"
+        ))
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.agents_stub import StubBehavior, make_server
+import json
+import logging
+
+
+class Command(BaseCommand):
+    help = "Serveur local imitant l'API Azure AI Agents, pour tester get_ai_response sans réseau ni identifiants"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.5, help="Durée d'un run, en secondes")
+        parser.add_argument('--jitter', type=float, default=0.0, help="Variation aléatoire de la durée (± s)")
+        parser.add_argument(
+            '--request-latency', type=float, default=0.0, help="Délai ajouté à chaque requête HTTP, en secondes"
+        )
+        parser.add_argument('--failure-rate', type=float, default=0.0, help="Part des runs terminés en 'failed'")
+        parser.add_argument(
+            '--http-error-rate', type=float, default=0.0, help="Part des requêtes répondues en HTTP 500"
+        )
+        parser.add_argument(
+            '--requires-action-rate',
+            type=float,
+            default=0.0,
+            help="Part des runs demandant un appel d'outil (requires_action)"
+        )
+        parser.add_argument(
+            '--answers',
+            default='echo',
+            help="'echo' (répète la question), 'canned' (réponses types) ou fichier JSON de réponses"
+        )
+        parser.add_argument('--chunk-size', type=int, default=20, help="Caractères par fragment en streaming")
+        parser.add_argument('--chunk-delay', type=float, default=0.02, help="Délai entre fragments, en secondes")
+        parser.add_argument('--seed', type=int, default=0, help="Graine des tirages aléatoires")
+        parser.add_argument('--verbose', action='store_true', help="Journaliser chaque requête")
+
+    def handle(self, *args, **options):
+        answers = options['answers']
+        if answers not in ('echo', 'canned'):
+            try:
+                with open(answers, encoding='utf-8') as f:
+                    answers = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Réponses illisibles dans {options['answers']}: {e}")
+            if not isinstance(answers, list) or not answers:
+                raise CommandError("Le fichier de réponses doit contenir une liste JSON non vide")
+
+        behavior = StubBehavior(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            request_latency=options['request_latency'],
+            failure_rate=options['failure_rate'],
+            http_error_rate=options['http_error_rate'],
+            requires_action_rate=options['requires_action_rate'],
+            answers=answers,
+            chunk_size=options['chunk_size'],
+            chunk_delay=options['chunk_delay'],
+            seed=options['seed'],
+        )
+        if options['verbose']:
+            logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(message)s')
+            logging.getLogger('users.agents_stub').setLevel(logging.DEBUG)
+
+        server = make_server(options['host'], options['port'], behavior)
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(f"Serveur Agents local sur http://{host}:{port}"))
+        self.stdout.write(f"Lancez l'application avec AZURE_AI_ENDPOINT=http://{host}:{port}/api/projects/local")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
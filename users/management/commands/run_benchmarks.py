@@ -0,0 +1,197 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from users.benchmarking import isolated_database
+from users.models import CustomUser
+from users.synthetic import create_employees, employee_id
+import fnmatch
+import json
+import os
+import platform
+import time
+import timeit
+
+# Organization sizes benchmarked by default
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+
+# One question per reachable branch of get_fallback_response (the department
+# statistics and privacy branches are shadowed by the department listing,
+# salary and employee search branches)
+FALLBACK_QUESTIONS = {
+    'profil_complet': "Donne-moi toutes mes infos",
+    'profil': "Qui suis-je ?",
+    'recherche_employe': "Contact de l'employé {employee_id}",
+    'departement': "Qui travaille dans le département finance ?",
+    'poste': "Quel poste occupe chaque manager ?",
+    'pdg': "Comment contacter le PDG ?",
+    'contacts_rh': "Je voudrais parler aux ressources humaines",
+    'manager': "Ai-je un responsable ?",
+    'conges': "Combien de congés me reste-t-il ?",
+    'maladie': "Arrêt maladie, que faire ?",
+    'salaire': "Quel est mon salaire ?",
+    'horaires': "Quels sont les horaires de travail ?",
+    'formation': "Quelles formations sont proposées ?",
+    'generique': "Bonjour",
+}
+
+# Chat titles: a matched intent, a short and a long free-form message
+TITLE_QUESTIONS = {
+    'intention': "Combien de jours de congés me reste-t-il cette année ?",
+    'court': "Bonjour",
+    'long': "Je voudrais savoir à quelle date ma prochaine évaluation annuelle aura lieu",
+}
+
+
+def malformed_employee_list(employees):
+    """AI answer listing ``employees`` with name, title and email split over several lines"""
+    lines = ["Voici les membres de l'équipe :", ""]
+    for employee in employees:
+        lines += [employee.first_name, employee.last_name, f"{employee.poste} - {employee.email}", ""]
+    lines.append("N'hésitez pas si vous avez d'autres questions.")
+    return '\n'.join(lines)
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmarks des fonctions du chatbot sur des organisations synthétiques, comparés à une référence"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Tailles d'organisation (employés)"
+        )
+        parser.add_argument('--repeat', type=int, default=5, help="Mesures par benchmark, la meilleure est retenue")
+        parser.add_argument(
+            '--only', action='append', help="Ne lancer que les benchmarks dont le nom correspond (motif glob, répétable)"
+        )
+        parser.add_argument('--output', help="Fichier JSON où écrire les résultats")
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json'),
+            help="Résultats de référence à comparer"
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true', help="Enregistrer les résultats comme nouvelle référence"
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help="Ralentissement toléré par rapport à la référence (0.25 = +25%%)"
+        )
+
+    def benchmarks(self, size):
+        """(name, callable) of every benchmark, on the organization currently in the database"""
+        from users.views import (
+            create_enhanced_message, find_similar_user, fix_ai_response_formatting, format_complete_user_response,
+            generate_chat_title, get_complete_user_info, get_fallback_response,
+        )
+
+        # A second-level manager: has a manager chain, direct and indirect reports
+        manager = CustomUser.objects.filter(is_manager=True, responsable__responsable=employee_id(0)).first()
+        last = CustomUser.objects.get(employee_id=employee_id(size - 1))
+        response = malformed_employee_list(CustomUser.objects.order_by('pk')[:20])
+
+        yield 'create_enhanced_message', lambda: create_enhanced_message("Combien de congés me reste-t-il ?", manager)
+        yield 'find_similar_user[nom]', lambda: find_similar_user(f"{last.first_name} {last.last_name}")
+        yield 'find_similar_user[id]', lambda: find_similar_user(last.employee_id)
+        for intent, question in FALLBACK_QUESTIONS.items():
+            question = question.format(employee_id=last.employee_id)
+            yield f'get_fallback_response[{intent}]', lambda question=question: get_fallback_response(question, manager)
+        yield 'fix_ai_response_formatting', lambda: fix_ai_response_formatting(response, manager)
+        for kind, question in TITLE_QUESTIONS.items():
+            yield f'generate_chat_title[{kind}]', lambda question=question: generate_chat_title(question)
+        yield 'get_complete_user_info', lambda: get_complete_user_info(manager)
+        yield 'format_complete_user_response', lambda: format_complete_user_response(manager)
+
+    def measure(self, func, repeat):
+        """Best and median time per call in ms, and the queries of one call once warmed up"""
+        func()
+        executed = [0]
+
+        def count_statements(execute, sql, params, many, context):
+            executed[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_statements):
+            func()
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        times = sorted(total / number * 1000 for total in timer.repeat(repeat=repeat, number=number))
+        return {
+            'best_ms': times[0],
+            'median_ms': times[len(times) // 2],
+            'calls': number * repeat,
+            'queries': executed[0],
+        }
+
+    def compare(self, results, baseline, tolerance):
+        """Benchmarks slower than the baseline by more than ``tolerance``, or running more queries"""
+        regressions = []
+        for key, result in results.items():
+            reference = baseline.get(key)
+            if reference is None:
+                continue
+            ratio = result['best_ms'] / reference['best_ms'] if reference['best_ms'] else 1.0
+            result['baseline_ms'] = reference['best_ms']
+            result['ratio'] = ratio
+            if ratio > 1 + tolerance:
+                regressions.append(f"{key}: {reference['best_ms']:.3f} -> {result['best_ms']:.3f} ms (x{ratio:.2f})")
+            if result['queries'] > reference['queries']:
+                regressions.append(f"{key}: {reference['queries']} -> {result['queries']} requêtes SQL")
+        return regressions
+
+    def handle(self, *args, **options):
+        baseline = {}
+        if not options['save_baseline'] and os.path.exists(options['baseline']):
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+
+        results = {}
+        # No Azure call, background thread or DEBUG query log during the measurements
+        with isolated_database(), override_settings(
+            DEBUG=False, AZURE_AI_ENABLED=False, CHAT_PURGE_IN_BACKGROUND=False, TRACING_ENABLED=False
+        ):
+            for size in sorted(options['sizes']):
+                start = time.perf_counter()
+                CustomUser.objects.all().delete()
+                create_employees(size, seed=1)
+                self.stdout.write(self.style.SUCCESS(f"\n=== {size} employés ({time.perf_counter() - start:.1f} s de préparation) ==="))
+                self.stdout.write(
+                    f"{'Benchmark':<44} {'meilleur ms':>12} {'médiane ms':>12} {'requêtes':>9} {'référence':>10}"
+                )
+                for name, func in self.benchmarks(size):
+                    if options['only'] and not any(
+                        name == pattern or fnmatch.fnmatch(name, pattern) for pattern in options['only']
+                    ):
+                        continue
+                    key = f"{name}@{size}"
+                    result = results[key] = self.measure(func, options['repeat'])
+                    reference = baseline.get(key)
+                    self.stdout.write(
+                        f"{name:<44} {result['best_ms']:>12.3f} {result['median_ms']:>12.3f} {result['queries']:>9} "
+                        f"{'x%.2f' % (result['best_ms'] / reference['best_ms']) if reference else '-':>10}"
+                    )
+
+        regressions = self.compare(results, baseline, options['tolerance'])
+        report = {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+            'regressions': regressions,
+        }
+        for path in filter(None, [options['output'], options['baseline'] if options['save_baseline'] else None]):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False, sort_keys=True)
+            self.stdout.write(f"Résultats écrits dans {path}")
+
+        if options['save_baseline']:
+            self.stdout.write(self.style.SUCCESS(f"✓ Référence enregistrée ({len(results)} mesures)"))
+        elif not baseline:
+            self.stdout.write(self.style.WARNING(f"Aucune référence dans {options['baseline']}, lancez avec --save-baseline"))
+        elif regressions:
+            for regression in regressions:
+                self.stderr.write(self.style.ERROR(f"✗ {regression}"))
+            raise CommandError(f"{len(regressions)} régression(s) au-delà de +{options['tolerance']:.0%}")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✓ Aucune régression au-delà de +{options['tolerance']:.0%}"))
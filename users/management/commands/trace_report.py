@@ -0,0 +1,87 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from users.benchmarking import percentile
+from users.tracing import read_spans
+
+# Span attributes whose values are counted in the report
+COUNTED_ATTRIBUTES = ['fallback_reason', 'run_status', 'error']
+
+
+class Command(BaseCommand):
+    help = "Répartition de la latence par étape du pipeline IA (p50/p95/p99) à partir des traces enregistrées"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files',
+            nargs='*',
+            help="Fichiers de traces (JSON ou OTLP/JSON), par défaut TRACING_LOG_FILE ou TRACING_OTLP_FILE"
+        )
+        parser.add_argument('--root', default='send_message', help="Trace racine analysée")
+
+    def handle(self, *args, **options):
+        files = options['files'] or [path for path in (settings.TRACING_LOG_FILE, settings.TRACING_OTLP_FILE) if path][:1]
+        if not files:
+            raise CommandError("Aucun fichier de traces: passez-en un ou définissez TRACING_LOG_FILE")
+
+        traces = defaultdict(list)
+        for path in files:
+            try:
+                for record in read_spans(path):
+                    traces[record['trace_id']].append(record)
+            except OSError as e:
+                raise CommandError(f"Lecture impossible de {path}: {e}")
+
+        durations = defaultdict(list)
+        offsets = defaultdict(list)
+        depths = {}
+        counts = {attribute: Counter() for attribute in COUNTED_ATTRIBUTES}
+        roots = 0
+        for spans in traces.values():
+            root = next((record for record in spans if record['parent_id'] is None), None)
+            if root is None or root['name'] != options['root']:
+                continue
+            roots += 1
+            root_start = datetime.fromisoformat(root['start'])
+            parents = {record['span_id']: record['parent_id'] for record in spans}
+            # Counted once per trace, several spans may carry the same attribute
+            seen = set()
+            for record in spans:
+                name = record['name']
+                durations[name].append(record['duration_ms'])
+                offsets[name].append((datetime.fromisoformat(record['start']) - root_start).total_seconds())
+                depth, parent = 0, record['parent_id']
+                while parent is not None:
+                    depth += 1
+                    parent = parents.get(parent)
+                depths[name] = min(depth, depths.get(name, depth))
+                for attribute in COUNTED_ATTRIBUTES:
+                    if attribute in record['attributes']:
+                        seen.add((attribute, record['attributes'][attribute]))
+            for attribute, value in seen:
+                counts[attribute][value] += 1
+
+        if not roots:
+            self.stdout.write(self.style.WARNING(f"Aucune trace '{options['root']}' trouvée"))
+            return
+
+        root_p50 = percentile(durations[options['root']], 50) or 1
+        self.stdout.write(f"{roots} traces '{options['root']}'\n")
+        self.stdout.write(
+            f"{'Étape':<42} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'% p50':>6}"
+        )
+        # Stages in pipeline order, nested under their parent
+        for name in sorted(durations, key=lambda name: (sum(offsets[name]) / len(offsets[name]), depths[name])):
+            values = durations[name]
+            p50 = percentile(values, 50)
+            label = '  ' * depths[name] + name
+            self.stdout.write(
+                f"{label:<42} {len(values):>6} {p50:>9.1f} {percentile(values, 95):>9.1f} "
+                f"{percentile(values, 99):>9.1f} {max(values):>9.1f} {p50 / root_p50 * 100:>5.0f}%"
+            )
+
+        for attribute, counter in counts.items():
+            if counter:
+                summary = ', '.join(f"{value}: {count}" for value, count in counter.most_common())
+                self.stdout.write(f"\n{attribute}: {summary}")
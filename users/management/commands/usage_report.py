@@ -0,0 +1,47 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from users.models import AIUsage
+from users.usage import GROUPINGS, aggregate_usage, prompt_section_tokens
+
+
+class Command(BaseCommand):
+    help = "Consommation de tokens et coût des réponses de l'IA par jour, utilisateur, département ou intention"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--by',
+            choices=list(GROUPINGS),
+            action='append',
+            help="Regroupement (répétable), par défaut jour, département et intention"
+        )
+        parser.add_argument('--days', type=int, default=30, help="Période analysée, en jours")
+        parser.add_argument('--limit', type=int, default=20, help="Lignes affichées par regroupement")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        usage = AIUsage.objects.filter(created_at__gte=since)
+        runs = usage.count()
+        self.stdout.write(f"{runs} réponses de l'IA sur les {options['days']} derniers jours")
+        if not runs:
+            return
+
+        for by in options['by'] or ['day', 'department', 'intent']:
+            groups = aggregate_usage(usage, by)
+            self.stdout.write(self.style.SUCCESS(f"\n=== Par {by} ==="))
+            self.stdout.write(
+                f"{'':<30} {'runs':>7} {'prompt':>11} {'completion':>11} {'coût $':>9} {'moy. ms':>8} {'max ms':>8}"
+            )
+            for group in groups[:options['limit']]:
+                self.stdout.write(
+                    f"{str(group['key'])[:30]:<30} {group['runs']:>7} {group['prompt_tokens']:>11} "
+                    f"{group['completion_tokens']:>11} {group['cost']:>9.2f} {group['avg_ms']:>8.0f} {group['max_ms']:>8}"
+                )
+            if len(groups) > options['limit']:
+                self.stdout.write(f"… {len(groups) - options['limit']} autres")
+
+        sections = prompt_section_tokens(usage)
+        total = sum(sections.values()) or 1
+        self.stdout.write(self.style.SUCCESS("\n=== Tokens du prompt par section ==="))
+        for section, tokens in sorted(sections.items(), key=lambda item: item[1], reverse=True):
+            self.stdout.write(f"{section:<30} {tokens:>11.0f} {tokens / total * 100:>6.1f}%")
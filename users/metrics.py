@@ -0,0 +1,240 @@
+"""
+In-process metrics registry, exposed in the Prometheus text format at /metrics.
+
+Recording never takes a lock: every thread aggregates into its own dict of
+series, registered under its thread ID, and the shards are only merged
+when /metrics is scraped. The shards of finished threads are then folded
+into a retired total, so that threads started and stopped by the server
+do not pile up. A series is a histogram (one counter per bucket, then the
+sum of observed values) or a counter, keyed by metric name and label values.
+
+With several worker processes, set METRICS_DIR to a directory shared by
+the workers: each process writes a snapshot of its series there every
+METRICS_FLUSH_INTERVAL seconds (and on exit), and /metrics adds up the
+snapshots of all processes. Snapshots of stopped workers are kept so that
+counters never go backwards.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name -> (type, help, buckets for histograms)
+METRICS = {
+    'hrbot_http_requests_total': (
+        'counter', "HTTP requests by view, method and status code", None),
+    'hrbot_http_request_duration_seconds': (
+        'histogram', "Time spent in the view and the middlewares below, by view", LATENCY_BUCKETS),
+    'hrbot_http_db_queries': (
+        'histogram', "Database queries per request, by view", QUERY_COUNT_BUCKETS),
+    'hrbot_http_db_duration_seconds': (
+        'histogram', "Time spent in database queries per request, by view", LATENCY_BUCKETS),
+    'hrbot_http_response_size_bytes': (
+        'histogram', "Size of non-streaming response bodies, by view", SIZE_BUCKETS),
+    'hrbot_azure_ai_duration_seconds': (
+        'histogram', "Duration of the Azure AI agent call, by outcome", LATENCY_BUCKETS),
+    'hrbot_db_lock_errors_total': (
+        'counter', "Queries failed with SQLite 'database is locked', by view", None),
+}
+# Label names of each metric, in the order of the label values
+LABELS = {
+    'hrbot_http_requests_total': ('view', 'method', 'status'),
+    'hrbot_http_request_duration_seconds': ('view', 'method'),
+    'hrbot_http_db_queries': ('view',),
+    'hrbot_http_db_duration_seconds': ('view',),
+    'hrbot_http_response_size_bytes': ('view',),
+    'hrbot_azure_ai_duration_seconds': ('outcome',),
+    'hrbot_db_lock_errors_total': ('view',),
+}
+
+_local = threading.local()
+# thread ID -> series of the thread
+_shards = {}
+# Series of the finished threads, added up
+_retired = {}
+_shards_lock = threading.Lock()
+_last_flush = [0.0]
+
+
+def _series():
+    """This thread's series, created and registered on first use"""
+    try:
+        return _local.series
+    except AttributeError:
+        series = _local.series = {}
+        ident = threading.get_ident()
+        with _shards_lock:
+            # The ID of a finished thread may be reused before a scrape retired its shard
+            previous = _shards.get(ident)
+            if previous is not None:
+                merge(_retired, previous)
+            _shards[ident] = series
+        return series
+
+
+def observe(name, labels, value):
+    """Add ``value`` to the histogram ``name`` for the label values ``labels`` (a tuple)"""
+    series = _series()
+    key = (name, labels)
+    entry = series.get(key)
+    if entry is None:
+        entry = series[key] = [0] * (len(METRICS[name][2]) + 1) + [0.0]
+    entry[bisect_left(METRICS[name][2], value)] += 1
+    entry[-1] += value
+
+
+def inc(name, labels, amount=1):
+    """Increment the counter ``name`` for the label values ``labels`` (a tuple)"""
+    series = _series()
+    key = (name, labels)
+    entry = series.get(key)
+    if entry is None:
+        series[key] = [amount]
+    else:
+        entry[0] += amount
+
+
+def record_request(view, method, status, duration, queries, db_duration, size):
+    """All the series of one HTTP request at once, the hot path of MetricsMiddleware"""
+    series = _series()
+    for name, labels, value in (
+        ('hrbot_http_request_duration_seconds', (view, method), duration),
+        ('hrbot_http_db_queries', (view,), queries),
+        ('hrbot_http_db_duration_seconds', (view,), db_duration),
+        ('hrbot_http_response_size_bytes', (view,), size),
+    ):
+        if value is None:
+            continue
+        key = (name, labels)
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = [0] * (len(METRICS[name][2]) + 1) + [0.0]
+        entry[bisect_left(METRICS[name][2], value)] += 1
+        entry[-1] += value
+    key = ('hrbot_http_requests_total', (view, method, status))
+    entry = series.get(key)
+    if entry is None:
+        series[key] = [1]
+    else:
+        entry[0] += 1
+
+
+def merge(total, series):
+    for key, values in series.items():
+        entry = total.get(key)
+        if entry is None:
+            total[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                entry[i] += value
+
+
+def snapshot():
+    """Series of this process, all threads added up"""
+    with _shards_lock:
+        alive = {thread.ident for thread in threading.enumerate()}
+        for ident in [ident for ident in _shards if ident not in alive]:
+            # Nothing records into the shard of a finished thread anymore
+            merge(_retired, _shards.pop(ident))
+        shards = list(_shards.values())
+        total = {key: list(values) for key, values in _retired.items()}
+    for shard in shards:
+        # dict.copy() is atomic, the owning thread may keep recording meanwhile
+        merge(total, {key: list(values) for key, values in shard.copy().items()})
+    return total
+
+
+def snapshot_path(directory, pid):
+    return os.path.join(directory, f'metrics-{pid}.json')
+
+
+def flush():
+    """Write this process's snapshot to METRICS_DIR, atomically"""
+    directory = settings.METRICS_DIR
+    if not directory:
+        return
+    _last_flush[0] = time.monotonic()
+    os.makedirs(directory, exist_ok=True)
+    data = [[name, list(labels), values] for (name, labels), values in snapshot().items()]
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, snapshot_path(directory, os.getpid()))
+
+
+def maybe_flush():
+    """flush() if the last one is older than METRICS_FLUSH_INTERVAL, called after each request"""
+    if settings.METRICS_DIR and time.monotonic() - _last_flush[0] >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+atexit.register(flush)
+
+
+def collect():
+    """Series of all processes: this one live, the others from their last snapshot"""
+    total = snapshot()
+    directory = settings.METRICS_DIR
+    if not directory:
+        return total
+    own = snapshot_path(directory, os.getpid())
+    for entry in os.scandir(directory):
+        if not entry.name.startswith('metrics-') or entry.path == own:
+            continue
+        try:
+            with open(entry.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        merge(total, {(name, tuple(labels)): values for name, labels, values in data if name in METRICS})
+    return total
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(series=None):
+    """Prometheus text exposition format (version 0.0.4) of ``series``, all processes by default"""
+    series = collect() if series is None else series
+    by_metric = {}
+    for (name, labels), values in series.items():
+        by_metric.setdefault(name, []).append((labels, values))
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        names = LABELS[name]
+        for labels, values in sorted(by_metric.get(name, [])):
+            if kind == 'counter':
+                lines.append(f'{name}{format_labels(names, labels)} {values[0]}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), values):
+                cumulative += count
+                bucket_labels = format_labels(names, labels, 'le="%s"' % bound)
+                lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(names, labels)} {format_number(values[-1])}')
+            lines.append(f'{name}_count{format_labels(names, labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
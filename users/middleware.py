@@ -0,0 +1,70 @@
+import time
+
+from django.db import OperationalError, connection
+
+from .metrics import inc, maybe_flush, record_request
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting the queries of a request, their total
+    time and the ones that failed on a locked SQLite database
+    """
+
+    __slots__ = ('count', 'duration', 'lock_errors')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.lock_errors = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if 'locked' in str(e):
+                self.lock_errors += 1
+            raise
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Record per-view request latency, database queries and response size
+    (users/metrics.py). Queries made while a streaming response is being
+    consumed happen after the view returns and are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        # connection.execute_wrapper() without the cost of a context manager
+        wrappers = connection.execute_wrappers
+        wrappers.append(timer)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            wrappers.remove(timer)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        record_request(
+            view,
+            request.method,
+            response.status_code,
+            duration,
+            timer.count,
+            timer.duration,
+            None if response.streaming else len(response.content),
+        )
+        if timer.lock_errors:
+            inc('hrbot_db_lock_errors_total', (view,), timer.lock_errors)
+        maybe_flush()
+        return response
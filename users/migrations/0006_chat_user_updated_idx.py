@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_message_chat_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='chat_user_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:15
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_message_count(apps, schema_editor):
+    Chat = apps.get_model('users', 'Chat')
+    Message = apps.get_model('users', 'Message')
+    counts = Message.objects.filter(chat=OuterRef('pk')).order_by().values('chat').annotate(
+        total=Count('id')
+    ).values('total')
+    Chat.objects.update(message_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_chat_user_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_message_count, migrations.RunPython.noop),
+    ]
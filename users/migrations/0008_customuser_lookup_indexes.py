@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_chat_message_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='departement',
+            field=models.CharField(blank=True, choices=[('IT', 'IT'), ('Marketing', 'Marketing'), ('Finance', 'Finance'), ('RH', 'RH'), ('Ventes', 'Ventes'), ('Recherche', 'Recherche'), ('Direction', 'Direction')], db_index=True, max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='responsable',
+            field=models.CharField(blank=True, db_index=True, max_length=10, null=True),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def clean_responsable(apps, schema_editor):
+    """Blank and dangling manager IDs cannot be foreign key values, store NULL instead"""
+    CustomUser = apps.get_model('users', 'CustomUser')
+    known_ids = set(CustomUser.objects.exclude(employee_id=None).values_list('employee_id', flat=True))
+    CustomUser.objects.filter(responsable='').update(responsable=None)
+    dangling = (
+        CustomUser.objects.exclude(responsable=None)
+        .exclude(responsable__in=known_ids)
+        .values_list('responsable', flat=True)
+    )
+    CustomUser.objects.filter(responsable__in=set(dangling)).update(responsable=None)
+
+
+def build_org_paths(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    parents = dict(CustomUser.objects.exclude(employee_id=None).values_list('employee_id', 'responsable_id'))
+    paths = {}
+
+    def path_of(emp_id, visiting=()):
+        if emp_id not in paths:
+            manager_id = parents.get(emp_id)
+            if manager_id is None:
+                paths[emp_id] = f"{emp_id}/"
+            elif manager_id in visiting or manager_id not in parents:
+                paths[emp_id] = ''
+            else:
+                manager_path = path_of(manager_id, visiting + (emp_id,))
+                paths[emp_id] = f"{manager_path}{emp_id}/" if manager_path else ''
+        return paths[emp_id]
+
+    users = []
+    for user in CustomUser.objects.exclude(employee_id=None).only('pk', 'employee_id'):
+        user.org_path = path_of(user.employee_id)
+        users.append(user)
+    CustomUser.objects.bulk_update(users, ['org_path'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_customuser_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(clean_responsable, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='customuser',
+            name='responsable',
+            field=models.ForeignKey(blank=True, db_column='responsable', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='direct_reports', to='users.customuser', to_field='employee_id'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='org_path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=500),
+        ),
+        migrations.RunPython(build_org_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_responsable_foreign_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='hr_source_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,74 @@
+from django.db import migrations
+
+# SQLite only: FTS5 index of Message.content, kept in sync by triggers so that
+# bulk_create and raw deletes are indexed too. chat_user ('u<user id>') lets a
+# query be restricted to one user's chats inside the index. A later migration
+# that remakes the users_message table drops the triggers and must recreate them.
+FTS_SQL = [
+    """
+    CREATE VIEW users_message_search AS
+    SELECT m.id AS id, m.content AS content, 'u' || c.user_id AS chat_user
+    FROM users_message m JOIN users_chat c ON c.id = m.chat_id
+    """,
+    """
+    CREATE VIRTUAL TABLE users_message_fts USING fts5(
+        content, chat_user,
+        content='users_message_search', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER users_message_fts_insert AFTER INSERT ON users_message BEGIN
+        INSERT INTO users_message_fts(rowid, content, chat_user)
+        VALUES (new.id, new.content, (SELECT 'u' || user_id FROM users_chat WHERE id = new.chat_id));
+    END
+    """,
+    """
+    CREATE TRIGGER users_message_fts_delete AFTER DELETE ON users_message BEGIN
+        INSERT INTO users_message_fts(users_message_fts, rowid, content, chat_user)
+        VALUES ('delete', old.id, old.content, (SELECT 'u' || user_id FROM users_chat WHERE id = old.chat_id));
+    END
+    """,
+    """
+    CREATE TRIGGER users_message_fts_update AFTER UPDATE OF content, chat_id ON users_message BEGIN
+        INSERT INTO users_message_fts(users_message_fts, rowid, content, chat_user)
+        VALUES ('delete', old.id, old.content, (SELECT 'u' || user_id FROM users_chat WHERE id = old.chat_id));
+        INSERT INTO users_message_fts(rowid, content, chat_user)
+        VALUES (new.id, new.content, (SELECT 'u' || user_id FROM users_chat WHERE id = new.chat_id));
+    END
+    """,
+    "INSERT INTO users_message_fts(users_message_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS users_message_fts_update",
+    "DROP TRIGGER IF EXISTS users_message_fts_delete",
+    "DROP TRIGGER IF EXISTS users_message_fts_insert",
+    "DROP TABLE IF EXISTS users_message_fts",
+    "DROP VIEW IF EXISTS users_message_search",
+]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in FTS_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_customuser_hr_source_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_chat_deleted_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('model', models.CharField(blank=True, max_length=64)),
+                ('run_status', models.CharField(max_length=16)),
+                ('intent', models.CharField(blank=True, max_length=32)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('duration_ms', models.PositiveIntegerField(default=0)),
+                ('context_bytes', models.PositiveIntegerField(default=0)),
+                ('directory_bytes', models.PositiveIntegerField(default=0)),
+                ('instructions_bytes', models.PositiveIntegerField(default=0)),
+                ('question_bytes', models.PositiveIntegerField(default=0)),
+                ('chat', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ai_usage', to='users.chat')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ai_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='aiusage_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_aiusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrgChartVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,5 +1,33 @@
-from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
+import logging
+
+from .bulk import update_rows
+
+logger = logging.getLogger(__name__)
+
+# Separator of the employee IDs in CustomUser.org_path
+ORG_PATH_SEPARATOR = '/'
+
+
+def org_subtree_filter(path, using=DEFAULT_DB_ALIAS):
+    """
+    Condition on org_path selecting the employees strictly under ``path``.
+
+    SQLite compares text byte by byte: every descendant path sorts between
+    ``path`` and the same prefix with its trailing separator bumped to the
+    next character, a range the org_path index serves, unlike LIKE (case
+    insensitive there). Other databases may sort with a locale collation
+    that ignores punctuation, so they get a prefix match, which PostgreSQL
+    serves with the pattern index Django adds to indexed CharFields.
+    """
+    if connections[using].vendor == 'sqlite':
+        return Q(org_path__gt=path, org_path__lt=path[:-1] + chr(ord(ORG_PATH_SEPARATOR) + 1))
+    return Q(org_path__startswith=path) & ~Q(org_path=path)
+
 
 class CustomUser(AbstractUser):
     # tes champs existants
@@ -29,11 +57,24 @@ class CustomUser(AbstractUser):
         ('Recherche', 'Recherche'),
         ('Direction', 'Direction'),
     )
-    departement = models.CharField(max_length=20, choices=DEPARTMENT_CHOICES, null=True, blank=True)
+    departement = models.CharField(max_length=20, choices=DEPARTMENT_CHOICES, null=True, blank=True, db_index=True)
     
     is_manager = models.BooleanField(default=False)
     poste = models.CharField(max_length=100, null=True, blank=True)
-    responsable = models.CharField(max_length=10, null=True, blank=True)  # ID du responsable
+    # Manager, referenced by its employee ID (same column values as the HR extract)
+    responsable = models.ForeignKey(
+        'self',
+        to_field='employee_id',
+        db_column='responsable',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='direct_reports',
+    )
+    # Materialized hierarchy: employee IDs from the top of the org chart down to
+    # this employee, each followed by ORG_PATH_SEPARATOR (e.g. "E10/E3/E42/").
+    # Maintained by save() and rebuild_org_paths().
+    org_path = models.CharField(max_length=500, blank=True, default='', db_index=True, editable=False)
     date_embauche = models.DateField(null=True, blank=True)
     
     # Congés
@@ -60,28 +101,176 @@ class CustomUser(AbstractUser):
     )
     regime_sante = models.CharField(max_length=20, choices=REGIME_SANTE_CHOICES, default='Standard')
 
+    # Digest of the HR extract row last imported for this employee, import_hr_data
+    # skips rows whose digest did not change
+    hr_source_hash = models.CharField(max_length=32, blank=True, default='', editable=False)
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.employee_id or self.username})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the hierarchy as loaded, save() only recomputes org_path when it changes
+        instance._loaded_hierarchy = (instance.__dict__.get('employee_id'), instance.__dict__.get('responsable_id'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        hierarchy = (self.employee_id, self.responsable_id)
+        hierarchy_changed = hierarchy != getattr(self, '_loaded_hierarchy', None)
+        if update_fields is not None and not {'employee_id', 'responsable'} & set(update_fields):
+            hierarchy_changed = False
+
+        old_path = self.org_path
+        adding = self._state.adding
+        if hierarchy_changed:
+            self.org_path = self.compute_org_path()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'org_path'}
+
+        super().save(*args, **kwargs)
+        self._loaded_hierarchy = hierarchy
+
+        if old_path and old_path != self.org_path:
+            if self.org_path:
+                # Move the whole subtree along with this employee
+                CustomUser.objects.filter(org_subtree_filter(old_path, self._state.db)).update(
+                    org_path=Concat(Value(self.org_path), Substr('org_path', len(old_path) + 1))
+                )
+            else:
+                # Invalid hierarchy: rebasing would turn the subtree into roots,
+                # its paths are recomputed from the managers instead
+                rebuild_org_paths()
+        elif not old_path and self.org_path and not adding and self.direct_reports.exists():
+            # Back in the hierarchy, with a subtree left without paths
+            rebuild_org_paths()
+
+    def compute_org_path(self):
+        """org_path of this employee from its manager's path (one indexed query)"""
+        if not self.employee_id:
+            return ''
+        manager_path = ''
+        if self.responsable_id:
+            manager_path = CustomUser.objects.filter(employee_id=self.responsable_id).values_list(
+                'org_path', flat=True
+            ).first() or ''
+            if not manager_path or self.employee_id in manager_path.split(ORG_PATH_SEPARATOR):
+                # Unknown manager path, or this employee is its own (indirect) manager
+                logger.warning(f"Hiérarchie invalide pour {self.employee_id} (responsable {self.responsable_id})")
+                return ''
+        return f"{manager_path}{self.employee_id}{ORG_PATH_SEPARATOR}"
+
+    def get_team(self):
+        """Direct reports"""
+        return self.direct_reports.all()
+
+    def get_all_reports(self):
+        """Direct and indirect reports, as one query on the org_path index"""
+        if not self.org_path:
+            return CustomUser.objects.none()
+        return CustomUser.objects.filter(org_subtree_filter(self.org_path, self._state.db))
+
+    def get_manager_chain(self):
+        """Managers from the direct manager up to the top of the org chart"""
+        ancestor_ids = self.org_path.split(ORG_PATH_SEPARATOR)[:-2]
+        if not ancestor_ids:
+            return []
+        managers = {m.employee_id: m for m in CustomUser.objects.filter(employee_id__in=ancestor_ids)}
+        return [managers[emp_id] for emp_id in reversed(ancestor_ids) if emp_id in managers]
+
     @property
     def manager_name(self):
-        if self.responsable:
-            try:
-                manager = CustomUser.objects.get(employee_id=self.responsable)
-                return f"{manager.first_name} {manager.last_name}"
-            except CustomUser.DoesNotExist:
-                return "Manager non trouvé"
+        if self.responsable_id:
+            manager = self.responsable
+            return f"{manager.first_name} {manager.last_name}"
         return "Aucun"
 
 
+def build_org_paths(parents):
+    """
+    Compute the org_path of every employee from a {employee_id: manager_id}
+    mapping. Returns (paths, unresolved): employees whose manager chain loops
+    or leads to an unknown employee get an empty path and are listed in
+    ``unresolved``.
+    """
+    paths = {}
+    unresolved = set()
+    for start in parents:
+        chain = []
+        seen = set()
+        emp_id = start
+        while emp_id is not None and emp_id not in paths and emp_id not in unresolved:
+            if emp_id in seen or emp_id not in parents:
+                # Cycle, or dangling manager reference
+                unresolved.update(chain)
+                chain = []
+                break
+            seen.add(emp_id)
+            chain.append(emp_id)
+            emp_id = parents[emp_id]
+        else:
+            if emp_id in unresolved:
+                unresolved.update(chain)
+                continue
+            prefix = paths[emp_id] if emp_id is not None else ''
+            for member in reversed(chain):
+                prefix = f"{prefix}{member}{ORG_PATH_SEPARATOR}"
+                paths[member] = prefix
+    for emp_id in unresolved:
+        paths[emp_id] = ''
+    return paths, unresolved
+
+
+def rebuild_org_paths(batch_size=1000):
+    """
+    Recompute org_path for the whole table (after imports and bulk updates,
+    which bypass save()). Only rows whose path changed are written.
+    Returns (updated_count, unresolved employee IDs).
+    """
+    rows = CustomUser.objects.exclude(employee_id=None).values_list('pk', 'employee_id', 'responsable_id', 'org_path')
+    parents = {}
+    current = {}
+    for pk, emp_id, manager_id, path in rows.iterator(chunk_size=batch_size):
+        parents[emp_id] = manager_id or None
+        current[emp_id] = (pk, path)
+
+    paths, unresolved = build_org_paths(parents)
+    changed = (
+        (current[emp_id][0], path)
+        for emp_id, path in paths.items()
+        if current[emp_id][1] != path
+    )
+    return update_rows(CustomUser, ['org_path'], changed, batch_size=batch_size), sorted(unresolved)
+
+
+def message_preview(content):
+    """Short preview of a message shown in the chat list"""
+    return content[:50] + ('...' if len(content) > 50 else '')
+
+
 class Chat(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='chats')
     title = models.CharField(max_length=200, default='New Chat')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by add_user_message and add_ai_reply, avoids counting messages to detect the first one
+    message_count = models.PositiveIntegerField(default=0)
+    # Creation time of the newest message moved to MessageArchive, None if none was
+    archived_until = models.DateTimeField(null=True, blank=True)
+    # Set when the user deletes the chat, the rows are removed later by users/purge.py
+    deleted_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Keyset pagination of a user's chat list in get_chats
+            models.Index(fields=['user', 'updated_at', 'id'], name='chat_user_updated_idx'),
+            # Chats waiting for the purge, a handful among all chats
+            models.Index(
+                fields=['deleted_at'], name='chat_deleted_idx', condition=models.Q(deleted_at__isnull=False)
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.title}"
@@ -90,9 +279,41 @@ class Chat(models.Model):
     def last_message(self):
         last_msg = self.messages.last()
         if last_msg:
-            return last_msg.content[:50] + ('...' if len(last_msg.content) > 50 else '')
+            return message_preview(last_msg.content)
         return "Start a conversation..."
 
+    def add_user_message(self, content):
+        """
+        Persist the user's message right away, with the message counter
+        incremented in SQL in the same short transaction
+        """
+        with transaction.atomic():
+            user_msg = Message.objects.create(chat=self, sender='user', content=content)
+            Chat.objects.filter(pk=self.pk).update(message_count=F('message_count') + 1)
+        self.message_count += 1
+        return user_msg
+
+    def add_ai_reply(self, content, title=None):
+        """
+        Persist the AI reply together with the chat metadata in one short
+        transaction. Only title, updated_at and message_count are written, and
+        the counter is incremented in SQL.
+        """
+        now = timezone.now()
+        changes = {'updated_at': now, 'message_count': F('message_count') + 1}
+        if title is not None:
+            changes['title'] = title
+
+        with transaction.atomic():
+            ai_msg = Message.objects.create(chat=self, sender='ai', content=content)
+            Chat.objects.filter(pk=self.pk).update(**changes)
+
+        self.updated_at = now
+        self.message_count += 1
+        if title is not None:
+            self.title = title
+        return ai_msg
+
 
 class Message(models.Model):
     SENDER_CHOICES = (
@@ -107,6 +328,75 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Keyset pagination of a chat's history in get_messages
+            models.Index(fields=['chat', 'created_at', 'id'], name='message_chat_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.chat.title} - {self.sender}: {self.content[:30]}..."
+
+
+class MessageArchive(models.Model):
+    """
+    Messages of an idle chat moved out of the Message table by archive_chats,
+    stored as one zlib-compressed JSON batch (see users/archive.py).
+    """
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='archives')
+    first_created_at = models.DateTimeField()
+    last_created_at = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Batches of a chat overlapping a get_messages cursor
+            models.Index(fields=['chat', 'first_created_at'], name='archive_chat_first_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.chat.title} - {self.message_count} archived messages"
+
+
+class AIUsage(models.Model):
+    """
+    Token usage of one completed Azure AI agent run, written in the
+    background by users/usage.py. Kept when the chat or the user is deleted.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='ai_usage')
+    chat = models.ForeignKey(Chat, on_delete=models.SET_NULL, null=True, related_name='ai_usage')
+    created_at = models.DateTimeField(default=timezone.now)
+    model = models.CharField(max_length=64, blank=True)
+    run_status = models.CharField(max_length=16)
+    # Category of the question (views.TITLE_PATTERNS), empty if none matched
+    intent = models.CharField(max_length=32, blank=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    duration_ms = models.PositiveIntegerField(default=0)
+    # Size of each section of the prompt sent by create_enhanced_message, in bytes
+    context_bytes = models.PositiveIntegerField(default=0)
+    directory_bytes = models.PositiveIntegerField(default=0)
+    instructions_bytes = models.PositiveIntegerField(default=0)
+    question_bytes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Reports over a period
+            models.Index(fields=['created_at'], name='aiusage_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M} - {self.prompt_tokens}+{self.completion_tokens} tokens"
+
+
+class OrgChartVersion(models.Model):
+    """
+    Version of the org chart, one row shared by every process through the
+    database: users/orgchart.py bumps it on each hierarchy change, and each
+    process rebuilds its in-memory chart when the version moved.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Org chart v{self.version}"
@@ -0,0 +1,191 @@
+"""
+In-memory org chart used by the org chart API.
+
+The whole hierarchy is loaded with a single query into an adjacency map
+(manager employee ID -> report IDs) and kept per process. Saving or
+deleting a CustomUser bumps the version number stored in the database
+(the OrgChartVersion row, shared by every web worker and management
+command) so that every process rebuilds its map on the next request; bulk
+writes that bypass the signals (import_hr_data) call invalidate_org_chart()
+themselves.
+"""
+import json
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CustomUser, OrgChartVersion
+
+logger = logging.getLogger(__name__)
+
+# Columns loaded for each employee, a change to any other column keeps the chart valid
+NODE_FIELDS = ('employee_id', 'first_name', 'last_name', 'email', 'departement', 'poste', 'responsable_id')
+
+# Encoded subtrees kept per chart, the whole company being the most requested one
+SUBTREE_CACHE_SIZE = 128
+
+
+class OrgChart:
+    """Adjacency map of the active employees, with cycle and orphan detection"""
+
+    def __init__(self, rows):
+        self.nodes = {}
+        self.parents = {}
+        for employee_id, first_name, last_name, email, departement, poste, responsable_id in rows:
+            self.nodes[employee_id] = {
+                'employee_id': employee_id,
+                'name': f"{first_name} {last_name}".strip(),
+                'email': email or '',
+                'departement': departement or '',
+                'poste': poste or '',
+            }
+            self.parents[employee_id] = responsable_id
+
+        self.children = defaultdict(list)
+        # Employees whose responsable is unknown or inactive
+        self.orphans = []
+        self.roots = []
+        for employee_id, manager_id in self.parents.items():
+            if manager_id is None:
+                self.roots.append(employee_id)
+            elif manager_id in self.nodes:
+                self.children[manager_id].append(employee_id)
+            else:
+                self.orphans.append(employee_id)
+                self.roots.append(employee_id)
+        for reports in self.children.values():
+            reports.sort()
+
+        self.cycles = self.find_cycles()
+        self.total_reports = self.count_reports()
+        self.subtree_json = lru_cache(maxsize=SUBTREE_CACHE_SIZE)(self.encode_subtree)
+
+    def find_cycles(self):
+        """Management loops (A -> B -> A), each listed once as the employee IDs in the loop"""
+        state = {}
+        cycles = []
+        for start in self.nodes:
+            path = []
+            node = start
+            while node in self.nodes and node not in state:
+                state[node] = start
+                path.append(node)
+                node = self.parents[node]
+            # The walk stopped on a node visited during this same walk: it closed a loop
+            if node in self.nodes and state[node] == start:
+                cycles.append(path[path.index(node):])
+        return cycles
+
+    def count_reports(self):
+        """Number of direct and indirect reports of every employee reachable from a root"""
+        order = []
+        stack = list(self.roots)
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(self.children.get(node, ()))
+        totals = dict.fromkeys(order, 0)
+        for node in reversed(order):
+            parent = self.parents[node]
+            if parent in totals:
+                totals[parent] += totals[node] + 1
+        return totals
+
+    def __contains__(self, employee_id):
+        return employee_id in self.nodes
+
+    def subtree(self, employee_id, depth=None):
+        """
+        Nested dict of ``employee_id`` and its reports, ``depth`` levels deep
+        (None for the whole subtree). Nodes cut by the depth limit keep their
+        report counts and an empty ``reports`` list.
+        """
+        root = self.node(employee_id)
+        stack = [(employee_id, root, 0)]
+        seen = {employee_id}
+        while stack:
+            node_id, node, level = stack.pop()
+            if depth is not None and level >= depth:
+                continue
+            for report_id in self.children.get(node_id, ()):
+                # Employees stuck in a management loop are only reached once
+                if report_id in seen:
+                    continue
+                seen.add(report_id)
+                child = self.node(report_id)
+                node['reports'].append(child)
+                stack.append((report_id, child, level + 1))
+        return root
+
+    def encode_subtree(self, employee_id, depth=None):
+        """JSON text of subtree(), memoized as subtree_json() for the lifetime of the chart"""
+        return json.dumps(self.subtree(employee_id, depth), ensure_ascii=False, separators=(',', ':'))
+
+    def node(self, employee_id):
+        return {
+            **self.nodes[employee_id],
+            'direct_reports': len(self.children.get(employee_id, ())),
+            'total_reports': self.total_reports.get(employee_id, 0),
+            'reports': [],
+        }
+
+
+_lock = threading.Lock()
+_chart = None
+_chart_version = None
+
+
+def current_version():
+    """Org chart version shared by all processes (one primary key lookup)"""
+    return OrgChartVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+def get_org_chart():
+    """The org chart of this process, rebuilt when the shared version changed"""
+    global _chart, _chart_version
+    version = current_version()
+    if _chart is not None and _chart_version == version:
+        return _chart
+    with _lock:
+        if _chart is None or _chart_version != version:
+            rows = CustomUser.objects.filter(
+                is_active=True, employee_id__isnull=False
+            ).values_list(*NODE_FIELDS)
+            chart = OrgChart(rows)
+            if chart.cycles:
+                logger.warning("Org chart: management loops between %s", chart.cycles)
+            if chart.orphans:
+                logger.warning("Org chart: unknown or inactive manager for %s", chart.orphans)
+            _chart, _chart_version = chart, version
+        return _chart
+
+
+def invalidate_org_chart():
+    """Make every process rebuild its org chart on next use"""
+    if OrgChartVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            OrgChartVersion.objects.create(pk=1, version=1)
+    except IntegrityError:
+        # Created meanwhile by another process
+        OrgChartVersion.objects.filter(pk=1).update(version=F('version') + 1)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_on_save(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login
+    if update_fields is not None and not set(update_fields) & {*NODE_FIELDS, 'responsable', 'is_active'}:
+        return
+    invalidate_org_chart()
+
+
+@receiver(post_delete, sender=CustomUser)
+def invalidate_on_delete(sender, instance, **kwargs):
+    invalidate_org_chart()
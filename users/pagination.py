@@ -0,0 +1,75 @@
+"""
+Keyset (cursor) pagination helpers shared by the chat API endpoints.
+
+A cursor identifies a row by its ordering timestamp and primary key, encoded
+as ``<microseconds since epoch>-<id>`` so it can be passed around in URLs
+without escaping.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+# Largest primary key a cursor may hold (64-bit signed integer columns)
+MAX_ID = 2 ** 63 - 1
+
+
+def encode_cursor(timestamp, pk):
+    """Encode a (timestamp, id) pair into an opaque cursor string"""
+    micros = (timestamp - EPOCH) // timedelta(microseconds=1)
+    return f"{micros}-{pk}"
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+    Returns None for an empty cursor and raises ValueError if it is malformed
+    or out of range.
+    """
+    if not cursor:
+        return None
+    micros, _, pk = cursor.partition('-')
+    if not pk:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    pk = int(pk)
+    if not 0 <= pk <= MAX_ID:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    try:
+        # OverflowError: past the range of timedelta or datetime
+        return EPOCH + timedelta(microseconds=int(micros)), pk
+    except OverflowError:
+        raise ValueError(f"Invalid cursor: {cursor}") from None
+
+
+def parse_limit(value, default, maximum):
+    """Parse a page size from the query string, clamped to [1, maximum]"""
+    if not value:
+        return default
+    return max(1, min(int(value), maximum))
+
+
+def keyset_page(queryset, field, cursor, limit, descending):
+    """
+    Return up to ``limit`` rows strictly past ``cursor`` in (field, id) order,
+    plus a flag telling whether more rows remain in that direction.
+
+    The cursor condition is expressed as ``field <= ts`` (or ``>=``) with the
+    boundary rows excluded, which keeps the lookup a range scan on a
+    (…, field, id) index instead of an OR over two branches.
+    """
+    if descending:
+        ordering = (f'-{field}', '-id')
+        if cursor:
+            timestamp, pk = cursor
+            queryset = queryset.filter(**{f'{field}__lte': timestamp}).exclude(
+                **{field: timestamp, 'id__gte': pk}
+            )
+    else:
+        ordering = (field, 'id')
+        if cursor:
+            timestamp, pk = cursor
+            queryset = queryset.filter(**{f'{field}__gte': timestamp}).exclude(
+                **{field: timestamp, 'id__lte': pk}
+            )
+
+    rows = list(queryset.order_by(*ordering)[:limit + 1])
+    has_more = len(rows) > limit
+    return rows[:limit], has_more
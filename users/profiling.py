@@ -0,0 +1,300 @@
+"""
+On-demand profiling of single requests, stored on disk and listed in the admin.
+
+A request is profiled when a staff member asks for it, with the
+``X-Profile`` header or the ``?profile=`` query parameter (value
+``deterministic`` or ``sample``, anything else means PROFILING_MODE), or
+when it is drawn by PROFILING_SAMPLE_PERCENT. Two profilers:
+- deterministic: cProfile, every call counted, a few times slower; only
+  one can run at a time in the process, so concurrent requests fall back
+  to sampling. Since Python 3.12 cProfile records every thread: it is only
+  started when no other request is in flight, and the requests started
+  while it runs are counted in the profile (``concurrent_requests``),
+- sample: a background thread records the stack of the request thread
+  every PROFILING_SAMPLE_INTERVAL seconds, for a low overhead.
+
+Each profile is written to PROFILING_DIR as a JSON file (request metadata
+and per-function times), plus the raw pstats data of deterministic
+profiles for snakeviz or pstats. Only the PROFILING_MAX_FILES most recent
+profiles are kept.
+
+With PROFILING_ENABLED off the middleware is not loaded at all.
+"""
+import cProfile
+import itertools
+import json
+import logging
+import os
+import pstats
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+MODES = ('deterministic', 'sample')
+# Function rows kept per stored profile, by cumulative time
+STORED_FUNCTIONS = 300
+
+# cProfile relies on sys.monitoring since Python 3.12, which sees all threads
+PROFILES_ALL_THREADS = sys.version_info >= (3, 12)
+
+_deterministic_lock = threading.Lock()
+# Requests started and finished by this process, counted without a lock: next() on
+# itertools.count is atomic. The totals are stored by whichever request counted
+# last, so they may lag behind, never run ahead.
+_started = itertools.count(1)
+_finished = itertools.count(1)
+_totals = {'started': 0, 'finished': 0}
+
+
+def profile_dir():
+    return settings.PROFILING_DIR or os.path.join(tempfile.gettempdir(), 'hrbot-profiles')
+
+
+def function_label(filename, lineno, name):
+    """'users/views.py:329(send_message)', paths shortened to the project or the installed package"""
+    root = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(root):
+        filename = filename[len(root):]
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    return f"{filename}:{lineno}({name})" if lineno else name
+
+
+class DeterministicProfiler:
+    """cProfile around the request, when no other deterministic profile is running"""
+
+    mode = 'deterministic'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def functions(self):
+        rows = []
+        for (filename, lineno, name), (_, calls, self_time, cumulative, _) in pstats.Stats(self.profile).stats.items():
+            rows.append({
+                'function': function_label(filename, lineno, name),
+                'calls': calls,
+                'self_s': self_time,
+                'cumulative_s': cumulative,
+            })
+        return rows
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+class SamplingProfiler:
+    """Stack samples of the request thread, taken from a background thread"""
+
+    mode = 'sample'
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.samples = 0
+        # code key -> samples with the function on top of the stack / anywhere in it
+        self.own = {}
+        self.total = {}
+        self.sampler = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            code = frame.f_code
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            self.own[key] = self.own.get(key, 0) + 1
+            seen = set()
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                if key not in seen:
+                    seen.add(key)
+                    self.total[key] = self.total.get(key, 0) + 1
+                frame = frame.f_back
+
+    def functions(self):
+        return [
+            {
+                'function': function_label(*key),
+                'calls': None,
+                'self_s': self.own.get(key, 0) * self.interval,
+                'cumulative_s': samples * self.interval,
+            }
+            for key, samples in self.total.items()
+        ]
+
+    def dump(self, path):
+        pass
+
+
+def requested_mode(request):
+    """Profiler asked for by a staff member, None if the request is not to be profiled on demand"""
+    value = request.META.get('HTTP_X_PROFILE')
+    # Only parse the query string of the requests that may ask for a profile
+    if not value and 'profile=' in request.META.get('QUERY_STRING', ''):
+        value = request.GET.get('profile')
+    if not value or not request.user.is_staff:
+        return None
+    return value if value in MODES else settings.PROFILING_MODE
+
+
+def make_profiler(mode, in_flight=1):
+    """
+    Profiler for ``mode``, a sampling one if cProfile would also record the
+    other requests in flight or already profiles another request
+    """
+    alone = not PROFILES_ALL_THREADS or in_flight <= 1
+    if mode == 'deterministic' and alone and _deterministic_lock.acquire(blocking=False):
+        return DeterministicProfiler()
+    return SamplingProfiler(settings.PROFILING_SAMPLE_INTERVAL)
+
+
+def release(profiler):
+    if profiler.mode == 'deterministic':
+        _deterministic_lock.release()
+
+
+def save_profile(profiler, request, response, duration, trigger, concurrent_requests=None):
+    """Write the profile and its request metadata, then drop the oldest profiles"""
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    now = datetime.now(dt_timezone.utc)
+    profile_id = f"{now:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:6]}"
+    functions = sorted(profiler.functions(), key=lambda row: -row['cumulative_s'])[:STORED_FUNCTIONS]
+    user = request.user if request.user.is_authenticated else None
+    data = {
+        'id': profile_id,
+        'created_at': now.isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'query_string': request.META.get('QUERY_STRING', ''),
+        'view': request.resolver_match.view_name if request.resolver_match else None,
+        'status': response.status_code,
+        'duration_ms': duration * 1000,
+        'user': user.username if user else None,
+        'employee_id': getattr(user, 'employee_id', None),
+        'trigger': trigger,
+        'mode': profiler.mode,
+        'samples': getattr(profiler, 'samples', None),
+        'concurrent_requests': concurrent_requests,
+        'functions': functions,
+    }
+    if profiler.mode == 'deterministic':
+        profiler.dump(os.path.join(directory, f"{profile_id}.prof"))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.profile-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, os.path.join(directory, f"{profile_id}.json"))
+    rotate(directory, settings.PROFILING_MAX_FILES)
+    return profile_id
+
+
+def rotate(directory, keep):
+    """Delete all but the ``keep`` most recent profiles (IDs sort by creation time)"""
+    ids = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for profile_id in ids[:-keep] if keep else ids:
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, profile_id + extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    """Metadata of the stored profiles, most recent first"""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        data = load_profile(name[:-5])
+        if data:
+            data.pop('functions', None)
+            profiles.append(data)
+    return profiles
+
+
+def load_profile(profile_id):
+    """Stored profile ``profile_id``, None if unknown or already rotated out"""
+    if os.sep in profile_id or profile_id.startswith('.'):
+        return None
+    try:
+        with open(os.path.join(profile_dir(), f"{profile_id}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ProfilingMiddleware:
+    """Profile the requests asked for by staff (X-Profile, ?profile=) or drawn by the sample percentage"""
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_PERCENT / 100
+
+    def __call__(self, request):
+        number = _totals['started'] = next(_started)
+        try:
+            return self.handle(request, number)
+        finally:
+            _totals['finished'] = next(_finished)
+
+    def handle(self, request, number):
+        mode = requested_mode(request)
+        trigger = 'staff'
+        if mode is None:
+            if not self.sample_rate or random.random() >= self.sample_rate:
+                return self.get_response(request)
+            mode, trigger = settings.PROFILING_MODE, 'sample'
+
+        # At least this request, more if a finished one has not stored its count yet
+        profiler = make_profiler(mode, in_flight=number - _totals['finished'])
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+            release(profiler)
+        duration = time.perf_counter() - start
+        # Requests whose calls a deterministic profile also recorded
+        concurrent = None
+        if profiler.mode == 'deterministic' and PROFILES_ALL_THREADS:
+            concurrent = max(_totals['started'] - number, 0)
+        try:
+            profile_id = save_profile(profiler, request, response, duration, trigger, concurrent)
+        except OSError as e:
+            logger.error(f"Could not save the profile of {request.path}: {e}")
+        else:
+            response['X-Profile-Id'] = profile_id
+        return response
@@ -0,0 +1,100 @@
+"""
+Purge of deleted chats.
+
+Deleting a chat only sets Chat.deleted_at, which hides it at once. The
+rows are removed later, by a background thread started after the deletion
+(CHAT_PURGE_IN_BACKGROUND) or by the purge_deleted_chats command. Messages
+go first, in small raw DELETE statements that each commit on their own, so
+a long chat never holds the write lock for more than one batch; the chat
+row goes last, once nothing references it anymore.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Chat, Message, MessageArchive
+
+logger = logging.getLogger(__name__)
+
+# Messages removed per DELETE statement
+PURGE_BATCH_SIZE = 500
+
+_purge_lock = threading.Lock()
+_purge_thread = None
+
+
+def delete_in_batches(model, column, values, batch_size):
+    """Delete the rows of ``model`` whose ``column`` is in ``values``, ``batch_size`` at a time"""
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    pk = qn(model._meta.pk.column)
+    placeholders = ', '.join(['%s'] * len(values))
+    sql = (
+        f"DELETE FROM {table} WHERE {pk} IN "
+        f"(SELECT {pk} FROM {table} WHERE {qn(column)} IN ({placeholders}) LIMIT %s)"
+    )
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [*values, batch_size])
+            count = cursor.rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def purge_chats(chat_ids, batch_size=PURGE_BATCH_SIZE):
+    """Remove deleted chats and their messages, returns the number of messages removed"""
+    # Messages before the chats: the full-text index trigger reads the chat owner
+    deleted = delete_in_batches(Message, 'chat_id', chat_ids, batch_size)
+    delete_in_batches(MessageArchive, 'chat_id', chat_ids, batch_size)
+    # Nothing left to collect, unless a reply landed meanwhile: the cascade removes it
+    Chat.objects.filter(pk__in=chat_ids, deleted_at__isnull=False).delete()
+    return deleted
+
+
+def purge_deleted_chats(batch_size=PURGE_BATCH_SIZE, chats_per_pass=100):
+    """Purge every chat marked as deleted, returns (chats, messages) removed"""
+    chats = messages = 0
+    while True:
+        chat_ids = list(
+            Chat.objects.filter(deleted_at__isnull=False).order_by('deleted_at').values_list('id', flat=True)[:chats_per_pass]
+        )
+        if not chat_ids:
+            return chats, messages
+        messages += purge_chats(chat_ids, batch_size)
+        chats += len(chat_ids)
+
+
+def _run_purge():
+    global _purge_thread
+    try:
+        while True:
+            chats, messages = purge_deleted_chats()
+            if chats:
+                logger.info(f"Purged {chats} deleted chats ({messages} messages)")
+            with _purge_lock:
+                # Chats deleted while the last pass ran are purged before leaving
+                if not Chat.objects.filter(deleted_at__isnull=False).exists():
+                    _purge_thread = None
+                    return
+    except Exception:
+        logger.exception("Background purge of deleted chats failed")
+        with _purge_lock:
+            _purge_thread = None
+    finally:
+        connection.close()
+
+
+def schedule_purge():
+    """Start the background purge unless it is already running or disabled"""
+    global _purge_thread
+    if not settings.CHAT_PURGE_IN_BACKGROUND:
+        return
+    with _purge_lock:
+        if _purge_thread is not None:
+            return
+        _purge_thread = threading.Thread(target=_run_purge, name='chat-purge', daemon=True)
+        _purge_thread.start()
@@ -0,0 +1,219 @@
+"""
+N+1 and slow query detection, for development and tests.
+
+QueryInspector is a database execute wrapper grouping the statements of a
+block by normalized SQL (literals and IN lists replaced by placeholders),
+with the application stack that first issued each statement and the stack
+of every slow query:
+- QueryInspectorMiddleware logs the repeated (N+1) and slow queries of each
+  request on the ``users.querycheck`` logger,
+- @query_budget(...) declares the query budget of a view; exceeded budgets
+  are logged, or raise QueryBudgetExceeded under the test runner
+  (users.runner.QueryBudgetTestRunner),
+- assert_query_budget(...) checks a block of code in a test.
+
+Nothing runs unless QUERY_INSPECTOR_ENABLED (DEBUG by default) is set.
+"""
+import logging
+import os
+import re
+import time
+import traceback
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+logger = logging.getLogger(__name__)
+
+# Transaction control statements, neither counted nor grouped
+SKIPPED_PREFIXES = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK', 'COMMIT')
+# Application frames kept per stack, innermost last
+STACK_DEPTH = 6
+# Statements shown per report
+REPORT_LIMIT = 5
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A block or view ran more, more repeated or slower queries than its budget"""
+
+
+def normalize_sql(sql):
+    """
+    Statement shape of ``sql``: string and number literals, parameters and
+    IN lists of any length are replaced, so that the queries of an N+1
+    loop share one key
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql).replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def application_stack():
+    """Innermost frames of the current stack that belong to the project, outside this module"""
+    root = str(settings.BASE_DIR) + os.sep
+    vendored = os.sep + 'site-packages' + os.sep
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(root) and frame.filename != __file__ and vendored not in frame.filename
+    ]
+    return [
+        f"{os.path.relpath(frame.filename, root)}:{frame.lineno} in {frame.name}"
+        for frame in frames[-STACK_DEPTH:]
+    ]
+
+
+class Statement:
+    """Executions of one normalized statement"""
+
+    __slots__ = ('sql', 'count', 'duration', 'stack')
+
+    def __init__(self, sql, stack):
+        self.sql = sql
+        self.count = 0
+        self.duration = 0.0
+        self.stack = stack
+
+
+class QueryInspector:
+    """Database execute wrapper recording the statements of a block"""
+
+    def __init__(self, slow_query_ms=None):
+        self.slow_query_ms = settings.SLOW_QUERY_MS if slow_query_ms is None else slow_query_ms
+        self.statements = {}
+        # (duration in seconds, SQL, stack)
+        self.slow = []
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, time.perf_counter() - start)
+
+    def record(self, sql, elapsed):
+        if sql.lstrip()[:9].upper().startswith(SKIPPED_PREFIXES):
+            return
+        self.count += 1
+        self.duration += elapsed
+        key = normalize_sql(sql)
+        statement = self.statements.get(key)
+        if statement is None:
+            statement = self.statements[key] = Statement(key, application_stack())
+        statement.count += 1
+        statement.duration += elapsed
+        if elapsed * 1000 >= self.slow_query_ms:
+            self.slow.append((elapsed, sql, application_stack()))
+
+    def repeated(self, max_repeats):
+        """Statements run more than ``max_repeats`` times, most repeated first"""
+        return sorted(
+            (statement for statement in self.statements.values() if statement.count > max_repeats),
+            key=lambda statement: -statement.count,
+        )
+
+    def violations(self, max_queries=None, max_repeats=None):
+        """Descriptions of the exceeded limits, empty when the block is within budget"""
+        max_repeats = settings.QUERY_MAX_REPEATS if max_repeats is None else max_repeats
+        violations = []
+        if max_queries is not None and self.count > max_queries:
+            violations.append(f"{self.count} queries (max {max_queries})")
+        for statement in self.repeated(max_repeats):
+            violations.append(f"statement run {statement.count} times (max {max_repeats}), N+1?")
+        for elapsed, sql, stack in self.slow:
+            violations.append(f"query took {elapsed * 1000:.0f} ms (max {self.slow_query_ms:g} ms)")
+        return violations
+
+    def report(self, title, max_repeats=None):
+        """Human-readable report of the repeated and slow statements, with their stacks"""
+        max_repeats = settings.QUERY_MAX_REPEATS if max_repeats is None else max_repeats
+        lines = [f"{title}: {self.count} queries in {self.duration * 1000:.1f} ms"]
+        for statement in self.repeated(max_repeats)[:REPORT_LIMIT]:
+            lines.append(
+                f"  {statement.count}x ({statement.duration * 1000:.1f} ms) {statement.sql[:300]}"
+            )
+            lines.extend(f"      {frame}" for frame in statement.stack)
+        for elapsed, sql, stack in sorted(self.slow, key=lambda slow: -slow[0])[:REPORT_LIMIT]:
+            lines.append(f"  slow {elapsed * 1000:.1f} ms: {sql[:300]}")
+            lines.extend(f"      {frame}" for frame in stack)
+        return '\n'.join(lines)
+
+
+class QueryInspectorMiddleware:
+    """Log the repeated (N+1) and slow queries of each request, when QUERY_INSPECTOR_ENABLED"""
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTOR_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inspector = QueryInspector()
+        with connection.execute_wrapper(inspector):
+            response = self.get_response(request)
+        if inspector.violations():
+            logger.warning(inspector.report(f"{request.method} {request.path}"))
+        return response
+
+
+def enforce(inspector, title, max_queries=None, max_repeats=None):
+    violations = inspector.violations(max_queries, max_repeats)
+    if not violations:
+        return
+    message = f"{inspector.report(title, max_repeats)}\n  budget exceeded: {'; '.join(violations)}"
+    if settings.QUERY_BUDGET_RAISE:
+        raise QueryBudgetExceeded(message)
+    logger.error(message)
+
+
+def query_budget(max_queries=None, max_repeats=None, slow_query_ms=None):
+    """
+    Declare the query budget of a view: at most ``max_queries`` queries, no
+    statement repeated more than ``max_repeats`` times (QUERY_MAX_REPEATS)
+    and none slower than ``slow_query_ms`` (SLOW_QUERY_MS). Only the
+    queries of the view itself count, not those of the middlewares.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.QUERY_INSPECTOR_ENABLED:
+                return view(request, *args, **kwargs)
+            inspector = QueryInspector(slow_query_ms)
+            with connection.execute_wrapper(inspector):
+                response = view(request, *args, **kwargs)
+            enforce(inspector, f"{view.__name__} ({request.method} {request.path})", max_queries, max_repeats)
+            return response
+
+        wrapper.query_budget = {'max_queries': max_queries, 'max_repeats': max_repeats, 'slow_query_ms': slow_query_ms}
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def assert_query_budget(max_queries=None, max_repeats=None, slow_query_ms=None, using=DEFAULT_DB_ALIAS):
+    """
+    Fail with QueryBudgetExceeded if the block runs more than ``max_queries``
+    queries, repeats a statement or runs a slow query:
+
+        with assert_query_budget(max_queries=3):
+            client.get('/api/chats/')
+    """
+    inspector = QueryInspector(slow_query_ms)
+    with connections[using].execute_wrapper(inspector):
+        yield inspector
+    violations = inspector.violations(max_queries, max_repeats)
+    if violations:
+        raise QueryBudgetExceeded(
+            f"{inspector.report('Query budget exceeded', max_repeats)}\n  {'; '.join(violations)}"
+        )
+
@@ -0,0 +1,20 @@
+"""
+Test runner of the project (TEST_RUNNER): the views' @query_budget are
+checked, and a test calling a view over its budget fails with
+QueryBudgetExceeded (users/querycheck.py).
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """Test runner failing the tests that call a view over its @query_budget"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.query_budgets = override_settings(QUERY_INSPECTOR_ENABLED=True, QUERY_BUDGET_RAISE=True)
+        self.query_budgets.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.query_budgets.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,134 @@
+"""
+Full-text search over chat messages.
+
+On SQLite, messages are indexed in the users_message_fts FTS5 table
+(migration 0011) and searched with MATCH, ranked by bm25. Other databases
+fall back to a case-insensitive LIKE scan.
+"""
+import html
+import re
+
+from django.db import connections
+
+from .models import Message
+
+FTS_TABLE = 'users_message_fts'
+# Snippet highlight markers, replaced by <mark> once the text is HTML-escaped
+MARK_START = '\x02'
+MARK_END = '\x03'
+SNIPPET_TOKENS = 12
+
+_fts_ready = set()
+
+
+def fts_available(connection):
+    """True when the FTS5 index exists on this database"""
+    if connection.alias in _fts_ready:
+        return True
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        if cursor.fetchone() is None:
+            return False
+    _fts_ready.add(connection.alias)
+    return True
+
+
+def match_expression(query, user_id=None):
+    """
+    FTS5 query for the words of a user search: every word must appear in
+    the message (the last one as a prefix, for search-as-you-type) and each
+    word is quoted so that FTS5 operators in the input are taken literally.
+    Returns None when the search has no word.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = ' '.join(f'"{word}"' for word in words) + '*'
+    expression = f'content : ({terms})'
+    if user_id is not None:
+        expression = f'chat_user : "u{user_id}" AND {expression}'
+    return expression
+
+
+def highlight(snippet):
+    """HTML-escaped snippet with the matched words wrapped in <mark>"""
+    return html.escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def search_messages(user, query, limit=20, using='default'):
+    """
+    Best matches for ``query`` among the messages of ``user``'s chats, as
+    dicts with the message, its chat and an HTML snippet.
+    """
+    connection = connections[using]
+    if fts_available(connection):
+        expression = match_expression(query, user.pk)
+        if expression is None:
+            return []
+        with connection.cursor() as cursor:
+            # Deleted chats stay in the index until purged
+            cursor.execute(
+                f"SELECT rowid, snippet({FTS_TABLE}, 0, %s, %s, '…', %s) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid NOT IN ("
+                "SELECT m.id FROM users_message m JOIN users_chat c ON c.id = m.chat_id "
+                "WHERE c.user_id = %s AND c.deleted_at IS NOT NULL"
+                ") ORDER BY rank LIMIT %s",
+                [MARK_START, MARK_END, SNIPPET_TOKENS, expression, user.pk, limit],
+            )
+            hits = cursor.fetchall()
+        snippets = {message_id: highlight(snippet) for message_id, snippet in hits}
+        order = [message_id for message_id, _ in hits]
+        messages = Message.objects.filter(id__in=order)
+    else:
+        if not query.strip():
+            return []
+        messages = Message.objects.filter(chat__user=user, chat__deleted_at=None, content__icontains=query.strip()).order_by('-created_at')[:limit]
+        snippets = None
+        order = None
+
+    rows = messages.values('id', 'chat_id', 'chat__title', 'sender', 'content', 'created_at')
+    results = {
+        row['id']: {
+            'message_id': row['id'],
+            'chat_id': row['chat_id'],
+            'chat_title': row['chat__title'],
+            'sender': row['sender'],
+            'snippet': snippets[row['id']] if snippets else html.escape(row['content'][:200]),
+            'created_at': row['created_at'].isoformat(),
+        }
+        for row in rows
+    }
+    return [results[message_id] for message_id in (order or results) if message_id in results]
+
+
+def matching_message_ids_sql(query):
+    """
+    (sql, params) of a subquery selecting the ids of all messages matching
+    ``query``, for the admin search; None without the FTS index or words
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return None
+    return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression]
+
+
+def admin_message_ids_sql(query):
+    """
+    (sql, params) of a subquery selecting the ids of the messages matching
+    ``query`` or belonging to a chat whose title contains it, for the admin
+    search. Both are indexed lookups combined with UNION: an OR of the two
+    in the outer WHERE makes SQLite scan every message.
+    """
+    pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    sql = (
+        "SELECT id FROM users_message WHERE chat_id IN "
+        "(SELECT id FROM users_chat WHERE title LIKE %s ESCAPE '\\')"
+    )
+    params = [pattern]
+    fts = matching_message_ids_sql(query)
+    if fts:
+        sql = f"{fts[0]} UNION {sql}"
+        params = fts[1] + params
+    return sql, params
@@ -0,0 +1,291 @@
+"""
+Deterministic synthetic HR data used by generate_org and the audit and
+benchmark commands.
+
+The same (count, seed, span) always produces the same organization:
+employee E1 is the CEO, heading one director per department; below them
+every manager has between half and one and a half times ``span`` direct
+reports. On the last level, managers are drawn at random so that the
+remaining headcount is spread over every department. Salaries, health plans and titles follow
+the level in the hierarchy.
+"""
+import csv
+import math
+import random
+import unicodedata
+from collections import Counter, deque
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from .bulk import insert_rows
+from .hr_import import HR_CSV_COLUMNS, hr_csv_row
+from .models import Chat, CustomUser, Message, ORG_PATH_SEPARATOR
+
+FIRST_NAMES = [
+    'Jean', 'Marie', 'Pierre', 'Sophie', 'Luc', 'Camille', 'Nicolas', 'Élodie', 'Julien', 'Chloé',
+    'Thomas', 'Léa', 'Antoine', 'Inès', 'Hugo', 'Manon', 'Éric', 'Zoé', 'François', 'Amélie',
+    'Jean-Pierre', 'Marie-Claire', 'Anne Sophie', 'Jérôme', 'Hélène', 'Benoît', 'Cécile', 'Gaël',
+    'Mathéo', 'Maëlle', 'Noémie', 'Raphaël', 'Héloïse', 'Clément', 'Agnès', 'Loïc', 'Océane', 'Stéphane',
+    'Jean-Baptiste', 'Anne-Laure', 'Marie Hélène', 'Pierre-Yves', 'Louis', 'Emma', 'Gabriel', 'Alice',
+    'Arthur', 'Juliette', 'Paul', 'Louise', 'Victor', 'Margaux', 'Baptiste', 'Solène', 'Adèle', 'Joël',
+]
+LAST_NAMES = [
+    'Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+    'Simon', 'Laurent', 'Lefèvre', 'Michel', 'Garcia', 'David', 'Bertrand', 'Roux', 'Vincent', 'Fournier',
+    'Girard', 'Bonnet', 'Dupont', 'Lambert', 'Fontaine', 'Rousseau', 'Le Gall', 'Saint-Martin', 'Chevalier',
+    'Mercier', 'Blanc', 'Guérin', 'Boyer', 'Gauthier', 'Perrin', 'Morel', 'Faure', 'André', 'Lemaître',
+    'Hervé', 'Bénard', 'Lécuyer', 'Le Goff', 'De la Fontaine', 'Da Silva', 'Nguyen', 'Benali', 'Ferré',
+]
+# Share of double-barrelled last names (e.g. "Dupont-Moreau")
+COMPOSED_LAST_NAME_RATE = 0.08
+JOB_TITLES = {
+    'IT': ['Développeur', 'Ingénieur DevOps', 'Data Engineer', 'Administrateur Système', 'Analyste Sécurité'],
+    'Marketing': ['Chargé de Communication', 'Traffic Manager', 'Content Manager', 'Data Marketing Analyst'],
+    'Finance': ['Comptable', 'Contrôleur de Gestion', 'Analyste Financier', 'Trésorier'],
+    'RH': ['Chargé de Recrutement', 'Gestionnaire Paie', 'Responsable Formation', 'Assistant RH'],
+    'Ventes': ['Commercial', 'Account Manager', 'Business Developer', 'Assistant Commercial'],
+    'Recherche': ['Chercheur', 'Ingénieur R&D', 'Technicien Laboratoire', 'Data Scientist'],
+    'Direction': ['Assistant de Direction', 'Chargé de Mission', 'Juriste'],
+}
+MANAGER_TITLES = ['Manager', 'Responsable', "Chef d'équipe"]
+DEPARTMENTS = [code for code, _ in CustomUser.DEPARTMENT_CHOICES if code != 'Direction']
+REGIMES = [code for code, _ in CustomUser.REGIME_SANTE_CHOICES]
+
+# Annual salary range (k€) per level: CEO, directors, managers, other employees
+SALARY_RANGES = [(220, 300), (110, 180), (50, 95), (30, 65)]
+
+# Questions asked to the bot and the title of the chat they open
+QUESTIONS = [
+    ("Combien de jours de congés me reste-t-il ?", 'Congés & Absences'),
+    ("Je voudrais poser une semaine de vacances en août, comment faire ?", 'Congés & Absences'),
+    ("Quel est mon salaire annuel ?", 'Rémunération'),
+    ("Quand aura lieu ma prochaine évaluation ?", 'Rémunération'),
+    ("Qui est mon manager ?", 'Management'),
+    ("Qui travaille dans le département Marketing ?", 'Équipe & Organisation'),
+    ("Quel est l'email de la responsable formation ?", 'Contacts'),
+    ("Quelle est la procédure en cas d'arrêt maladie ?", 'Congés & Absences'),
+    ("Quelles formations sont proposées cette année ?", 'Formation'),
+    ("Donne-moi toutes mes infos", 'Mon Profil'),
+    ("Combien de personnes dans mon équipe ?", 'Statistiques'),
+    ("Bonjour", 'Bonjour'),
+]
+REPLY_SENTENCES = [
+    "D'après vos données RH, voici les informations demandées.",
+    "Les demandes de congés doivent être faites au moins deux semaines à l'avance.",
+    "Votre manager valide la demande dans l'outil RH, puis le service paie est informé.",
+    "• Camille Martin (E42) - Chargé de Recrutement - camille.martin@company.com",
+    "Vous pouvez consulter le détail de votre rémunération sur votre espace salarié.",
+    "En cas d'arrêt maladie, prévenez votre manager et envoyez l'arrêt au service RH sous 48h.",
+    "Le catalogue de formations est disponible sur l'intranet.",
+    "N'hésitez pas si vous avez d'autres questions.",
+]
+# Length of the bot replies in characters: log-normal around the median, capped
+# (the last sentence may run past the cap)
+REPLY_MEDIAN_LENGTH = 450
+REPLY_LENGTH_SIGMA = 0.7
+REPLY_MAX_LENGTH = 6000
+
+
+def employee_id(index):
+    """Employee ID of the index-th generated employee (0-based)"""
+    return f"E{index + 1}"
+
+
+_slugs = {}
+
+
+def ascii_slug(name):
+    """Lowercase ASCII form of a name for email addresses ("Anne Sophie" -> "anne-sophie")"""
+    slug = _slugs.get(name)
+    if slug is None:
+        decomposed = unicodedata.normalize('NFKD', name)
+        slug = _slugs[name] = ''.join(c for c in decomposed if not unicodedata.combining(c)).lower().replace(' ', '-')
+    return slug
+
+
+def generate_employees(count, seed=0, span=6):
+    """
+    Yield ``count`` employee records as dicts of CustomUser field values,
+    managers before their reports (breadth first). ``responsable_id`` holds
+    the manager's employee ID.
+    """
+    rng = random.Random(seed)
+    emails = Counter()
+    # Department, org_path and level of the managers whose reports are not all generated yet
+    managers = {}
+    # (first report index, end, manager index) in generation order
+    pending = deque()
+    next_index = 1
+    # First index of the next level, and the mean span of the current one
+    level_end = 1
+    mean_span = span
+    for index in range(count):
+        if index == level_end:
+            # Every employee of the new level is known: on the last level, only a
+            # random share of them get reports, in every department alike
+            mean_span = min(span, (count - next_index) / (next_index - index))
+            level_end = next_index
+        if index:
+            while pending[0][1] <= index:
+                managers.pop(pending.popleft()[2])
+            manager_index = pending[0][2]
+            departement, manager_path, manager_level = managers[manager_index]
+            level = manager_level + 1
+            if level == 1:
+                departement = DEPARTMENTS[(index - 1) % len(DEPARTMENTS)]
+        else:
+            manager_index, departement, manager_path, level = None, 'Direction', '', 0
+
+        if index == 0:
+            reports = len(DEPARTMENTS)
+        # Nobody else on this level got reports: the last one must, or the tree stops short
+        elif rng.random() < mean_span / span or index == level_end - 1 and next_index == level_end < count:
+            reports = max(1, int(span * rng.uniform(0.5, 1.5) + rng.random()))
+        else:
+            reports = 0
+        reports = min(reports, count - next_index)
+        has_reports = reports > 0
+        emp_id = employee_id(index)
+        org_path = f"{manager_path}{emp_id}{ORG_PATH_SEPARATOR}"
+        if has_reports:
+            managers[index] = (departement, org_path, level)
+            pending.append((next_index, next_index + reports, index))
+            next_index += reports
+
+        if level == 0:
+            poste = 'PDG'
+        elif level == 1:
+            poste = f"Directeur {departement}"
+        elif has_reports:
+            poste = f"{rng.choice(MANAGER_TITLES)} {departement}"
+        else:
+            poste = rng.choice(JOB_TITLES[departement])
+
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        if rng.random() < COMPOSED_LAST_NAME_RATE:
+            last_name = f"{last_name}-{rng.choice(LAST_NAMES)}"
+        local_part = f"{ascii_slug(first_name)}.{ascii_slug(last_name)}"
+        emails[local_part] += 1
+        if emails[local_part] > 1:
+            local_part = f"{local_part}{emails[local_part]}"
+
+        salary_level = level if level < 2 else 2 if has_reports else 3
+        low, high = SALARY_RANGES[salary_level]
+        if salary_level < 2:
+            regime = 'Exécutif'
+        elif has_reports:
+            regime = 'Premium' if rng.random() < 0.6 else 'Standard'
+        else:
+            regime = rng.choice(REGIMES[:2]) if rng.random() < 0.3 else 'Standard'
+        hired = date(2005, 1, 1) + timedelta(days=rng.randrange(7300))
+        droit = rng.choice([22.0, 25.0, 27.0])
+        utilises = float(rng.randrange(int(droit)))
+        planifies = float(rng.randrange(int(droit - utilises) + 1))
+        maladie = float(rng.randrange(6))
+
+        yield {
+            'employee_id': emp_id,
+            'username': emp_id,
+            'first_name': first_name,
+            'last_name': last_name,
+            'email': f"{local_part}@company.com",
+            'departement': departement,
+            'is_manager': has_reports,
+            'poste': poste,
+            'responsable_id': employee_id(manager_index) if manager_index is not None else None,
+            'org_path': org_path,
+            'date_embauche': hired,
+            'conges_droit_annuel': droit,
+            'conges_utilises': utilises,
+            'conges_planifies': planifies,
+            'conges_restants': droit - utilises - planifies,
+            'conges_maladie_droit': 10.0,
+            'conges_maladie_utilises': maladie,
+            'conges_maladie_restants': 10.0 - maladie,
+            'salaire': float(rng.randrange(low, high) * 1000),
+            'eligible_prime': has_reports or rng.random() < 0.8,
+            'date_prochaine_evaluation': date(2026, hired.month, min(hired.day, 28)),
+            'regime_sante': regime,
+        }
+
+
+# Columns written by create_employees, in the order of the generated records
+EMPLOYEE_FIELDS = [
+    'employee_id', 'username', 'first_name', 'last_name', 'email', 'departement', 'is_manager', 'poste',
+    'responsable', 'org_path', 'date_embauche', 'conges_droit_annuel', 'conges_utilises', 'conges_planifies',
+    'conges_restants', 'conges_maladie_droit', 'conges_maladie_utilises', 'conges_maladie_restants', 'salaire',
+    'eligible_prime', 'date_prochaine_evaluation', 'regime_sante', 'password',
+]
+
+
+def create_employees(count, seed=0, span=6, password='!', batch_size=1000):
+    """
+    Insert a synthetic organization and return the number of rows.
+    ``password`` is stored as-is: pass a hash from make_password to allow
+    logging in, the default is an unusable password.
+    """
+    rows = (
+        tuple(record.values()) + (password,)
+        for record in generate_employees(count, seed=seed, span=span)
+    )
+    return insert_rows(CustomUser, EMPLOYEE_FIELDS, rows, batch_size=batch_size)
+
+
+def reply_text(rng):
+    """Bot reply of a log-normally distributed length, made of REPLY_SENTENCES"""
+    length = min(REPLY_MAX_LENGTH, int(REPLY_MEDIAN_LENGTH * math.exp(rng.gauss(0, REPLY_LENGTH_SIGMA))))
+    sentences = []
+    size = 0
+    while size < length:
+        sentence = rng.choice(REPLY_SENTENCES)
+        sentences.append(sentence)
+        size += len(sentence) + 1
+    return '\n'.join(sentences)
+
+
+def create_chats(user_ids, chats_per_user, seed=0, batch_size=1000, now=None):
+    """
+    Insert chats for the users of ``user_ids``: an exponentially distributed
+    number of chats per user averaging ``chats_per_user``, each of 3
+    question/reply exchanges on average, over the last 180 days.
+    Returns (chats, messages) inserted.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now(dt_timezone.utc)
+    chats = []
+    for user_id in user_ids:
+        # floor(X + U) keeps the mean of the exponential X
+        for _ in range(int(rng.expovariate(1 / chats_per_user) + rng.random()) if chats_per_user else 0):
+            question, title = rng.choice(QUESTIONS)
+            exchanges = 1 + int(rng.expovariate(1 / 2) + rng.random())
+            started = now - timedelta(seconds=rng.randrange(180 * 86400))
+            ended = started + timedelta(seconds=exchanges * 90)
+            chats.append((user_id, title, exchanges * 2, started, ended, question))
+
+    last_pk = Chat.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    insert_rows(
+        Chat,
+        ['user', 'title', 'message_count', 'created_at', 'updated_at'],
+        (chat[:5] for chat in chats),
+        batch_size=batch_size,
+    )
+    chat_pks = list(Chat.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+
+    def messages():
+        for chat_pk, (_, _, message_count, started, _, question) in zip(chat_pks, chats):
+            for exchange in range(message_count // 2):
+                sent = started + timedelta(seconds=exchange * 90)
+                yield chat_pk, 'user', question if exchange == 0 else rng.choice(QUESTIONS)[0], sent
+                yield chat_pk, 'ai', reply_text(rng), sent + timedelta(seconds=rng.randrange(2, 30))
+
+    inserted = insert_rows(Message, ['chat', 'sender', 'content', 'created_at'], messages(), batch_size=batch_size)
+    return len(chats), inserted
+
+
+def write_hr_csv(path, count, seed=0, span=6):
+    """Write a synthetic organization as an HR extract (semicolon separated, UTF-8)"""
+    with open(path, 'w', encoding='utf-8', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=';')
+        writer.writerow(HR_CSV_COLUMNS)
+        for record in generate_employees(count, seed=seed, span=span):
+            writer.writerow(hr_csv_row(record))
@@ -1,3 +1,656 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+from io import StringIO
+from itertools import islice
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import metrics, profiling, usage, views, warmup
+from .archive import archive_chat
+from .hr_import import HR_CSV_COLUMNS, ExtractDecodeError, read_chunks, sniff
+from .management.commands.import_hr_data import IMPORTED_FIELDS
+from .models import AIUsage, Chat, CustomUser, Message, MessageArchive
+from .purge import purge_deleted_chats, schedule_purge
+from .querycheck import QueryBudgetExceeded, assert_query_budget, query_budget
+
+
+@query_budget(max_queries=1)
+def two_queries_view(request):
+    CustomUser.objects.count()
+    Chat.objects.count()
+    return HttpResponse()
+
+
+@query_budget(max_repeats=2)
+def n_plus_one_view(request):
+    for chat in Chat.objects.all():
+        chat.last_message
+    return HttpResponse()
+
+
+def create_chat_with_messages(user, count, title='Chat'):
+    chat = Chat.objects.create(user=user, title=title, message_count=count)
+    Message.objects.bulk_create(
+        Message(chat=chat, sender='user' if i % 2 == 0 else 'ai', content=f"message {i}")
+        for i in range(count)
+    )
+    return chat
+
+
+@override_settings(AZURE_AI_ENABLED=False, CHAT_PURGE_IN_BACKGROUND=False)
+class QueryBudgetViewTests(TestCase):
+    """Every view with a @query_budget stays within it (QueryBudgetTestRunner raises otherwise)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user(
+            'manager', password='secret', employee_id='E1', first_name='Alice', last_name='Martin',
+            is_manager=True, departement='RH', poste='Responsable RH',
+        )
+        cls.user = CustomUser.objects.create_user(
+            'employee', password='secret', employee_id='E2', first_name='Bob', last_name='Durand',
+            responsable=cls.manager, departement='RH', poste='Chargé RH',
+        )
+        CustomUser.objects.create_user('report', password='secret', employee_id='E3', responsable=cls.user)
+        cls.chats = [create_chat_with_messages(cls.user, 12, f"Chat {i}") for i in range(5)]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_get_chats(self):
+        response = self.client.get('/api/chats/', {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['chats']), 2)
+        self.assertTrue(data['has_more'])
+        response = self.client.get('/api/chats/', {'limit': 2, 'cursor': data['next_cursor']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_chat(self):
+        response = self.client.post('/api/chats/create/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'New Chat')
+
+    def test_delete_chat(self):
+        chat = self.chats[0]
+        response = self.client.delete(f'/api/chats/{chat.id}/delete/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.delete(f'/api/chats/{chat.id}/delete/').status_code, 404)
+
+    def test_delete_chats(self):
+        ids = [chat.id for chat in self.chats[:3]]
+        response = self.client.post('/api/chats/delete/', json.dumps({'ids': ids}), content_type='application/json')
+        self.assertEqual(response.json(), {'success': True, 'deleted': 3})
+        response = self.client.post('/api/chats/delete/', json.dumps({'all': True}), content_type='application/json')
+        self.assertEqual(response.json(), {'success': True, 'deleted': 2})
+
+    def test_get_messages(self):
+        chat = self.chats[0]
+        response = self.client.get(f'/api/chats/{chat.id}/messages/', {'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([message['text'] for message in data['messages']], [f"message {i}" for i in range(7, 12)])
+        self.assertTrue(data['has_more'])
+
+        response = self.client.get(f'/api/chats/{chat.id}/messages/', {'before': data['messages'][0]['cursor']})
+        self.assertEqual([message['text'] for message in response.json()['messages']], [f"message {i}" for i in range(7)])
+
+    def test_get_messages_since(self):
+        chat = self.chats[0]
+        first = self.client.get(f'/api/chats/{chat.id}/messages/', {'limit': 1}).json()['messages'][0]
+        cursor = self.client.get(f'/api/chats/{chat.id}/messages/', {'limit': 12}).json()['messages'][0]['cursor']
+        data = self.client.get(f'/api/chats/{chat.id}/messages/', {'since': cursor}).json()
+        self.assertEqual(len(data['messages']), 11)
+        self.assertEqual(data['messages'][-1]['id'], first['id'])
+        self.assertFalse(data['has_more'])
+
+    def test_get_messages_invalid_cursor(self):
+        chat = self.chats[0]
+        for parameter in ('before', 'after', 'since'):
+            for cursor in ('99999999999999999999-1', '1-99999999999999999999', '-1-2', 'x-1', '12'):
+                with self.subTest(parameter=parameter, cursor=cursor):
+                    response = self.client.get(f'/api/chats/{chat.id}/messages/', {parameter: cursor})
+                    self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/chats/', {'cursor': '9' * 30 + '-1'}).status_code, 400)
+
+    def test_search_chats(self):
+        response = self.client.get('/api/chats/search/', {'q': 'message'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_send_message(self):
+        chat = Chat.objects.create(user=self.user)
+        response = self.client.post(
+            f'/api/chats/{chat.id}/send/', json.dumps({'message': 'Combien de congés me reste-t-il ?'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        chat.refresh_from_db()
+        self.assertEqual(chat.message_count, 2)
+        self.assertNotEqual(chat.title, 'New Chat')
+
+    def test_send_message_counts_the_user_message_without_reply(self):
+        chat = Chat.objects.create(user=self.user)
+        with mock.patch('users.views.get_ai_response', side_effect=RuntimeError('timeout')):
+            response = self.client.post(
+                f'/api/chats/{chat.id}/send/', json.dumps({'message': 'Bonjour'}), content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 500)
+        chat.refresh_from_db()
+        self.assertEqual(chat.message_count, 1)
+        self.assertEqual(chat.messages.count(), 1)
+
+    def test_get_org_subtree(self):
+        response = self.client.get('/api/org/')
+        self.assertEqual(response.status_code, 200)
+        root = response.json()['root']
+        self.assertEqual(root['employee_id'], 'E2')
+        self.assertEqual([report['employee_id'] for report in root['reports']], ['E3'])
+        self.assertEqual(self.client.get('/api/org/E1/').status_code, 403)
+
+
+@override_settings(QUERY_INSPECTOR_ENABLED=True, QUERY_BUDGET_RAISE=True)
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('employee', password='secret')
+        for i in range(5):
+            create_chat_with_messages(cls.user, 2, f"Chat {i}")
+
+    def test_view_over_its_budget_raises(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, '2 queries (max 1)'):
+            two_queries_view(RequestFactory().get('/'))
+
+    def test_view_with_n_plus_one_raises(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'statement run 5 times (max 2), N+1?'):
+            n_plus_one_view(RequestFactory().get('/'))
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_view_over_its_budget_is_logged(self):
+        with self.assertLogs('users.querycheck', 'ERROR'):
+            two_queries_view(RequestFactory().get('/'))
+
+    def test_assert_query_budget_catches_n_plus_one(self):
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            with assert_query_budget(max_repeats=3):
+                previews = [chat.last_message for chat in Chat.objects.all()]
+        self.assertEqual(len(previews), 5)
+        self.assertIn('users/tests.py', str(raised.exception))
+
+    def test_assert_query_budget_within_budget(self):
+        with assert_query_budget(max_queries=1) as inspector:
+            list(Chat.objects.values('id', 'title'))
+        self.assertEqual(inspector.count, 1)
+
+
+@override_settings(CHAT_PURGE_IN_BACKGROUND=False)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('employee', password='secret')
+        other = CustomUser.objects.create_user('other', password='secret')
+        chat = Chat.objects.create(user=cls.user, title='Questions RH')
+        cls.best = Message.objects.create(chat=chat, sender='user', content='Mes congés, congés payés')
+        cls.second = Message.objects.create(
+            chat=chat, sender='ai', content="Vos congés sont détaillés dans votre fiche, avec le reste de vos droits"
+        )
+        cls.unrelated = Message.objects.create(chat=chat, sender='user', content='Mon salaire')
+        cls.foreign = Message.objects.create(
+            chat=Chat.objects.create(user=other, title='Autre'), sender='user', content='Mes congés'
+        )
+        cls.deleted = Message.objects.create(
+            chat=Chat.objects.create(user=cls.user, title='Supprimé', deleted_at=chat.created_at),
+            sender='user', content='Congés supprimés',
+        )
+        cls.titled = Message.objects.create(
+            chat=Chat.objects.create(user=other, title='Planning des congés'), sender='user', content='Bonjour'
+        )
+
+    def test_api_results_are_ranked_and_scoped_to_the_user(self):
+        self.client.force_login(self.user)
+        results = self.client.get('/api/chats/search/', {'q': 'conge'}).json()['results']
+        self.assertEqual([result['message_id'] for result in results], [self.best.id, self.second.id])
+        self.assertIn('<mark>', results[0]['snippet'])
+
+    def test_admin_search_uses_the_index(self):
+        self.client.force_login(CustomUser.objects.create_superuser('admin', password='secret'))
+        response = self.client.get('/admin/users/message/', {'q': 'congés'})
+        found = {message.id for message in response.context['cl'].result_list}
+        # Full-text matches of every user, plus the messages of chats titled with the words
+        self.assertEqual(found, {self.best.id, self.second.id, self.foreign.id, self.deleted.id, self.titled.id})
+
+        queryset = response.context['cl'].queryset
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertFalse([line for line in plan if line.startswith('SCAN users_message ')], plan)
+
+
+class PurgeTests(TestCase):
+    def test_purge_deleted_chats(self):
+        user = CustomUser.objects.create_user('employee', password='secret')
+        kept = create_chat_with_messages(user, 3)
+        deleted = [create_chat_with_messages(user, 7) for _ in range(2)]
+        Chat.objects.filter(pk__in=[chat.pk for chat in deleted]).update(deleted_at=kept.created_at)
+
+        self.assertEqual(purge_deleted_chats(batch_size=2), (2, 14))
+        self.assertEqual(list(Chat.objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertEqual(Message.objects.count(), 3)
+
+    def test_admin_delete_defers_to_the_purge(self):
+        admin = CustomUser.objects.create_superuser('admin', password='secret')
+        self.client.force_login(admin)
+        chats = [create_chat_with_messages(admin, 5, title=f'Chat {i}') for i in range(3)]
+
+        response = self.client.get(f'/admin/users/chat/{chats[0].pk}/delete/')
+        self.assertContains(response, 'Chat 0')
+        self.assertNotContains(response, 'message 0')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(f'/admin/users/chat/{chats[0].pk}/delete/', {'post': 'yes'})
+        with self.captureOnCommitCallbacks() as more_callbacks:
+            self.client.post('/admin/users/chat/', {
+                'action': 'delete_selected', 'post': 'yes', '_selected_action': [chat.pk for chat in chats[1:]],
+            })
+        self.assertEqual(callbacks + more_callbacks, [schedule_purge, schedule_purge])
+        self.assertEqual(Chat.objects.filter(deleted_at__isnull=False).count(), 3)
+        self.assertEqual(Message.objects.count(), 15)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('employee', password='secret')
+        self.client.force_login(self.user)
+        self.chat = create_chat_with_messages(self.user, 25)
+        start = self.chat.created_at
+        for i, pk in enumerate(Message.objects.filter(chat=self.chat).order_by('id').values_list('id', flat=True)):
+            Message.objects.filter(pk=pk).update(created_at=start + timedelta(minutes=i))
+        # 24 messages in 4 archive batches, the newest stays in Message with the ones sent afterwards
+        self.assertEqual(archive_chat(self.chat.pk, batch_size=7)[0], 24)
+        for i in range(25, 30):
+            message = Message.objects.create(chat=self.chat, sender='user', content=f"message {i}")
+            Message.objects.filter(pk=message.pk).update(created_at=start + timedelta(minutes=i))
+        self.chat.refresh_from_db()
+        self.assertEqual(MessageArchive.objects.filter(chat=self.chat).count(), 4)
+        self.assertEqual(Message.objects.filter(chat=self.chat).count(), 6)
+
+    def get_page(self, **params):
+        response = self.client.get(f'/api/chats/{self.chat.pk}/messages/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_paging_across_the_archive(self):
+        contents = [f"message {i}" for i in range(30)]
+
+        page = self.get_page(limit=4)
+        pages = [page['messages']]
+        while page['has_more']:
+            page = self.get_page(limit=4, before=pages[-1][0]['cursor'])
+            pages.append(page['messages'])
+        history = [message for page in reversed(pages) for message in page]
+        self.assertEqual([message['text'] for message in history], contents)
+
+        page = {'messages': history[:1], 'has_more': True}
+        forward = []
+        while page['has_more']:
+            page = self.get_page(limit=4, after=page['messages'][-1]['cursor'])
+            forward.extend(page['messages'])
+        self.assertEqual([message['text'] for message in forward], contents[1:])
+
+        # Refresh from inside the archive: everything newer, both tables
+        page = self.get_page(since=history[9]['cursor'])
+        self.assertEqual([message['text'] for message in page['messages']], contents[10:])
+        self.assertFalse(page['has_more'])
+
+
+@override_settings(AZURE_AI_ENABLED=True, USAGE_WRITE_IN_BACKGROUND=True)
+class UsageTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('employee', password='secret')
+        self.client.force_login(self.user)
+        self.chat = Chat.objects.create(user=self.user, title='Chat')
+        # Rows stay queued until flush_usage(), written in the test transaction
+        self.enterContext(mock.patch.object(usage, '_writer', mock.Mock()))
+        self.addCleanup(usage.flush_usage)
+
+    def test_failed_run_is_recorded_and_falls_back(self):
+        question = 'Combien de congés me reste-t-il ?'
+        project = mock.Mock()
+        project.agents.runs.create_and_process.return_value = SimpleNamespace(
+            status='failed', last_error='rate limit', model='gpt-4o',
+            usage=SimpleNamespace(prompt_tokens=1200, completion_tokens=0),
+        )
+        self.enterContext(mock.patch.object(views, 'AZURE_AVAILABLE', True))
+        self.enterContext(mock.patch.object(views, 'get_project_client', return_value=project))
+        self.enterContext(mock.patch.object(views, 'get_agent', return_value=SimpleNamespace(id='agent')))
+
+        with self.assertLogs('users.views', 'ERROR'):
+            response = self.client.post(
+                f'/api/chats/{self.chat.pk}/send/', {'message': question},
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['ai_message']['text'])
+        project.agents.messages.get_last_message_by_role.assert_not_called()
+        # Queued by the request, not written by it
+        self.assertFalse(AIUsage.objects.exists())
+
+        usage.flush_usage()
+        row = AIUsage.objects.get()
+        self.assertEqual((row.user, row.chat), (self.user, self.chat))
+        self.assertEqual((row.model, row.run_status, row.intent), ('gpt-4o', 'failed', 'Congés & Absences'))
+        self.assertEqual((row.prompt_tokens, row.completion_tokens), (1200, 0))
+        sections = usage.prompt_sections(views.create_enhanced_message(question, self.user))
+        self.assertEqual({name: getattr(row, name) for name in sections}, sections)
+        self.assertGreater(row.question_bytes, 0)
+
+
+class MetricsTests(TestCase):
+    def test_shards_of_finished_threads_are_retired(self):
+        def record():
+            metrics.inc('hrbot_db_lock_errors_total', ('test',))
+
+        before = metrics.snapshot().get(('hrbot_db_lock_errors_total', ('test',)), [0])[0]
+        for _ in range(20):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        record()
+
+        total = metrics.snapshot()[('hrbot_db_lock_errors_total', ('test',))][0]
+        self.assertEqual(total - before, 21)
+        self.assertLessEqual(len(metrics._shards), threading.active_count())
+        # Counters never go backwards once the shards are retired
+        self.assertEqual(metrics.snapshot()[('hrbot_db_lock_errors_total', ('test',))][0], total)
+
+
+class OrgPathTests(TestCase):
+    def setUp(self):
+        self.ceo = CustomUser.objects.create_user('ceo', employee_id='E1')
+        self.manager = CustomUser.objects.create_user('manager', employee_id='E2', responsable=self.ceo)
+        self.employee = CustomUser.objects.create_user('employee', employee_id='E3', responsable=self.manager)
+        CustomUser.objects.create_user('other', employee_id='E10')
+
+    def paths(self):
+        return dict(CustomUser.objects.exclude(employee_id=None).values_list('employee_id', 'org_path'))
+
+    def test_paths_follow_the_hierarchy(self):
+        self.assertEqual(self.paths(), {'E1': 'E1/', 'E2': 'E1/E2/', 'E3': 'E1/E2/E3/', 'E10': 'E10/'})
+        self.assertEqual(sorted(self.ceo.get_all_reports().values_list('employee_id', flat=True)), ['E2', 'E3'])
+        self.assertEqual(list(self.manager.get_all_reports().values_list('employee_id', flat=True)), ['E3'])
+
+    def test_subtree_moves_with_its_manager(self):
+        self.manager.responsable = CustomUser.objects.get(employee_id='E10')
+        self.manager.save()
+        self.assertEqual(self.paths(), {'E1': 'E1/', 'E2': 'E10/E2/', 'E3': 'E10/E2/E3/', 'E10': 'E10/'})
+
+    def test_invalid_hierarchy_is_not_rebased_into_roots(self):
+        self.ceo.responsable = self.employee
+        self.ceo.save()
+        self.assertEqual(self.paths(), {'E1': '', 'E2': '', 'E3': '', 'E10': 'E10/'})
+
+        self.ceo.responsable = None
+        self.ceo.save()
+        self.assertEqual(self.paths(), {'E1': 'E1/', 'E2': 'E1/E2/', 'E3': 'E1/E2/E3/', 'E10': 'E10/'})
+
+
+class HRImportTests(TestCase):
+    def write_extract(self, rows):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write((';'.join(HR_CSV_COLUMNS) + '\n').encode())
+            for row in rows:
+                f.write(row)
+        return path
+
+    def employee_row(self, employee_id, name, encoding='utf-8', manager='', salary=3000):
+        return (
+            f"{employee_id};{name};;IT;Non;Développeur;{manager};01/01/2020;25;0;0;25;10;0;10;{salary};VRAI;;Standard\n"
+        ).encode(encoding)
+
+    def import_extract(self, rows, **options):
+        out = StringIO()
+        call_command('import_hr_data', file=self.write_extract(rows), workers=1, stdout=out, **options)
+        return out.getvalue()
+
+    def org_paths(self):
+        return dict(CustomUser.objects.filter(employee_id__isnull=False).values_list('employee_id', 'org_path'))
+
+    def test_invalid_bytes_are_reported_with_their_row(self):
+        rows = [self.employee_row(f'E{i}', f'Employé {i}') for i in range(1, 6)]
+        rows.append(self.employee_row('E6', 'Hélène Café', 'cp1252'))
+        rows.append(self.employee_row('E7', 'Employé 7'))
+        path = self.write_extract(rows)
+        encoding, dialect = sniff(path, sample_size=100)
+        self.assertEqual(encoding, 'utf-8')
+
+        chunks = read_chunks(path, encoding, dialect, chunk_size=2)
+        self.assertEqual([(row_num, len(rows)) for _, row_num, rows in islice(chunks, 3)], [(2, 2), (4, 2), (6, 1)])
+        with self.assertRaisesMessage(ExtractDecodeError, 'ligne 7:'):
+            next(chunks)
+
+    def test_import_stops_at_invalid_bytes(self):
+        CustomUser.objects.create_user('E9999', employee_id='E9999')
+        # Past the sample read by sniff(), which detects UTF-8
+        rows = [self.employee_row(f'E{i}', f'Jérôme Martin{i}') for i in range(1, 1001)]
+        rows.append(self.employee_row('E1001', 'Hélène Café', 'cp1252'))
+        rows.append(self.employee_row('E1002', 'Paul Durand'))
+        out = StringIO()
+        call_command(
+            'import_hr_data', file=self.write_extract(rows), workers=1, batch_size=300, deactivate_missing=True,
+            stdout=out,
+        )
+
+        self.assertIn("Importation interrompue, ligne 1002: octets invalides pour l'encodage utf-8", out.getvalue())
+        self.assertEqual(CustomUser.objects.filter(employee_id__in=[f'E{i}' for i in range(1, 1001)]).count(), 1000)
+        self.assertEqual(CustomUser.objects.get(employee_id='E1000').first_name, 'Jérôme')
+        self.assertFalse(CustomUser.objects.filter(employee_id__in=['E1001', 'E1002']).exists())
+        # The file was not read to the end: nobody is deactivated
+        self.assertTrue(CustomUser.objects.get(employee_id='E9999').is_active)
+
+    def test_reimport_writes_only_changed_rows(self):
+        rows = [
+            self.employee_row('A', 'Anne Martin'),
+            self.employee_row('B', 'Bruno Petit', manager='A'),
+            self.employee_row('C', 'Chloé Roux', manager='B'),
+            self.employee_row('D', 'David Blanc'),
+        ]
+        self.assertIn('Utilisateurs créés: 4', self.import_extract(rows))
+        self.assertEqual(self.org_paths(), {'A': 'A/', 'B': 'A/B/', 'C': 'A/B/C/', 'D': 'D/'})
+
+        with CaptureQueriesContext(connection) as captured:
+            out = self.import_extract(rows)
+        self.assertIn('Utilisateurs mis à jour: 0', out)
+        self.assertIn('Utilisateurs inchangés: 4', out)
+        writes = [q['sql'] for q in captured if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(writes, [])
+
+        # B moves under D, its team follows
+        rows[1] = self.employee_row('B', 'Bruno Petit', manager='D')
+        out = self.import_extract(rows)
+        self.assertIn('Utilisateurs mis à jour: 1', out)
+        self.assertIn('Utilisateurs inchangés: 3', out)
+        self.assertIn('Liens hiérarchiques modifiés: 1', out)
+        self.assertEqual(self.org_paths(), {'A': 'A/', 'B': 'D/B/', 'C': 'D/B/C/', 'D': 'D/'})
+
+    def test_source_hash_decides_what_is_rewritten(self):
+        rows = [self.employee_row('A', 'Anne Martin'), self.employee_row('B', 'Bruno Petit', manager='A')]
+        self.import_extract(rows)
+        digest = CustomUser.objects.get(employee_id='B').hr_source_hash
+        self.assertTrue(digest)
+
+        # Same row as last time: edits made in the database since are kept
+        CustomUser.objects.filter(employee_id='B').update(salaire=1)
+        self.assertIn('Utilisateurs inchangés: 2', self.import_extract(rows))
+        self.assertEqual(CustomUser.objects.get(employee_id='B').salaire, 1)
+
+        # Without a digest the row is compared column by column and rewritten
+        CustomUser.objects.filter(employee_id='B').update(hr_source_hash='')
+        self.assertIn('Utilisateurs mis à jour: 1', self.import_extract(rows))
+        employee = CustomUser.objects.get(employee_id='B')
+        self.assertEqual((employee.salaire, employee.hr_source_hash), (3000, digest))
+
+        rows[1] = self.employee_row('B', 'Bruno Petit', manager='A', salary=3200)
+        self.assertIn('Utilisateurs mis à jour: 1', self.import_extract(rows))
+        employee = CustomUser.objects.get(employee_id='B')
+        self.assertEqual(employee.salaire, 3200)
+        self.assertNotEqual(employee.hr_source_hash, digest)
+
+    def test_deactivate_missing(self):
+        rows = [self.employee_row('A', 'Anne Martin'), self.employee_row('B', 'Bruno Petit', manager='A')]
+        self.import_extract(rows)
+        admin = CustomUser.objects.create_superuser('admin', employee_id='ADM')
+
+        out = self.import_extract(rows[:1], deactivate_missing=True)
+        self.assertIn('Utilisateurs désactivés: 1', out)
+        self.assertFalse(CustomUser.objects.get(employee_id='B').is_active)
+        admin.refresh_from_db()
+        self.assertTrue(admin.is_active)
+
+        # Back in the extract with an unchanged row: reactivated all the same
+        out = self.import_extract(rows, deactivate_missing=True)
+        self.assertIn('Utilisateurs mis à jour: 1', out)
+        self.assertIn('Utilisateurs désactivés: 0', out)
+        self.assertTrue(CustomUser.objects.get(employee_id='B').is_active)
+
+        # Without the option absent employees are left alone
+        self.import_extract(rows[:1])
+        self.assertTrue(CustomUser.objects.get(employee_id='B').is_active)
+
+    def test_directory_export_round_trip(self):
+        rows = [
+            self.employee_row('A', 'Anne Martin'),
+            self.employee_row('B', 'Bruno Petit', manager='A', salary=3250.5),
+            "C;Chloé Roux;chloe.roux@example.com;RH;Oui;Responsable RH;A;15/03/2018;"
+            "27;3,5;2;21,5;10;1;9;4100;FAUX;01/09/2025;Premium\n".encode(),
+        ]
+        self.import_extract(rows)
+        fields = ['employee_id', 'responsable_id', *IMPORTED_FIELDS]
+        imported = list(CustomUser.objects.order_by('employee_id').values(*fields))
+
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        call_command('export_hr_data', 'directory', output=path, stdout=StringIO())
+
+        # Same rows as the extract they came from
+        out = StringIO()
+        call_command('import_hr_data', file=path, workers=1, stdout=out)
+        self.assertIn('Utilisateurs inchangés: 3', out.getvalue())
+
+        CustomUser.objects.all().delete()
+        call_command('import_hr_data', file=path, workers=1, stdout=StringIO())
+        self.assertEqual(list(CustomUser.objects.order_by('employee_id').values(*fields)), imported)
+
+    def test_export_view_is_admin_only(self):
+        self.import_extract([self.employee_row('A', 'Anne Martin')])
+        self.client.force_login(CustomUser.objects.create_user('employee', password='secret'))
+        self.assertEqual(self.client.get('/api/exports/directory/').status_code, 403)
+
+        self.client.force_login(CustomUser.objects.create_user('rh', password='secret', role='admin'))
+        response = self.client.get('/api/exports/directory/')
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ';'.join(HR_CSV_COLUMNS))
+        self.assertEqual(lines[1].split(';')[:2], ['A', 'Anne Martin'])
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PROFILING_DIR=directory.name))
+        self.staff = CustomUser.objects.create_user('staff', password='secret', is_staff=True)
+
+    def test_staff_request_is_profiled(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/api/chats/', {'profile': 'deterministic'})
+        profile = profiling.load_profile(response['X-Profile-Id'])
+        self.assertEqual(profile['mode'], 'deterministic')
+        self.assertEqual(profile['view'], 'get_chats')
+
+        response = self.client.get('/api/chats/', headers={'X-Profile': 'sample'})
+        self.assertEqual(profiling.load_profile(response['X-Profile-Id'])['mode'], 'sample')
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/chats/', {'unprofiled': '1'}))
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled_by_default(self):
+        self.client.force_login(self.staff)
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/chats/', {'profile': 'deterministic'}))
+
+    def test_other_users_are_not_profiled(self):
+        self.client.force_login(CustomUser.objects.create_user('employee', password='secret'))
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/chats/', {'profile': 'deterministic'}))
+
+    @mock.patch.object(profiling, 'PROFILES_ALL_THREADS', True)
+    def test_deterministic_profile_only_without_concurrent_requests(self):
+        self.assertEqual(profiling.make_profiler('deterministic', in_flight=2).mode, 'sample')
+        profiler = profiling.make_profiler('deterministic', in_flight=1)
+        self.assertEqual(profiler.mode, 'deterministic')
+        profiling.release(profiler)
+
+
+@override_settings(WARMUP_ON_START=True)
+class WarmUpTests(TestCase):
+    def setUp(self):
+        self.enterContext(mock.patch.object(
+            warmup, '_state', {'started': False, 'finished': False, 'stages': {}, 'errors': {}}
+        ))
+
+    def test_ready_once_warmed_up_despite_azure(self):
+        release = threading.Event()
+
+        def slow_urls():
+            release.wait(5)
+            warmup.warm_up_urls()
+
+        def azure_down():
+            raise ConnectionError('token endpoint unreachable')
+
+        stages = [('urls', slow_urls, True), *warmup.STAGES[1:3], ('azure', azure_down, False)]
+        self.enterContext(mock.patch.object(warmup, 'STAGES', stages))
+        thread = threading.Thread(target=warmup.warm_up)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+
+        self.assertEqual(self.client.get('/healthz').status_code, 200)
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'warming_up')
+
+        with self.assertLogs('users.warmup', 'ERROR'):
+            release.set()
+            thread.join()
+        self.assertEqual(self.client.get('/healthz').status_code, 200)
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        details = response.json()['warm_up']
+        self.assertTrue(details['finished'])
+        self.assertEqual(list(details['errors']), ['azure'])
+
+    def test_failed_required_stage_is_not_ready(self):
+        def database_down():
+            raise ConnectionError('database unreachable')
+
+        stages = [('database', database_down, True), ('azure', lambda: None, False)]
+        # Closing the connection would end the test transaction
+        with mock.patch.object(warmup, 'STAGES', stages), mock.patch.object(warmup.connection, 'close'):
+            with self.assertLogs('users.warmup', 'ERROR'):
+                warmup.warm_up()
+        self.assertEqual(self.client.get('/readyz').status_code, 503)
+
+    @override_settings(WARMUP_ON_START=False)
+    def test_ready_without_warm_up(self):
+        self.assertEqual(self.client.get('/readyz').status_code, 200)
@@ -0,0 +1,204 @@
+"""
+Lightweight spans around the stages of send_message and get_ai_response.
+
+    with span('azure.run') as run_span:
+        ...
+        run_span.set(run_status=run.status)
+
+Nothing is recorded unless TRACING_ENABLED is set. Spans opened inside
+another one become its children; the spans of a trace are buffered and
+exported together when the outermost span ends:
+- as one JSON log line per span on the ``users.tracing`` logger
+  (TRACING_LOG_FILE, or standard output),
+- if TRACING_OTLP_FILE is set, as one OTLP/JSON ExportTraceServiceRequest
+  per trace appended to that file, the format read by the OpenTelemetry
+  Collector's otlpjsonfile receiver.
+
+trace_report reads either file back for a per-stage latency breakdown.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'hr-bot'
+
+_current = contextvars.ContextVar('tracing_span', default=None)
+_otlp_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'trace', 'start_ns', 'start', 'duration', 'status', 'attributes')
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        if parent is None:
+            self.trace_id = os.urandom(16).hex()
+            self.parent_id = None
+            self.trace = []
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.trace = parent.trace
+        self.attributes = attributes
+        self.status = 'ok'
+        self.duration = None
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+
+    def set(self, **attributes):
+        """Add attributes to the span"""
+        self.attributes.update(attributes)
+
+    def as_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': datetime.fromtimestamp(self.start_ns / 1e9, dt_timezone.utc).isoformat(),
+            'duration_ms': round(self.duration * 1000, 3),
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class NoopSpan:
+    """Returned by span() when tracing is disabled"""
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time the block as a span named ``name``, child of the current span if any"""
+    if not settings.TRACING_ENABLED:
+        yield NOOP_SPAN
+        return
+    parent = _current.get()
+    current = Span(name, parent, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = 'error'
+        current.attributes['error'] = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current.reset(token)
+        current.trace.append(current)
+        if parent is None:
+            export(current.trace)
+
+
+def traced(name):
+    """Decorator running the function inside a span named ``name``"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """The innermost open span, a no-op one outside of any span"""
+    return _current.get() or NOOP_SPAN
+
+
+def export(spans):
+    try:
+        for finished in spans:
+            logger.info(json.dumps(finished.as_dict(), ensure_ascii=False, default=str))
+        if settings.TRACING_OTLP_FILE:
+            line = json.dumps(otlp_request(spans), ensure_ascii=False, default=str)
+            with _otlp_lock, open(settings.TRACING_OTLP_FILE, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+    except Exception as e:
+        # Tracing must never break the request it observes
+        logger.warning(f"Trace export failed: {e}")
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def otlp_request(spans):
+    """OTLP/JSON ExportTraceServiceRequest holding ``spans``"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{
+            'scope': {'name': __name__},
+            'spans': [
+                {
+                    'traceId': finished.trace_id,
+                    'spanId': finished.span_id,
+                    'parentSpanId': finished.parent_id or '',
+                    'name': finished.name,
+                    'kind': 1,  # SPAN_KIND_INTERNAL
+                    'startTimeUnixNano': str(finished.start_ns),
+                    'endTimeUnixNano': str(finished.start_ns + int(finished.duration * 1e9)),
+                    'attributes': [{'key': key, 'value': otlp_value(value)} for key, value in finished.attributes.items()],
+                    'status': {'code': 2 if finished.status == 'error' else 1},
+                }
+                for finished in spans
+            ],
+        }],
+    }]}
+
+
+def read_spans(path):
+    """Yield the spans of a JSON log or OTLP/JSON file as dicts shaped like Span.as_dict()"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            # Log lines may carry a prefix before the JSON object
+            start = line.find('{')
+            if start < 0:
+                continue
+            try:
+                record = json.loads(line[start:])
+            except ValueError:
+                continue
+            if 'resourceSpans' not in record:
+                if 'span_id' in record:
+                    yield record
+                continue
+            for resource in record['resourceSpans']:
+                for scope in resource.get('scopeSpans', []):
+                    for item in scope.get('spans', []):
+                        start_ns = int(item['startTimeUnixNano'])
+                        yield {
+                            'trace_id': item['traceId'],
+                            'span_id': item['spanId'],
+                            'parent_id': item.get('parentSpanId') or None,
+                            'name': item['name'],
+                            'start': datetime.fromtimestamp(start_ns / 1e9, dt_timezone.utc).isoformat(),
+                            'duration_ms': (int(item['endTimeUnixNano']) - start_ns) / 1e6,
+                            'status': 'error' if item.get('status', {}).get('code') == 2 else 'ok',
+                            'attributes': {
+                                attribute['key']: next(iter(attribute['value'].values()), None)
+                                for attribute in item.get('attributes', [])
+                            },
+                        }
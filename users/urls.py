@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import (
     register_view, login_view, logout_view, dashboard_view, home_view, webcam_view, chat_view,
-    get_chats, create_chat, delete_chat, get_messages, send_message
+    get_chats, create_chat, delete_chat, delete_chats, get_messages, send_message, get_org_subtree,
+    export_data, search_chats, metrics_view, healthz_view, readyz_view
 )
 
 urlpatterns = [
@@ -16,7 +17,17 @@ urlpatterns = [
     # API endpoints
     path('api/chats/', get_chats, name='get_chats'),
     path('api/chats/create/', create_chat, name='create_chat'),
+    path('api/chats/search/', search_chats, name='search_chats'),
+    path('api/chats/delete/', delete_chats, name='delete_chats'),
     path('api/chats/<int:chat_id>/delete/', delete_chat, name='delete_chat'),
     path('api/chats/<int:chat_id>/messages/', get_messages, name='get_messages'),
     path('api/chats/<int:chat_id>/send/', send_message, name='send_message'),
+    path('api/org/', get_org_subtree, name='get_org'),
+    path('api/org/<str:employee_id>/', get_org_subtree, name='get_org_subtree'),
+    path('api/exports/<str:kind>/', export_data, name='export_data'),
+
+    # Monitoring
+    path('metrics', metrics_view, name='metrics'),
+    path('healthz', healthz_view, name='healthz'),
+    path('readyz', readyz_view, name='readyz'),
 ]
@@ -0,0 +1,162 @@
+"""
+Token usage accounting of the Azure AI agent runs.
+
+get_ai_response() calls record_usage() once a run completes. Rows are
+queued and written by a background thread in batches (USAGE_WRITE_IN_BACKGROUND),
+so accounting adds no database write to the request. Costs are computed
+when reporting, from AI_TOKEN_PRICES, so a price change applies to the
+whole history.
+"""
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Count, ExpressionWrapper, F, FloatField, Max, Sum
+from django.db.models.functions import NullIf, TruncDate
+
+from .models import AIUsage
+
+logger = logging.getLogger(__name__)
+
+# Rows written per INSERT by the background writer
+USAGE_BATCH_SIZE = 100
+
+# Prompt sections of create_enhanced_message, delimited by these headings
+DIRECTORY_HEADING = "\nAnnuaire des employés disponible:"
+INSTRUCTIONS_HEADING = "\n\nInstructions spéciales:"
+QUESTION_HEADING = "\n\nQuestion de l'utilisateur:"
+SECTIONS = ['context', 'directory', 'instructions', 'question']
+
+# Report groupings: name -> expression
+GROUPINGS = {
+    'day': TruncDate('created_at'),
+    'user': F('user__username'),
+    'department': F('user__departement'),
+    'intent': F('intent'),
+    'model': F('model'),
+}
+
+_queue = queue.Queue()
+_writer_lock = threading.Lock()
+_writer = None
+
+
+def prompt_sections(prompt):
+    """Size in bytes of each section of an enhanced prompt, as AIUsage field values"""
+    positions = [0]
+    for heading in (DIRECTORY_HEADING, INSTRUCTIONS_HEADING, QUESTION_HEADING):
+        position = prompt.find(heading, positions[-1])
+        positions.append(position if position >= 0 else positions[-1])
+    positions.append(len(prompt))
+    return {
+        f'{section}_bytes': len(prompt[start:end].encode('utf-8'))
+        for section, start, end in zip(SECTIONS, positions, positions[1:])
+    }
+
+
+def write_usage(rows):
+    try:
+        AIUsage.objects.bulk_create(rows, batch_size=USAGE_BATCH_SIZE)
+    except Exception:
+        logger.exception(f"Could not record the usage of {len(rows)} AI runs")
+
+
+def _write_loop():
+    while True:
+        rows = [_queue.get()]
+        while len(rows) < USAGE_BATCH_SIZE:
+            try:
+                rows.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        write_usage(rows)
+        connection.close()
+
+
+def record_usage(**fields):
+    """Record the usage of one agent run, in the background unless disabled"""
+    usage = AIUsage(**fields)
+    if not settings.USAGE_WRITE_IN_BACKGROUND:
+        write_usage([usage])
+        return
+    global _writer
+    _queue.put(usage)
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, name='ai-usage-writer', daemon=True)
+                _writer.start()
+
+
+def flush_usage():
+    """Write the rows still queued, at exit"""
+    rows = []
+    while True:
+        try:
+            rows.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    if rows:
+        write_usage(rows)
+
+
+atexit.register(flush_usage)
+
+
+def run_cost(model, prompt_tokens, completion_tokens):
+    """Cost of a number of tokens in the currency of AI_TOKEN_PRICES"""
+    prices = settings.AI_TOKEN_PRICES
+    prompt_price, completion_price = prices.get(model) or prices['default']
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def aggregate_usage(queryset, by):
+    """
+    Usage of ``queryset`` grouped by one of GROUPINGS, costliest first, as
+    dicts with runs, tokens, cost and run durations
+    """
+    rows = queryset.values(key=GROUPINGS[by]).annotate(
+        runs=Count('id'),
+        prompt=Sum('prompt_tokens'),
+        completion=Sum('completion_tokens'),
+        avg_ms=Avg('duration_ms'),
+        max_ms=Max('duration_ms'),
+    ).order_by()
+    # Prices depend on the model: costs are added up per (group, model)
+    costs = {}
+    for row in queryset.values(key=GROUPINGS[by], run_model=F('model')).annotate(
+        prompt=Sum('prompt_tokens'), completion=Sum('completion_tokens')
+    ).order_by():
+        costs[row['key']] = costs.get(row['key'], 0) + run_cost(row['run_model'], row['prompt'], row['completion'])
+    groups = [
+        {
+            'key': row['key'] if row['key'] not in (None, '') else '—',
+            'runs': row['runs'],
+            'prompt_tokens': row['prompt'] or 0,
+            'completion_tokens': row['completion'] or 0,
+            'cost': costs.get(row['key'], 0),
+            'avg_ms': row['avg_ms'] or 0,
+            'max_ms': row['max_ms'] or 0,
+        }
+        for row in rows
+    ]
+    groups.sort(key=lambda group: group['cost'], reverse=True)
+    return groups
+
+
+def prompt_section_tokens(queryset):
+    """
+    Prompt tokens attributed to each section of the prompt, in proportion
+    to its share of the bytes of each run
+    """
+    total_bytes = NullIf(sum((F(f'{section}_bytes') for section in SECTIONS[1:]), F('context_bytes')), 0)
+    totals = queryset.aggregate(**{
+        section: Sum(
+            ExpressionWrapper(F('prompt_tokens') * F(f'{section}_bytes') * 1.0 / total_bytes, output_field=FloatField())
+        )
+        for section in SECTIONS
+    })
+    return {section: totals[section] or 0.0 for section in SECTIONS}
@@ -1,71 +1,99 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.db.models.functions import Substr
 from .forms import CustomUserCreationForm
 from django.contrib.auth.forms import AuthenticationForm
-from .models import Chat, Message
+from difflib import SequenceMatcher
+from .archive import history_page
+from .azure_ai import azure_installed, get_agent, get_project_client, sdk
+from .models import CustomUser, Chat, Message, message_preview
+from .exports import EXPORTS, FORMATS, export_filename, export_stream
+from .metrics import observe, render as render_metrics
+from .orgchart import get_org_chart
+from .purge import schedule_purge
+from .querycheck import query_budget
+from .search import search_messages
+from .tracing import current_span, span, traced
+from .usage import prompt_sections, record_usage
+from .warmup import readiness
+from .pagination import encode_cursor, decode_cursor, parse_limit, keyset_page
+import hmac
 import json
 import logging
 import re
+import time
 
-# Azure AI imports (optional)
-try:
-    from azure.ai.projects import AIProjectClient
-    from azure.identity import DefaultAzureCredential
-    from azure.ai.agents.models import ListSortOrder, MessageRole
-    AZURE_AVAILABLE = True
-except ImportError:
-    AZURE_AVAILABLE = False
+# Azure AI SDK (optional), imported on first use by users/azure_ai.py
+AZURE_AVAILABLE = azure_installed()
 
 logger = logging.getLogger(__name__)
 
+# Page sizes for the chat list and message history APIs
+CHATS_PAGE_SIZE = 30
+CHATS_MAX_PAGE_SIZE = 100
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+SEARCH_RESULTS = 20
+SEARCH_MAX_RESULTS = 50
+
+
+# Keywords of common HR queries -> category, used for chat titles and usage intents
+TITLE_PATTERNS = {
+    # Team/Department queries
+    ('équipe', 'dans', 'département', 'filliale', 'service'): 'Équipe & Organisation',
+    ('qui dans', 'qui est dans', 'membre'): 'Recherche Équipe',
+    
+    # Personal info
+    ('qui je suis', 'mes infos', 'mon profil', 'mes données'): 'Mon Profil',
+    
+    # Leave/vacation
+    ('congés', 'vacances', 'repos', 'arrêt'): 'Congés & Absences',
+    
+    # Contact/directory
+    ('contact', 'email', 'mail', 'téléphone', 'adresse'): 'Contacts',
+    ('qui est', 'infos sur', 'recherche'): 'Annuaire',
+    
+    # HR policies
+    ('politique', 'règlement', 'procédure'): 'Politiques RH',
+    ('salaire', 'paie', 'rémunération'): 'Rémunération',
+    
+    # Management
+    ('manager', 'responsable', 'chef', 'hiérarchie'): 'Management',
+    ('statistiques', 'stats', 'nombre', 'combien'): 'Statistiques',
+    
+    # Training/development
+    ('formation', 'training', 'développement'): 'Formation',
+    
+    # General help
+    ('aide', 'help', 'comment', 'que faire'): 'Assistance',
+}
+
+
+def message_intent(user_message):
+    """Category of an HR query from TITLE_PATTERNS, None if no keyword matches"""
+    message_lower = user_message.lower().strip()
+    for keywords, title in TITLE_PATTERNS.items():
+        if any(keyword in message_lower for keyword in keywords):
+            return title
+    return None
+
 
 def generate_chat_title(user_message):
     """
     Generate a simple, well-written and short title from the user message
     """
     # Simple AI-like title generation using keywords and patterns
-    message_lower = user_message.lower().strip()
-    
-    # Define title patterns based on common HR queries
-    title_patterns = {
-        # Team/Department queries
-        ('équipe', 'dans', 'département', 'filliale', 'service'): 'Équipe & Organisation',
-        ('qui dans', 'qui est dans', 'membre'): 'Recherche Équipe',
-        
-        # Personal info
-        ('qui je suis', 'mes infos', 'mon profil', 'mes données'): 'Mon Profil',
-        
-        # Leave/vacation
-        ('congés', 'vacances', 'repos', 'arrêt'): 'Congés & Absences',
-        
-        # Contact/directory
-        ('contact', 'email', 'mail', 'téléphone', 'adresse'): 'Contacts',
-        ('qui est', 'infos sur', 'recherche'): 'Annuaire',
-        
-        # HR policies
-        ('politique', 'règlement', 'procédure'): 'Politiques RH',
-        ('salaire', 'paie', 'rémunération'): 'Rémunération',
-        
-        # Management
-        ('manager', 'responsable', 'chef', 'hiérarchie'): 'Management',
-        ('statistiques', 'stats', 'nombre', 'combien'): 'Statistiques',
-        
-        # Training/development
-        ('formation', 'training', 'développement'): 'Formation',
-        
-        # General help
-        ('aide', 'help', 'comment', 'que faire'): 'Assistance',
-    }
-    
-    # Check patterns and return appropriate title
-    for keywords, title in title_patterns.items():
-        if any(keyword in message_lower for keyword in keywords):
-            return title
+    title = message_intent(user_message)
+    if title:
+        return title
     
     # Fallback: extract main subject or use generic title
     words = user_message.strip().split()
@@ -123,74 +151,185 @@ def webcam_view(request):
     return render(request, 'users/webcam.html')
 
 
+def serialize_chat(chat_id, title, last_message, created_at, updated_at):
+    """Build the JSON representation of a chat used by the chat list API"""
+    return {
+        'id': chat_id,
+        'title': title,
+        'lastMessage': message_preview(last_message) if last_message is not None else "Start a conversation...",
+        'created_at': created_at.isoformat(),
+        'updated_at': updated_at.isoformat(),
+    }
+
+
 # API Views
 @login_required
 @require_http_methods(["GET"])
+@query_budget(max_queries=2)
 def get_chats(request):
-    """Get all chats for the current user"""
-    chats = Chat.objects.filter(user=request.user)
-    chat_data = []
-    
-    for chat in chats:
-        chat_data.append({
-            'id': chat.id,
-            'title': chat.title,
-            'lastMessage': chat.last_message,
-            'created_at': chat.created_at.isoformat(),
-            'updated_at': chat.updated_at.isoformat(),
-        })
-    
-    return JsonResponse({'chats': chat_data})
+    """
+    Get a page of the current user's chats, most recently updated first.
+
+    Pass the 'next_cursor' of a response as ?cursor= to fetch the following
+    page; 'limit' sets the page size (default 30, max 100).
+    """
+    try:
+        cursor = decode_cursor(request.GET.get('cursor'))
+        limit = parse_limit(request.GET.get('limit'), CHATS_PAGE_SIZE, CHATS_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid pagination parameters'}, status=400)
+
+    # Only the first characters of the last message are needed for the preview
+    last_message = Message.objects.filter(chat=OuterRef('pk')).order_by('-created_at', '-id').annotate(
+        head=Substr('content', 1, 51)
+    ).values('head')[:1]
+    chats = Chat.objects.filter(user=request.user, deleted_at=None).annotate(
+        last_message=Subquery(last_message)
+    ).values('id', 'title', 'last_message', 'created_at', 'updated_at')
+
+    rows, has_more = keyset_page(chats, 'updated_at', cursor, limit, descending=True)
+    chat_data = [
+        serialize_chat(row['id'], row['title'], row['last_message'], row['created_at'], row['updated_at'])
+        for row in rows
+    ]
+    next_cursor = encode_cursor(rows[-1]['updated_at'], rows[-1]['id']) if rows and has_more else None
+
+    return JsonResponse({'chats': chat_data, 'has_more': has_more, 'next_cursor': next_cursor})
 
 
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
+@query_budget(max_queries=2)
 def create_chat(request):
     """Create a new chat"""
     chat = Chat.objects.create(user=request.user)
     
-    return JsonResponse({
-        'id': chat.id,
-        'title': chat.title,
-        'lastMessage': chat.last_message,
-        'created_at': chat.created_at.isoformat(),
-        'updated_at': chat.updated_at.isoformat(),
-    })
+    return JsonResponse(serialize_chat(chat.id, chat.title, None, chat.created_at, chat.updated_at))
 
 
 @login_required
 @csrf_exempt
 @require_http_methods(["DELETE"])
+@query_budget(max_queries=3)
 def delete_chat(request, chat_id):
-    """Delete a chat"""
-    chat = get_object_or_404(Chat, id=chat_id, user=request.user)
-    chat.delete()
+    """Delete a chat: hidden right away, its rows are purged in the background"""
+    deleted = Chat.objects.filter(id=chat_id, user=request.user, deleted_at=None).update(deleted_at=timezone.now())
+    if not deleted:
+        return JsonResponse({'error': 'Chat not found'}, status=404)
+    transaction.on_commit(schedule_purge)
     return JsonResponse({'success': True})
 
 
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+@query_budget(max_queries=3)
+def delete_chats(request):
+    """
+    Delete several chats of the current user at once.
+
+    JSON body: {"ids": [1, 2, ...]} or {"all": true} for every chat.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    chats = Chat.objects.filter(user=request.user, deleted_at=None)
+    if data.get('all') is not True:
+        ids = data.get('ids')
+        if not isinstance(ids, list) or not all(isinstance(chat_id, int) for chat_id in ids):
+            return JsonResponse({'error': "Expected a list of chat ids or 'all'"}, status=400)
+        chats = chats.filter(id__in=ids)
+
+    deleted = chats.update(deleted_at=timezone.now())
+    if deleted:
+        transaction.on_commit(schedule_purge)
+    return JsonResponse({'success': True, 'deleted': deleted})
+
+
+def serialize_message(message_id, sender, content, created_at):
+    """Build the JSON representation of a message used by the chat API"""
+    return {
+        'id': message_id,
+        'sender': sender,
+        'text': content,
+        'timestamp': created_at.strftime('%H:%M'),
+        'cursor': encode_cursor(created_at, message_id),
+    }
+
+
 @login_required
 @require_http_methods(["GET"])
+@query_budget(max_queries=3)
 def get_messages(request, chat_id):
-    """Get all messages for a specific chat"""
-    chat = get_object_or_404(Chat, id=chat_id, user=request.user)
-    messages = chat.messages.all()
-    
-    message_data = []
-    for message in messages:
-        message_data.append({
-            'id': message.id,
-            'sender': message.sender,
-            'text': message.content,
-            'timestamp': message.created_at.strftime('%H:%M'),
-        })
-    
-    return JsonResponse({'messages': message_data})
+    """
+    Get a page of messages for a specific chat, oldest first.
+
+    Query parameters:
+    - (none): the newest page of the chat
+    - before=<cursor>: the page of messages older than the cursor
+    - after=<cursor>: the page of messages newer than the cursor
+    - since=<cursor>: incremental refresh, everything newer than the cursor
+    - limit: page size (default 50, max 200)
+
+    'has_more' tells whether more messages exist past the page in the
+    direction that was requested (older for the first two, newer otherwise).
+    """
+    chat = get_object_or_404(Chat, id=chat_id, user=request.user, deleted_at=None)
+
+    try:
+        before = decode_cursor(request.GET.get('before'))
+        after = decode_cursor(request.GET.get('after'))
+        since = decode_cursor(request.GET.get('since'))
+        limit = parse_limit(request.GET.get('limit'), MESSAGES_PAGE_SIZE, MESSAGES_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid pagination parameters'}, status=400)
+
+    messages = Message.objects.filter(chat=chat).values('id', 'sender', 'content', 'created_at')
+
+    # Older messages of idle chats may have been moved to the archive
+    if since:
+        rows, has_more = history_page(chat, messages, since, MESSAGES_MAX_PAGE_SIZE, descending=False)
+    elif after:
+        rows, has_more = history_page(chat, messages, after, limit, descending=False)
+    else:
+        rows, has_more = history_page(chat, messages, before, limit, descending=True)
+        rows.reverse()
+
+    message_data = [
+        serialize_message(row['id'], row['sender'], row['content'], row['created_at'])
+        for row in rows
+    ]
+
+    return JsonResponse({'messages': message_data, 'has_more': has_more})
+
+
+@login_required
+@require_http_methods(["GET"])
+@query_budget(max_queries=4)
+def search_chats(request):
+    """
+    Full-text search in the current user's messages, best matches first.
+
+    Query parameters:
+    - q: words to search for (the last one also matches as a prefix)
+    - limit: number of results (default 20, max 50)
+    """
+    try:
+        limit = parse_limit(request.GET.get('limit'), SEARCH_RESULTS, SEARCH_MAX_RESULTS)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+    results = search_messages(request.user, request.GET.get('q', ''), limit)
+    return JsonResponse({'results': results})
 
 
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
+@traced('send_message')
+@query_budget(max_queries=16)
 def send_message(request, chat_id):
     """Send a message and get AI response"""
     try:
@@ -200,120 +339,241 @@ def send_message(request, chat_id):
         if not user_message:
             return JsonResponse({'error': 'Message cannot be empty'}, status=400)
         
-        chat = get_object_or_404(Chat, id=chat_id, user=request.user)
-        
-        # Create user message
-        user_msg = Message.objects.create(
-            chat=chat,
-            sender='user',
-            content=user_message
+        chat = get_object_or_404(Chat, id=chat_id, user=request.user, deleted_at=None)
+        is_first_message = chat.message_count == 0
+        current_span().set(
+            chat_id=chat.id, first_message=is_first_message, prompt_bytes=len(user_message.encode('utf-8'))
         )
         
-        # Update chat title if it's the first message
-        if chat.messages.count() == 1:
-            # Generate a simple, well-written title using AI
-            chat.title = generate_chat_title(user_message)
-            chat.save()
+        # Create user message (committed before the slow AI call)
+        with span('send_message.save_user_message'):
+            user_msg = chat.add_user_message(user_message)
         
         # Get AI response from Azure with user context
-        ai_response = get_ai_response(user_message, request.user)
-        
-        # Create AI message
-        ai_msg = Message.objects.create(
-            chat=chat,
-            sender='ai',
-            content=ai_response
-        )
+        ai_response = get_ai_response(user_message, request.user, chat)
         
-        # Update chat timestamp
-        chat.save()  # This updates the updated_at field
+        # Create AI message and update title, timestamp and counter in one transaction
+        with span('send_message.save_ai_reply'):
+            title = generate_chat_title(user_message) if is_first_message else None
+            ai_msg = chat.add_ai_reply(ai_response, title=title)
+        current_span().set(response_bytes=len(ai_response.encode('utf-8')))
         
         return JsonResponse({
-            'user_message': {
-                'id': user_msg.id,
-                'sender': 'user',
-                'text': user_msg.content,
-                'timestamp': user_msg.created_at.strftime('%H:%M'),
-            },
-            'ai_message': {
-                'id': ai_msg.id,
-                'sender': 'ai',
-                'text': ai_msg.content,
-                'timestamp': ai_msg.created_at.strftime('%H:%M'),
-            }
+            'user_message': serialize_message(user_msg.id, 'user', user_msg.content, user_msg.created_at),
+            'ai_message': serialize_message(ai_msg.id, 'ai', ai_msg.content, ai_msg.created_at),
+            'chat': serialize_chat(chat.id, chat.title, ai_msg.content, chat.created_at, chat.updated_at),
         })
         
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
     except Exception as e:
         logger.error(f"Error in send_message: {str(e)}")
+        current_span().set(error=type(e).__name__)
         return JsonResponse({'error': 'Internal server error'}, status=500)
 
 
-def get_ai_response(user_message, user=None):
+def is_hr_admin(user):
+    """Staff members and users with the admin role"""
+    return user.is_staff or user.role == 'admin'
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """Metrics of all worker processes in the Prometheus text format"""
+    authorization = request.headers.get('Authorization', '')
+    token = settings.METRICS_TOKEN
+    scraper = bool(token) and hmac.compare_digest(authorization, f'Bearer {token}')
+    if not scraper and not (request.user.is_authenticated and is_hr_admin(request.user)):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_http_methods(["GET", "HEAD"])
+def healthz_view(request):
+    """Liveness: the process answers, nothing else is checked"""
+    return JsonResponse({'status': 'ok'})
+
+
+@require_http_methods(["GET", "HEAD"])
+def readyz_view(request):
+    """Readiness: the worker is warmed up (WARMUP_ON_START) and the database answers"""
+    ready, details = readiness()
+    return JsonResponse({'status': 'ready' if ready else 'warming_up', **details}, status=200 if ready else 503)
+
+
+def can_view_org_subtree(requesting_user, target_employee):
     """
-    Get AI response from Azure AI agent with user context
+    The org subtree of an employee is visible to those with full access to
+    the employee (can_access_employee_data), to every manager above them
+    and to administrators
+    """
+    if is_hr_admin(requesting_user):
+        return True
+    if can_access_employee_data(requesting_user, target_employee) is True:
+        return True
+    return bool(requesting_user.org_path) and target_employee.org_path.startswith(requesting_user.org_path)
+
+
+@login_required
+@require_http_methods(["GET"])
+@query_budget(max_queries=3)
+def get_org_subtree(request, employee_id=None):
+    """
+    Org chart under an employee (the current user by default).
+
+    Query parameters:
+    - depth: number of levels of reports to include (default: all)
+    """
+    employee_id = employee_id or request.user.employee_id
+    target = get_object_or_404(CustomUser, employee_id=employee_id, is_active=True)
+    if not can_view_org_subtree(request.user, target):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    try:
+        depth = request.GET.get('depth')
+        depth = int(depth) if depth else None
+        if depth is not None and depth < 0:
+            raise ValueError(depth)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid depth'}, status=400)
+
+    chart = get_org_chart()
+    if employee_id not in chart:
+        return JsonResponse({'error': 'Employee not found'}, status=404)
+
+    # The subtree is spliced in already encoded: serializing a large org takes longer than building it
+    data = {'depth': depth}
+    if is_hr_admin(request.user):
+        data['issues'] = {'cycles': chart.cycles, 'orphans': chart.orphans}
+    body = f'{{"root":{chart.subtree_json(employee_id, depth)},{json.dumps(data)[1:]}'
+    return HttpResponse(body, content_type='application/json')
+
+
+@login_required
+@require_http_methods(["GET"])
+def export_data(request, kind):
+    """
+    Download an export (directory, chats or messages), administrators only.
+
+    Query parameters:
+    - format: csv (default) or jsonl
+    - gzip=1: gzip-compressed file
+    """
+    if not is_hr_admin(request.user):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    fmt = request.GET.get('format', 'csv')
+    if kind not in EXPORTS or fmt not in FORMATS:
+        return JsonResponse({'error': 'Unknown export'}, status=400)
+    compress = request.GET.get('gzip') == '1'
+
+    if compress:
+        content_type = 'application/gzip'
+    elif fmt == 'csv':
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        content_type = 'application/x-ndjson; charset=utf-8'
+    response = StreamingHttpResponse(export_stream(kind, fmt, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(kind, fmt, compress)}"'
+    return response
+
+
+@traced('get_ai_response')
+def get_ai_response(user_message, user=None, chat=None):
+    """
+    Get AI response from Azure AI agent with user context.
+    The token usage of the run is recorded for ``user`` and ``chat``.
     """
     # Check if Azure is available and configured
-    if not AZURE_AVAILABLE:
+    if not AZURE_AVAILABLE or not settings.AZURE_AI_ENABLED:
         logger.info("Azure AI not available, using fallback response")
-        return get_fallback_response(user_message, user)
+        return traced_fallback_response('azure_disabled', user_message, user)
     
+    start = time.perf_counter()
+    outcome = 'error'
     try:
-        # Initialize Azure AI client with Managed Identity for production
-        try:
-            from azure.identity import ManagedIdentityCredential
-            # Try Managed Identity first (for Azure App Service)
-            credential = ManagedIdentityCredential()
-        except Exception:
-            # Fallback to DefaultAzureCredential for local development
-            credential = DefaultAzureCredential()
-            
-        project = AIProjectClient(
-            credential=credential,
-            endpoint=settings.AZURE_AI_ENDPOINT
-        )
+        # Azure AI client of the process, created with Managed Identity by the first message
+        with span('azure.credential'):
+            project = get_project_client()
         
-        # Get the agent
-        agent = project.agents.get_agent(settings.AZURE_AI_AGENT_ID)
+        # Get the agent (fetched by the first message only, which also acquires the access token)
+        with span('azure.get_agent'):
+            agent = get_agent(project)
         
         # Get the thread
-        thread = project.agents.threads.get(settings.AZURE_AI_THREAD_ID)
+        with span('azure.threads.get'):
+            thread = project.agents.threads.get(settings.AZURE_AI_THREAD_ID)
         
         # Create enhanced message with user context
-        enhanced_message = create_enhanced_message(user_message, user)
-        message = project.agents.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=enhanced_message
-        )
+        with span('create_enhanced_message') as stage:
+            enhanced_message = create_enhanced_message(user_message, user)
+            stage.set(prompt_bytes=len(enhanced_message.encode('utf-8')))
+        with span('azure.messages.create'):
+            message = project.agents.messages.create(
+                thread_id=thread.id,
+                role="user",
+                content=enhanced_message
+            )
         
         # Create and process run
-        run = project.agents.runs.create_and_process(
-            thread_id=thread.id,
-            agent_id=agent.id
+        with span('azure.run') as stage:
+            run_start = time.perf_counter()
+            run = project.agents.runs.create_and_process(
+                thread_id=thread.id,
+                agent_id=agent.id,
+                polling_interval=settings.AZURE_AI_POLLING_INTERVAL
+            )
+            run_duration = time.perf_counter() - run_start
+            # RunStatus is a str enum, str() would give "RunStatus.COMPLETED"
+            run_status = getattr(run.status, 'value', run.status)
+            stage.set(run_status=run_status)
+        
+        usage = getattr(run, 'usage', None)
+        record_usage(
+            user=user if user is not None and user.pk else None,
+            chat=chat,
+            model=str(getattr(run, 'model', None) or '')[:64],
+            run_status=str(run_status)[:16],
+            intent=message_intent(user_message) or '',
+            prompt_tokens=getattr(usage, 'prompt_tokens', None) or 0,
+            completion_tokens=getattr(usage, 'completion_tokens', None) or 0,
+            duration_ms=round(run_duration * 1000),
+            **prompt_sections(enhanced_message),
         )
         
         if run.status == "failed":
+            outcome = 'failed'
             logger.error(f"Azure AI run failed: {run.last_error}")
-            return get_fallback_response(user_message)
+            return traced_fallback_response('run_failed', user_message, user)
         
         # Get the last AI response using the specialized method
-        last_message = project.agents.messages.get_last_message_by_role(
-            thread_id=thread.id,
-            role=MessageRole.AGENT
-        )
+        with span('azure.get_last_message_by_role'):
+            last_message = project.agents.messages.get_last_message_by_role(
+                thread_id=thread.id,
+                role=sdk().MessageRole.AGENT
+            )
         
         if last_message and hasattr(last_message, 'text_messages') and last_message.text_messages:
+            outcome = 'ok'
             raw_response = last_message.text_messages[-1].text.value
             # Post-process the response to fix formatting issues
-            return fix_ai_response_formatting(raw_response, user)
+            with span('fix_ai_response_formatting', response_bytes=len(raw_response.encode('utf-8'))):
+                return fix_ai_response_formatting(raw_response, user)
         
-        return get_fallback_response(user_message, user)
+        outcome = 'empty'
+        return traced_fallback_response('empty_response', user_message, user)
         
     except Exception as e:
         logger.error(f"Error getting AI response: {str(e)}")
         # Fallback to simulated response if Azure fails
+        return traced_fallback_response(f'error:{type(e).__name__}', user_message, user)
+    finally:
+        observe('hrbot_azure_ai_duration_seconds', (outcome,), time.perf_counter() - start)
+
+
+def traced_fallback_response(reason, user_message, user=None):
+    """get_fallback_response() in its own span, with the reason recorded on the AI pipeline span"""
+    current_span().set(fallback_reason=reason)
+    with span('get_fallback_response', fallback_reason=reason):
         return get_fallback_response(user_message, user)
 
 
@@ -443,6 +703,20 @@ def fix_ai_response_formatting(response_text, user=None):
     return response_text
 
 
+def can_access_employee_data(requesting_user, target_employee):
+    """
+    Full access (True) to one's own data and to direct reports for managers,
+    public directory access ("directory") otherwise
+    """
+    if not requesting_user:
+        return False
+    if requesting_user.id == target_employee.id:
+        return True
+    if requesting_user.is_manager and target_employee.responsable_id == requesting_user.employee_id:
+        return True
+    return "directory"
+
+
 def create_enhanced_message(user_message, user):
     """
     Create an enhanced message with user context and accessible employee data for Azure AI
@@ -454,16 +728,6 @@ def create_enhanced_message(user_message, user):
     from .models import CustomUser
     from datetime import datetime
     
-    # Function to check data access permissions
-    def can_access_employee_data(requesting_user, target_employee):
-        if not requesting_user:
-            return False
-        if requesting_user.id == target_employee.id:
-            return True
-        if requesting_user.is_manager and target_employee.responsable == requesting_user.employee_id:
-            return True
-        return "directory"
-    
     # Function to get employee data based on access level
     def get_employee_data_for_ai(employee, access_level="full"):
         base_data = {
@@ -539,21 +803,22 @@ def create_enhanced_message(user_message, user):
         context_parts.append(f"Régime de santé: {user.regime_sante}")
     
     # Manager info
-    if user.responsable:
-        try:
-            manager = CustomUser.objects.get(employee_id=user.responsable)
-            context_parts.append(f"Manager: {manager.first_name} {manager.last_name} - {manager.poste} - {manager.email}")
-        except CustomUser.DoesNotExist:
-            pass
+    if user.responsable_id:
+        manager = user.responsable
+        context_parts.append(f"Manager: {manager.first_name} {manager.last_name} - {manager.poste} - {manager.email}")
+        chain = user.get_manager_chain()
+        if len(chain) > 1:
+            context_parts.append("Chaîne hiérarchique: " + " > ".join(f"{m.first_name} {m.last_name}" for m in chain))
     
     # Team members info if user is a manager
     if user.is_manager:
-        team_members = CustomUser.objects.filter(responsable=user.employee_id)
-        if team_members.exists():
-            context_parts.append(f"Équipe sous responsabilité ({team_members.count()} personnes):")
+        team_members = list(user.get_team())
+        if team_members:
+            context_parts.append(f"Équipe sous responsabilité ({len(team_members)} personnes):")
             for member in team_members:
                 member_data = get_employee_data_for_ai(member, True)
                 context_parts.append(f"  - {member_data['prenom']} {member_data['nom']} ({member_data['id']}) - {member_data['poste']}")
+            context_parts.append(f"Effectif total sous responsabilité (équipes indirectes comprises): {user.get_all_reports().count()} personnes")
     
     # Available employee directory data
     context_parts.append("\nAnnuaire des employés disponible:")
@@ -631,13 +896,43 @@ Répondez de manière professionnelle et précise en tant qu'assistant RH en res
     return enhanced_message
 
 
+def find_similar_user(search_term):
+    """Find user with fuzzy matching on name, employee_id, or position"""
+    best_match = None
+    best_score = 0.0
+    
+    for u in CustomUser.objects.all():
+        # Check employee_id
+        if u.employee_id:
+            score = SequenceMatcher(None, search_term.lower(), u.employee_id.lower()).ratio()
+            if score > best_score and score > 0.6:
+                best_match = u
+                best_score = score
+        
+        # Check full name
+        if u.first_name and u.last_name:
+            full_name = f"{u.first_name} {u.last_name}".lower()
+            score = SequenceMatcher(None, search_term.lower(), full_name).ratio()
+            if score > best_score and score > 0.6:
+                best_match = u
+                best_score = score
+        
+        # Check position
+        if u.poste:
+            score = SequenceMatcher(None, search_term.lower(), u.poste.lower()).ratio()
+            if score > best_score and score > 0.7:
+                best_match = u
+                best_score = score
+    
+    return best_match, best_score
+
+
 def get_fallback_response(user_message, user=None):
     """
     Enhanced HR assistant with precise, documented responses tailored to HR needs
     Implements role-based access control for data security
     """
     from .models import CustomUser
-    from difflib import SequenceMatcher
     from django.db import models
     from datetime import datetime
     
@@ -669,37 +964,6 @@ def get_fallback_response(user_message, user=None):
         response += f"\nTotal : {len(employees)} personne(s)"
         return response
     
-    # Function for fuzzy matching
-    def find_similar_user(search_term):
-        """Find user with fuzzy matching on name, employee_id, or position"""
-        best_match = None
-        best_score = 0.0
-        
-        for u in CustomUser.objects.all():
-            # Check employee_id
-            if u.employee_id:
-                score = SequenceMatcher(None, search_term.lower(), u.employee_id.lower()).ratio()
-                if score > best_score and score > 0.6:
-                    best_match = u
-                    best_score = score
-            
-            # Check full name
-            if u.first_name and u.last_name:
-                full_name = f"{u.first_name} {u.last_name}".lower()
-                score = SequenceMatcher(None, search_term.lower(), full_name).ratio()
-                if score > best_score and score > 0.6:
-                    best_match = u
-                    best_score = score
-            
-            # Check position
-            if u.poste:
-                score = SequenceMatcher(None, search_term.lower(), u.poste.lower()).ratio()
-                if score > best_score and score > 0.7:
-                    best_match = u
-                    best_score = score
-        
-        return best_match, best_score
-    
     # Enhanced pattern matching with fuzzy search
     
     # Complete personal information - detect comprehensive requests
@@ -905,21 +1169,18 @@ def get_fallback_response(user_message, user=None):
         if user:
             if user.is_manager:
                 # Find team members
-                team_members = CustomUser.objects.filter(responsable=user.employee_id)
+                team_members = list(user.get_team())
                 response = f"{greeting}! Vous êtes manager. "
-                if team_members.exists():
-                    response += f"Votre équipe compte {team_members.count()} personnes :\n"
+                if team_members:
+                    response += f"Votre équipe compte {len(team_members)} personnes :\n"
                     for member in team_members:
                         response += f"• {member.first_name} {member.last_name} - {member.poste}\n"
                 else:
                     response += "Aucune personne n'est actuellement sous votre responsabilité."
                 return response
-            elif user.responsable:
-                try:
-                    manager = CustomUser.objects.get(employee_id=user.responsable)
-                    return f"{greeting}! Votre manager est {manager.first_name} {manager.last_name} ({manager.email})."
-                except CustomUser.DoesNotExist:
-                    return f"{greeting}! Les informations sur votre manager ne sont pas disponibles."
+            elif user.responsable_id:
+                manager = user.responsable
+                return f"{greeting}! Votre manager est {manager.first_name} {manager.last_name} ({manager.email})."
             else:
                 return f"{greeting}! Vous n'avez pas de manager assigné selon nos données."
         return f"{greeting}! Connectez-vous pour connaître vos informations hiérarchiques."
@@ -1010,14 +1271,8 @@ def get_complete_user_info(user):
     if not user or not user.is_authenticated:
         return None
     
-    from .models import CustomUser
-    
-    # Refresh user data from database to ensure we have the latest info
-    try:
-        user = CustomUser.objects.get(id=user.id)
-    except CustomUser.DoesNotExist:
-        return None
-    
+    # request.user is loaded from the database at the start of each request,
+    # so it already holds the latest data
     user_info = {
         'basic': {
             'id': user.employee_id or str(user.id),
@@ -1049,28 +1304,24 @@ def get_complete_user_info(user):
             'regime_sante': user.regime_sante,
         },
         'hierarchy': {
-            'responsable': user.responsable,
+            'responsable': user.responsable_id,
             'manager_info': None,
             'team_members': []
         }
     }
     
     # Get manager information
-    if user.responsable:
-        try:
-            manager = CustomUser.objects.get(employee_id=user.responsable)
-            user_info['hierarchy']['manager_info'] = {
-                'name': f"{manager.first_name} {manager.last_name}",
-                'email': manager.email,
-                'poste': manager.poste
-            }
-        except CustomUser.DoesNotExist:
-            pass
+    if user.responsable_id:
+        manager = user.responsable
+        user_info['hierarchy']['manager_info'] = {
+            'name': f"{manager.first_name} {manager.last_name}",
+            'email': manager.email,
+            'poste': manager.poste
+        }
     
     # Get team members if user is a manager
     if user.is_manager:
-        team_members = CustomUser.objects.filter(responsable=user.employee_id)
-        for member in team_members:
+        for member in user.get_team():
             user_info['hierarchy']['team_members'].append({
                 'name': f"{member.first_name} {member.last_name}",
                 'employee_id': member.employee_id,
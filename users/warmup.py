@@ -0,0 +1,106 @@
+"""
+Worker warm-up and readiness, for /healthz and /readyz.
+
+With WARMUP_ON_START, config/wsgi.py starts warm_up() in a background
+thread as soon as a worker has loaded the application: it loads the URL
+configuration and views, opens the database connection, builds the org
+chart and its whole-company subtree, and with Azure AI enabled creates the
+project client, which acquires the access token, and resolves the agent.
+/readyz answers 503 until it has finished, so that App Service only routes
+traffic to warm instances; /healthz only tells that the process answers.
+
+An Azure failure does not keep the worker out of rotation (the fallback
+assistant still answers), it is reported by /readyz.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_state = {'started': False, 'finished': False, 'stages': {}, 'errors': {}}
+_lock = threading.Lock()
+
+
+def warm_up_urls():
+    from django.urls import get_resolver
+    # Resolving the URL patterns imports every view module
+    get_resolver().url_patterns
+
+
+def warm_up_database():
+    connection.ensure_connection()
+
+
+def warm_up_org_chart():
+    from .orgchart import get_org_chart
+    chart = get_org_chart()
+    for root in chart.roots:
+        chart.subtree_json(root, None)
+
+
+def warm_up_azure():
+    from .azure_ai import azure_installed, get_agent, get_project_client
+    if not settings.AZURE_AI_ENABLED or not azure_installed():
+        return
+    get_agent(get_project_client())
+
+
+# (name, function, required): a failed required stage keeps the worker out of rotation
+STAGES = [
+    ('urls', warm_up_urls, True),
+    ('database', warm_up_database, True),
+    ('org_chart', warm_up_org_chart, True),
+    ('azure', warm_up_azure, False),
+]
+
+
+def warm_up():
+    """Run the warm-up stages, return {stage: seconds}"""
+    with _lock:
+        if _state['started']:
+            return dict(_state['stages'])
+        _state['started'] = True
+    for name, function, _ in STAGES:
+        start = time.perf_counter()
+        try:
+            function()
+        except Exception as e:
+            logger.error(f"Warm-up stage {name} failed: {e}")
+            _state['errors'][name] = f"{type(e).__name__}: {e}"
+        _state['stages'][name] = time.perf_counter() - start
+    _state['finished'] = True
+    # The connection of the warm-up thread is not reused by the request threads
+    connection.close()
+    logger.info("Worker warmed up in %.2fs: %s", sum(_state['stages'].values()), _state['stages'])
+    return dict(_state['stages'])
+
+
+def start_warm_up():
+    """warm_up() in a background thread, the worker keeps serving /healthz meanwhile"""
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+
+def readiness():
+    """(ready, details): warmed up if WARMUP_ON_START, and the database answers"""
+    details = {'warm_up': None}
+    ready = True
+    if settings.WARMUP_ON_START:
+        details['warm_up'] = {
+            'finished': _state['finished'],
+            'stages_ms': {name: round(seconds * 1000) for name, seconds in _state['stages'].items()},
+            'errors': dict(_state['errors']),
+        }
+        required = {name for name, _, is_required in STAGES if is_required}
+        ready = _state['finished'] and not required & set(_state['errors'])
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        details['database'] = 'ok'
+    except Exception as e:
+        details['database'] = f"{type(e).__name__}: {e}"
+        ready = False
+    return ready, details